@@ -1,24 +1,125 @@
 """ AOY-TK module. Provides functions and forms to simplify web-archive analysis. 
 """
 # AOY-TK Module
-import ipywidgets as widgets 
-import requests
+# Only the analysis dependencies are imported here, so that the module can be used headless 
+# (ex. in batch jobs and worker processes) and starts quickly. The widgets, plotting and download 
+# libraries are imported by the functions that use them.
 import os
 import pandas as pd
-import matplotlib.pyplot as plt
+from pandas.api.types import union_categoricals
 import numpy as np 
 import re
-from google.colab import drive
-from IPython.display import clear_output
+import time
+import contextlib
+from html.parser import HTMLParser
 
 # Global path variable -- a default for Google Drive usage
-path = "/content/drive/MyDrive/AOY/" # default path, can be overwritten by the path-setter widget
+DRIVE_FOLDER = "/content/drive/MyDrive/AOY/"
+path = DRIVE_FOLDER # default path, can be overwritten by the path-setter widget
+
+# Number of rows to read at a time when loading a derivative in chunks
+CHUNKSIZE = 100000
+# The columns needed by the collection views (top domains, crawl frequency)
+COLLECTION_COLUMNS = ["crawl_date", "domain", "url"]
+# The columns that set_data() can filter rows on
+FILTER_COLUMNS = ["crawl_date", "domain"]
+# File endings of the supported derivative formats
+PARQUET_FILE_TYPES = (".parquet", ".pqt")
+ARROW_FILE_TYPES = (".arrow", ".feather", ".ipc")
+DERIVATIVE_FILE_TYPES = (".csv",) + PARQUET_FILE_TYPES + ARROW_FILE_TYPES
+# The crawl date layouts found in ARCH / AUT derivatives, as (format, regex) pairs
+CRAWL_DATE_FORMATS = [
+  ("%Y%m%d%H%M%S", r"^\d{14}$"), # 20230101120000
+  ("%Y%m%d", r"^\d{8}$"), # 20230101
+  ("%Y/%m/%d %H:%M:%S %z", r"^\d{4}/\d{2}/\d{2} \d{2}:\d{2}:\d{2} [+-]\d{4}$"), # written by generate_derivative()
+  ("ISO8601", r"^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}:?\d{2})?$"), # 2023-01-01T12:00:00Z
+]
+# Number of crawl dates to check when detecting the date layout
+DATE_SAMPLE_SIZE = 1000
+# The largest number of domains that can be selected for the crawl frequency graphs
+MAX_PLOT_DOMAINS = 200
+# The project sub folders that saved resources are organized in (see design_notes.md)
+RESOURCE_FOLDERS = ("text", "collection", "network", "file_formats")
+# The most memory (in bytes) used to keep resources in memory
+CACHE_MEMORY_SIZE = 1024 ** 3
+# How much of a derivative is read to compute its digest
+DIGEST_SAMPLES = 16
+DIGEST_BLOCK_SIZE = 64 * 1024
+# Digests of derivatives, by path, size and modification time
+source_digests = {}
+# Download settings: bytes per read / write, parallel byte ranges per file, files at once,
+# retries after a dropped connection and seconds to wait for the server
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_SEGMENTS = 4
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_TIMEOUT = 60
+# The Spark session shared by all DerivativeGenerators (see get_spark_session())
+spark_session = None
+# Text preprocessing for topic modelling (see Analyzer.preprocess_text()): the spaCy model, 
+# the parts of speech whose lemmas are kept, and the documents per batch sent to spaCy's worker processes
+SPACY_MODEL = "en_core_web_md"
+ALLOWED_POSTAGS = ("ADJ", "ADP", "ADV", "AUX", "CONJ", "CCONJ", "DET", "INTJ", "NOUN", "PRON", "SCONJ", "VERB")
+NLP_BATCH_SIZE = 1000
+# LDA training defaults (see Analyzer.train_topic_model()), as used in the topic modelling notebook
+LDA_PASSES = 10
+LDA_ITERATIONS = 200
+LDA_CHUNKSIZE = 2000
+LDA_RANDOM_STATE = 100
+# Word vector algorithms (see train_word_vectors()), and the abbreviations used in model file names
+WORD_VECTOR_ALGORITHMS = ("word2vec", "fasttext")
+MODEL_NAME_ABBREVIATIONS = (("fasttext", "ft"), ("word2vec", "w2v"), ("vector_size", "vs"), ("window", "wn"))
+# Near-duplicate detection (see Analyzer.find_duplicates()): the MinHash signature length, the LSH bands 
+# it is split into, the words per shingle, the estimated Jaccard similarity from which pages are 
+# near-duplicates, the documents per batch sent to a worker process, and the size up to which all 
+# the pages of an LSH bucket are compared with each other (see bucket_pairs())
+MINHASH_PERMUTATIONS = 128
+MINHASH_BANDS = 16
+SHINGLE_SIZE = 5
+DUPLICATE_THRESHOLD = 0.8
+DUPLICATE_BATCH_SIZE = 5000
+DUPLICATE_MAX_BUCKET = 50
+# Directory listings used by get_files(), {directory: (mtime, {file name: size}, [sub-directories])}, 
+# and the folders left out of the listings (besides hidden ones), ex. Spark's temporary output folders
+file_index = {}
+SKIPPED_FOLDERS = ("__pycache__", "_temporary", "_run")
+# Bytes per read / write when copying files that can't be copied with copy_file_range / sendfile
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+# The columns of a text derivative, and the rows per batch written by the Python derivative backend
+DERIVATIVE_COLUMNS = ["crawl_date", "domain", "url", "content"]
+DERIVATIVE_BATCH_SIZE = 1000
+# Instrumentation of toolkit operations (see set_instrumentation()): None (off), "timing" or "profile", 
+# the file to append a JSON line per operation to, and the records of the operations run so far
+INSTRUMENTATION = None
+INSTRUMENTATION_LOG_FILE = None
+PROFILE_LINES = 25
+instrumentation_log = []
+active_operation = None
+# Web page MIME types and extensions included in a text derivative (as with the AUT's webpages())
+WEBPAGE_MIME_TYPES = ("text/html", "application/xhtml+xml")
+WEBPAGE_EXTENSIONS = (".htm", ".html")
+# The columns of a domain graph derivative (links between domains per day, see generate_link_graph()), 
+# and the names ARCH gives them in its domain-graph.csv
+GRAPH_COLUMNS = ["crawl_date", "src_domain", "dest_domain", "count"]
+ARCH_GRAPH_COLUMNS = {"source": "src_domain", "target": "dest_domain"}
+# PageRank settings (see LinkGraph.pagerank()): the damping factor, the convergence tolerance (of the 
+# sum of the changes of the ranks) and the maximum number of iterations
+PAGERANK_DAMPING = 0.85
+PAGERANK_TOLERANCE = 1e-6
+PAGERANK_ITERATIONS = 100
+# Full-text index settings (see TextIndex): the documents per index segment, the longest words indexed 
+# (in UTF-8 bytes), and the pattern of the words
+INDEX_SEGMENT_SIZE = 20000
+MAX_TERM_BYTES = 32
+TOKEN_PATTERN = r"\w+"
 
 # General purpose functions.
 def display_path_select(): 
     """Displays a text box to set the default path for reading / writing data
     """
-    txt_path = widgets.Text(description="Folder path:", placeholder = "Enter your folder path", value = "/content/drive/MyDrive/AOY/")
+    import ipywidgets as widgets
+    from IPython.display import display
+    txt_path = widgets.Text(description="Folder path:", placeholder = "Enter your folder path", value = DRIVE_FOLDER)
     def btn_set_path(btn): 
         global path
         if txt_path.value == "": 
@@ -31,6 +132,71 @@ def display_path_select():
     display(txt_path)
     display(btn_txt_submit)
 
+def scan_directory(directory): 
+  """List the files and sub-directories of a directory, reusing the last listing if the directory hasn't changed.
+
+    Listings are cached in file_index, keyed on the directory's modification time, which changes 
+    whenever a file is added to, removed from or renamed in the directory. (File sizes are as of 
+    the last such change.) Hidden files and folders, and the SKIPPED_FOLDERS, are left out.
+
+    Args: 
+      directory (str): the directory to list 
+
+    Returns: 
+      a dict of file names to sizes, and a sorted list of the sub-directory names
+  """
+  mtime = os.stat(directory).st_mtime_ns
+  cached = file_index.get(directory)
+  if cached is not None and cached[0] == mtime: 
+    return cached[1], cached[2]
+  files = {}
+  subdirs = []
+  with os.scandir(directory) as entries: 
+    for entry in entries: 
+      if entry.name.startswith("."): 
+        continue
+      try: 
+        if entry.is_dir(): 
+          if entry.name not in SKIPPED_FOLDERS: 
+            subdirs.append(entry.name)
+        else: 
+          files[entry.name] = entry.stat().st_size
+      except OSError: 
+        # ex. a broken link
+        continue
+  subdirs.sort()
+  file_index[directory] = (mtime, files, subdirs)
+  return files, subdirs
+
+def index_files(main_directory, file_types): 
+  """Recursively list files of given types, with their sizes, from directory + its subdirectories.
+
+    Only directories that changed since they were last listed are read again (see scan_directory()), 
+    so listing the same folder again is quick.
+
+    Args: 
+      main_directory (str): the root directory to look for files in 
+      file_types (tuple of str): file types to match on ex. (".csv", ".parquet", ".pqt")
+
+    Returns: 
+      a list of (file name, size in bytes, file type) tuples, with file names relative to 
+      main_directory (see get_files()) and the file type without the dot, ex. "csv"
+  """
+  matched_files = []
+  if not os.path.isdir(main_directory): 
+    return matched_files
+  folders = [(main_directory, "")]
+  while folders: 
+    directory, subfolder = folders.pop()
+    files, subdirs = scan_directory(directory)
+    for f in sorted(files): 
+      file_type = next((t for t in file_types if f.endswith(t)), None)
+      if file_type is not None: 
+        matched_files.append((subfolder + f, files[f], file_type.lstrip(".")))
+    # visit the sub-directories in order
+    folders.extend((os.path.join(directory, d), f"{subfolder}{d}/") for d in reversed(subdirs))
+  return matched_files
+
 def get_files(main_directory, file_types):
   """Recursively list files of given types from directory + its subdirectories.
 
@@ -45,21 +211,608 @@ def get_files(main_directory, file_types):
           a file in a sub directory will include the subdirectory name and 
           the file name. ex. "subdir/a.csv"
   """
-  matched_files = []
-  for dirpath, subdirs, files in os.walk(path):
-    subfolder = re.sub(path, "", dirpath)
-    datafiles = [f for f in files if f.endswith(file_types)]
-    for f in datafiles: 
-      if subfolder == "": 
-        matched_files.append(f)
+  return [f for f, size, file_type in index_files(main_directory, file_types)]
+
+def format_size(size): 
+  """Format a number of bytes for display, ex. 1536 -> "1.5 KB".
+  """
+  for unit in ("B", "KB", "MB", "GB"): 
+    if size < 1024: 
+      return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+    size /= 1024
+  return f"{size:.1f} TB"
+
+def file_choices(files): 
+  """Create (label, value) dropdown options from index_files() results, with the sizes and types in the labels.
+  """
+  return [(f"{f} ({file_type}, {format_size(size)})", f) for f, size, file_type in files]
+
+def reset_peak_memory(): 
+  """Reset the peak resident memory of this process to its current size, where Linux allows it.
+  """
+  try: 
+    with open("/proc/self/clear_refs", "w") as f: 
+      f.write("5")
+  except OSError: 
+    pass
+
+def peak_memory_mb(): 
+  """The peak resident memory of this process (since the last reset_peak_memory()), in MB.
+  """
+  try: 
+    with open("/proc/self/status") as f: 
+      for line in f: 
+        if line.startswith("VmHWM:"): 
+          return int(line.split()[1]) / 1024
+  except OSError: 
+    pass
+  import resource
+  import sys
+  # ru_maxrss is in KB on Linux, and bytes on macOS
+  return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024**2 if sys.platform == "darwin" else 1024)
+
+def set_instrumentation(mode = "timing", log_file = None): 
+  """Turn instrumentation of the toolkit's operations on or off.
+
+    With instrumentation on, each operation (ex. Analyzer.set_data(), or clicking "Create derivative") 
+    prints a table of its stages once it's done: how many times each ran, how long it took, the 
+    number of rows it returned and the peak memory of the process since the operation started 
+    (up to the end of the stage). Stage times include the stages they call, and "(self)" is the 
+    time spent in the operation outside of any stage. 
+
+    Args: 
+      mode (str): "timing" for the stage table, "profile" to also capture a cProfile listing and 
+        the top memory allocations (tracemalloc), which slows the operations down. None turns 
+        instrumentation off.
+      log_file (str): an optional path of a file to append a JSON record of each operation to.
+  """
+  global INSTRUMENTATION, INSTRUMENTATION_LOG_FILE
+  if mode not in (None, "timing", "profile"): 
+    raise ValueError(f"Unknown instrumentation mode {mode!r}, use 'timing', 'profile' or None.")
+  INSTRUMENTATION = mode
+  INSTRUMENTATION_LOG_FILE = log_file
+
+def instrumented(function): 
+  """Decorator for the toolkit's operations and their stages.
+
+    When instrumentation is on (see set_instrumentation()), the outermost instrumented call is 
+    recorded as an operation, and the instrumented calls it makes as its stages.
+  """
+  import functools
+  @functools.wraps(function)
+  def wrapper(*args, **kwargs): 
+    if INSTRUMENTATION is None: 
+      return function(*args, **kwargs)
+    with stage(function.__qualname__) as record: 
+      result = function(*args, **kwargs)
+      if isinstance(result, (pd.DataFrame, pd.Series)): 
+        record["rows"] = len(result)
+      return result
+  return wrapper
+
+@contextlib.contextmanager
+def stage(name): 
+  """Record a stage of a toolkit operation, ex. with stage("read_csv") as record: ...
+
+    The outermost stage is the operation itself. The stage yields a dict, in which "rows" can be 
+    set to the number of rows the stage produced. Does nothing when instrumentation is off.
+  """
+  global active_operation
+  record = {}
+  if INSTRUMENTATION is None: 
+    yield record
+    return
+  operation = active_operation
+  outermost = operation is None
+  if outermost: 
+    operation = active_operation = {"operation": name, "stages": {}, "depth": 0, "peak_mb": 0.0}
+    profiler = None
+    if INSTRUMENTATION == "profile": 
+      import cProfile
+      import tracemalloc
+      tracemalloc.start()
+      profiler = cProfile.Profile()
+      profiler.enable()
+  else: 
+    totals = operation["stages"].setdefault(name, {"calls": 0, "seconds": 0.0, "rows": None, 
+                                                   "peak_mb": 0.0, "depth": operation["depth"]})
+  operation["depth"] += 1
+  # the peak can only be reset for the whole process, so resetting it for a nested stage would 
+  # hide the peaks the enclosing stages reached before it
+  if outermost: 
+    reset_peak_memory()
+  entry_peak = peak_memory_mb()
+  started = time.perf_counter()
+  failed = True
+  try: 
+    yield record
+    failed = False
+  finally: 
+    seconds = time.perf_counter() - started
+    peak = max(entry_peak, peak_memory_mb())
+    operation["depth"] -= 1
+    operation["peak_mb"] = max(operation["peak_mb"], peak)
+    if not outermost: 
+      totals["calls"] += 1
+      totals["seconds"] += seconds
+      totals["peak_mb"] = max(totals["peak_mb"], peak)
+      if "rows" in record: 
+        totals["rows"] = (totals["rows"] or 0) + record["rows"]
+    else: 
+      active_operation = None
+      del operation["depth"]
+      operation.update(seconds = seconds, rows = record.get("rows"), failed = failed)
+      if profiler is not None: 
+        import io
+        import pstats
+        import tracemalloc
+        import cProfile
+        profiler.disable()
+        # leave out the profiler's own allocations
+        snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(False, cProfile.__file__), 
+                                                              tracemalloc.Filter(False, tracemalloc.__file__)])
+        tracemalloc.stop()
+        operation["allocations"] = [str(s) for s in snapshot.statistics("lineno")[:PROFILE_LINES // 2]]
+        listing = io.StringIO()
+        pstats.Stats(profiler, stream = listing).sort_stats("cumulative").print_stats(PROFILE_LINES)
+        operation["profile"] = listing.getvalue()
+      instrumentation_log.append(operation)
+      if INSTRUMENTATION_LOG_FILE is not None: 
+        import json
+        with open(INSTRUMENTATION_LOG_FILE, "a") as f: 
+          f.write(json.dumps(dict(operation, time = time.strftime("%Y-%m-%dT%H:%M:%S")), default = str) + "\n")
+      print(format_operation(operation))
+
+def format_operation(operation): 
+  """Format the record of an instrumented operation as a table of its stages.
+  """
+  stages = operation["stages"]
+  outside = operation["seconds"] - sum(t["seconds"] for t in stages.values() if t["depth"] == 1)
+  # nested stages are indented under the stages that call them
+  rows = [[t["calls"], f"{t['seconds']:.3f}", "" if t["rows"] is None else t["rows"], f"{t['peak_mb']:.1f}"] 
+          for t in stages.values()]
+  table = pd.DataFrame(rows + [[1, f"{outside:.3f}", "", ""]], 
+                       index = ["  " * (t["depth"] - 1) + name for name, t in stages.items()] + ["(self)"], 
+                       columns = ["calls", "seconds", "rows", "peak_mb"]).to_string()
+  lines = [f"{operation['operation']}: {operation['seconds']:.3f} s, peak memory {operation['peak_mb']:.1f} MB"
+           + (" (failed)" if operation["failed"] else ""), table]
+  if "profile" in operation: 
+    lines += [operation["profile"], "Top memory allocations:"] + operation["allocations"]
+  return "\n".join(lines)
+
+def instrumentation_summary(): 
+  """Summarize the instrumented operations run so far, one row per stage of each operation.
+
+    Returns: 
+      a pandas DataFrame of the operations and their stages.
+  """
+  rows = []
+  for n, operation in enumerate(instrumentation_log): 
+    rows.append({"run": n, "operation": operation["operation"], "stage": "", "calls": 1, 
+                 "seconds": operation["seconds"], "rows": operation["rows"], "peak_mb": operation["peak_mb"]})
+    for name, totals in operation["stages"].items(): 
+      rows.append({"run": n, "operation": operation["operation"], "stage": name, "calls": totals["calls"], 
+                   "seconds": totals["seconds"], "rows": totals["rows"], "peak_mb": totals["peak_mb"]})
+  return pd.DataFrame(rows, columns = ["run", "operation", "stage", "calls", "seconds", "rows", "peak_mb"])
+
+def date_strings(dates):
+  """Convert a column of crawl dates to strings, keeping integer dates (ex. 20230101) intact.
+  """
+  if pd.api.types.is_float_dtype(dates):
+    # integer dates with missing values are read as floats
+    dates = dates.astype("Int64")
+  return dates.astype(str)
+
+def detect_date_format(dates, sample_size = DATE_SAMPLE_SIZE):
+  """Detect which of the known crawl date layouts a column of dates uses.
+
+    The layout is detected on a sample of the dates, spread out over the column,
+    rather than on a single row.
+
+    Args:
+      dates (pandas Series): the crawl dates as read from a derivative.
+      sample_size (int): the number of dates to check.
+
+    Returns:
+      the strptime format (or "ISO8601") of the layout matched by most of the sample,
+      or None if none of the CRAWL_DATE_FORMATS match.
+  """
+  sample = dates.dropna()
+  if len(sample) > sample_size:
+    sample = sample.iloc[::len(sample) // sample_size]
+  sample = date_strings(sample)
+  best_format, best_count = None, 0
+  for date_format, pattern in CRAWL_DATE_FORMATS:
+    count = sample.str.match(pattern).sum()
+    if count > best_count:
+      best_format, best_count = date_format, count
+  return best_format
+
+def parse_digit_dates(dates, date_format):
+  """Parse yyyyMMddHHmmss or yyyyMMdd crawl dates with integer arithmetic.
+
+    This is several times faster than parsing the dates as strings.
+
+    Args:
+      dates (pandas Series): the crawl dates, as integers or strings of digits.
+      date_format (str): either "%Y%m%d%H%M%S" or "%Y%m%d".
+
+    Returns:
+      a pandas Series of datetimes, NaT where a date is not a valid date in that layout.
+  """
+  width = 14 if date_format == "%Y%m%d%H%M%S" else 8
+  if pd.api.types.is_integer_dtype(dates):
+    values = dates.to_numpy(dtype = "int64")
+    valid = (values >= 10 ** (width - 1)) & (values < 10 ** width)
+  else:
+    strings = date_strings(dates)
+    valid = (strings.str.fullmatch(r"\d{%d}" % width) == True).to_numpy()
+    values = np.zeros(len(dates), dtype = "int64")
+    values[valid] = strings[valid].astype("int64")
+  if width == 8:
+    values = values * 10 ** 6
+  valid = valid.copy()
+
+  year, month, day = values // 10 ** 10, values // 10 ** 8 % 100, values // 10 ** 6 % 100
+  hour, minute, second = values // 10 ** 4 % 100, values // 10 ** 2 % 100, values % 100
+  months = ((year - 1970) * 12 + month - 1).astype("datetime64[M]")
+  days = months.astype("datetime64[D]") + (day - 1).astype("timedelta64[D]")
+  parsed = days.astype("datetime64[s]") + (hour * 3600 + minute * 60 + second).astype("timedelta64[s]")
+  # out of range days roll over into the next month, so check that they stayed in their month
+  valid &= (month >= 1) & (month <= 12) & (day >= 1) & (days.astype("datetime64[M]") == months)
+  valid &= (hour < 24) & (minute < 60) & (second < 60)
+  parsed[~valid] = np.datetime64("NaT")
+  return pd.Series(parsed, index = dates.index)
+
+@instrumented
+def parse_crawl_dates(dates, date_format = None, errors = "coerce"):
+  """Parse a column of crawl dates into datetimes.
+
+    Handles the date layouts of ARCH / AUT derivatives (see CRAWL_DATE_FORMATS). The
+    layout is detected on a sample of the dates, and the whole column is then parsed at
+    once with that format. Dates that don't match it are tried against the other known
+    layouts, and any dates that still can't be parsed are reported rather than guessed at.
+    Dates with a timezone are converted to UTC, so that all parsed dates can be compared.
+
+    Args:
+      dates (pandas Series): the crawl dates as read from a derivative.
+      date_format (str): an optional format to use instead of detecting one,
+        ex. the format detected on an earlier chunk of the same derivative.
+      errors (str): "coerce" to report unparseable dates and set them to NaT,
+        or "raise" to raise a ValueError instead.
+
+    Returns:
+      a pandas Series of datetimes.
+  """
+  if pd.api.types.is_datetime64_any_dtype(dates):
+    if getattr(dates.dt, "tz", None) is not None:
+      return dates.dt.tz_convert(None)
+    return dates
+
+  if date_format is None:
+    date_format = detect_date_format(dates)
+  formats = [date_format] + [f for f, pattern in CRAWL_DATE_FORMATS if f != date_format]
+  parsed = pd.Series(pd.NaT, index = dates.index, dtype = "datetime64[ns]")
+  unparsed = dates.notna()
+  for f in formats:
+    if not unparsed.any():
+      break
+    if f in ("%Y%m%d%H%M%S", "%Y%m%d"):
+      parsed[unparsed] = parse_digit_dates(dates[unparsed], f)
+    else:
+      # a format of None (no known layout detected) lets pandas infer one format for the column
+      parsed[unparsed] = pd.to_datetime(date_strings(dates[unparsed]), format = f, utc = True,
+                                        errors = "coerce").dt.tz_convert(None)
+    unparsed &= parsed.isna()
+
+  if unparsed.any():
+    examples = ", ".join(date_strings(dates[unparsed].head(3)))
+    message = f"{unparsed.sum()} crawl dates could not be parsed (ex. {examples})"
+    if errors == "raise":
+      raise ValueError(message)
+    print(message + ", they have been left empty.")
+  return parsed
+
+@instrumented
+def compact_columns(data, date_format = None):
+  """Convert the known derivative columns of a dataframe to compact types.
+
+    The domain column becomes categorical, and the crawl_date column becomes a datetime.
+
+    Args:
+      data (pandas DataFrame): a (chunk of a) derivative.
+      date_format (str): an optional crawl_date format, passed on to parse_crawl_dates().
+
+    Returns:
+      the dataframe with the converted columns.
+  """
+  if "domain" in list(data):
+    data["domain"] = data["domain"].astype("category")
+  if "crawl_date" in list(data):
+    data["crawl_date"] = parse_crawl_dates(data["crawl_date"], date_format)
+  return data
+
+def day_bounds(start_date = None, end_date = None):
+  """The range of crawl dates covered by a date range, as whole days.
+
+    The start and end dates are both included, whatever their time of day, so that the rows
+    of a derivative and the daily counts of a crawl cube are filtered the same way.
+
+    Args:
+      start_date: an optional date (str or datetime), the first day to keep.
+      end_date: an optional date (str or datetime), the last day to keep.
+
+    Returns:
+      the start of the first day and the start of the day after the last day (pandas Timestamps, 
+      or None for a missing date), so crawl dates d in the range have start <= d < end.
+  """
+  start = pd.Timestamp(start_date).floor("D") if start_date is not None else None
+  end = pd.Timestamp(end_date).floor("D") + pd.Timedelta(days = 1) if end_date is not None else None
+  return start, end
+
+@instrumented
+def filter_rows(data, start_date = None, end_date = None, domains = None):
+  """Keep the rows of a derivative within a date range and/or set of domains.
+
+    Args:
+      data (pandas DataFrame): a (chunk of a) derivative, with a parsed crawl_date column.
+      start_date: an optional date (str or datetime), the first day of the crawl_dates to keep.
+      end_date: an optional date (str or datetime), the last day of the crawl_dates to keep (inclusive).
+      domains (list of str): an optional list of the domains to keep.
+
+    Returns:
+      the matching rows of the dataframe.
+  """
+  mask = pd.Series(True, index = data.index)
+  if "crawl_date" in list(data):
+    start, end = day_bounds(start_date, end_date)
+    if start is not None:
+      mask &= data["crawl_date"] >= start
+    if end is not None:
+      mask &= data["crawl_date"] < end
+  if domains is not None and "domain" in list(data):
+    mask &= data["domain"].isin(domains)
+  return data.loc[mask]
+
+def derivative_format(datafile):
+  """Determine the file format of a derivative from its file ending.
+
+    Args:
+      datafile (str): the path to a derivative file, or to a folder of derivative part files.
+
+    Returns:
+      "parquet", "ipc" (Arrow) or "csv".
+  """
+  if os.path.isdir(datafile):
+    for dirpath, subdirs, files in os.walk(datafile):
+      for f in files:
+        if f.endswith(PARQUET_FILE_TYPES + ARROW_FILE_TYPES):
+          datafile = f
+          break
       else:
-        matched_files.append(f"{subfolder}/{f}")
-  return matched_files
+        continue
+      break
+  if datafile.endswith(PARQUET_FILE_TYPES):
+    return "parquet"
+  if datafile.endswith(ARROW_FILE_TYPES):
+    return "ipc"
+  return "csv"
+
+def csv_files(datafile):
+  """The CSV files of a CSV derivative, ex. the derivative file in a folder generated by 
+    DerivativeGenerator.generate_derivative().
+
+    Files and folders whose names start with "_" or "." (ex. _manifest.json) are left out, as Spark 
+    and pyarrow do.
+
+    Args:
+      datafile (str): the path to a CSV derivative file, or to a folder of CSV files.
+
+    Returns:
+      a list of the paths of the CSV files, in order.
+  """
+  if not os.path.isdir(datafile):
+    return [datafile]
+  files = []
+  for dirpath, subdirs, fs in os.walk(datafile):
+    subdirs[:] = sorted(d for d in subdirs if not d.startswith(("_", ".")))
+    files += [os.path.join(dirpath, f) for f in sorted(fs) if f.endswith(".csv") and not f.startswith(("_", "."))]
+  if not files:
+    raise FileNotFoundError(f"There are no CSV files in {datafile}.")
+  return files
+
+def read_csv_chunks(datafile, columns = None, chunksize = CHUNKSIZE):
+  """Read a CSV derivative (file or folder, see csv_files()) in chunks of rows, numbered across all of its files.
+  """
+  position = 0
+  for csv_file in csv_files(datafile):
+    header = list(pd.read_csv(csv_file, nrows = 0))
+    if columns is not None:
+      header = [c for c in header if c in columns]
+    for chunk in pd.read_csv(csv_file, usecols = header, chunksize = chunksize):
+      chunk.index = pd.RangeIndex(position, position + len(chunk))
+      position += len(chunk)
+      yield chunk
+
+@instrumented
+def read_dataset(datafile, file_format, columns = None, start_date = None, end_date = None, domains = None):
+  """Read a Parquet or Arrow IPC derivative, pushing the column selection and filters down to the reader.
+
+    Args:
+      datafile (str): the path to the derivative file, or a folder of (hive partitioned) part files.
+      file_format (str): either "parquet" or "ipc".
+      columns (list of str): an optional list of the columns to read, all columns are read if None.
+      start_date: an optional date (str or datetime), the first day of the crawl_dates to keep.
+      end_date: an optional date (str or datetime), the last day of the crawl_dates to keep (inclusive).
+      domains (list of str): an optional list of the domains to keep.
+
+    Returns:
+      a pandas DataFrame of the matching rows, with compact column types.
+  """
+  import pyarrow as pa
+  import pyarrow.dataset as ds
+
+  dataset = ds.dataset(datafile, format = file_format, partitioning = "hive")
+  names = dataset.schema.names
+  if columns is not None:
+    columns = [c for c in names if c in columns]
+
+  expression = None
+  def add_condition(condition):
+    nonlocal expression
+    expression = condition if expression is None else expression & condition
+
+  if domains is not None and "domain" in names:
+    add_condition(ds.field("domain").isin(list(domains)))
+  if (start_date is not None or end_date is not None) and "crawl_date" in names:
+    date_type = dataset.schema.field("crawl_date").type
+    first = dataset.head(1, columns = ["crawl_date"]).column(0)
+    sample = str(first[0].as_py()) if len(first) else ""
+    start, end = day_bounds(start_date, end_date)
+    for bound, keep in [(start, lambda f, v: f >= v), (end, lambda f, v: f < v)]:
+      if bound is None:
+        continue
+      if pa.types.is_timestamp(date_type):
+        if date_type.tz is not None and bound.tz is None:
+          bound = bound.tz_localize(date_type.tz)
+        add_condition(keep(ds.field("crawl_date"), pa.scalar(bound, type = date_type)))
+      elif re.match(r"^[0-9]{8}([0-9]{6})?$", sample):
+        # AUT / ARCH style dates (yyyyMMdd[HHmmss]) sort in the same order as the dates they represent
+        value = bound.strftime("%Y%m%d%H%M%S" if len(sample) == 14 else "%Y%m%d")
+        if pa.types.is_integer(date_type):
+          value = int(value)
+        add_condition(keep(ds.field("crawl_date"), value))
+      # other date layouts are filtered after parsing, below
+
+  table = dataset.to_table(columns = columns, filter = expression)
+  data = filter_rows(compact_columns(table.to_pandas()), start_date, end_date, domains).reset_index(drop = True)
+  # the rows filtered after parsing leave their categories behind, ex. domains without crawls in the date range
+  for c in list(data):
+    if isinstance(data[c].dtype, pd.CategoricalDtype):
+      data[c] = data[c].cat.remove_unused_categories()
+  return data
+
+def read_chunks(datafile, columns = None, chunksize = CHUNKSIZE):
+  """Read a derivative one chunk of rows at a time.
+
+    Works for CSV, Parquet and Arrow IPC derivatives. The crawl date layout is detected on
+    the first chunk and reused for the rest.
+
+    Args:
+      datafile (str): the path to the derivative file, or a folder of part files.
+      columns (list of str): an optional list of the columns to read, all columns are read if None.
+      chunksize (int): the (maximum) number of rows in each chunk.
+
+    Yields:
+      pandas DataFrames of the rows of each chunk, with compact column types.
+  """
+  file_format = derivative_format(datafile)
+  if file_format == "csv":
+    chunks = read_csv_chunks(datafile, columns, chunksize)
+  else:
+    import pyarrow.dataset as ds
+    dataset = ds.dataset(datafile, format = file_format, partitioning = "hive")
+    if columns is not None:
+      columns = [c for c in dataset.schema.names if c in columns]
+    chunks = (batch.to_pandas() for batch in dataset.to_batches(columns = columns, batch_size = chunksize))
+
+  date_format = None
+  for chunk in chunks:
+    # detect the date layout once, and reuse it for the remaining chunks
+    if date_format is None and "crawl_date" in list(chunk):
+      date_format = detect_date_format(chunk["crawl_date"])
+    yield compact_columns(chunk, date_format)
+
+@instrumented
+def count_daily_crawls(data):
+  """Count the crawls of each domain on each day.
+
+    Args:
+      data (pandas DataFrame): a (chunk of a) derivative, with domain and parsed crawl_date columns.
+
+    Returns:
+      a pandas Series of crawl counts, indexed by domain and day.
+  """
+  return data.groupby([data["domain"].astype(str), data["crawl_date"].dt.floor("D")]).size()
+
+@instrumented
+def build_crawl_cube(datafile, chunksize = CHUNKSIZE):
+  """Count the crawls of each domain on each day for a whole derivative.
 
+    The derivative is read in chunks, so only the counts are kept in memory.
+
+    Args:
+      datafile (str): the path to the derivative file, or a folder of part files.
+      chunksize (int): the number of rows to read at a time.
+
+    Returns:
+      a pandas Series of crawl counts, indexed by domain and day.
+  """
+  parts = [count_daily_crawls(chunk) for chunk in read_chunks(datafile, FILTER_COLUMNS, chunksize)]
+  if not parts:
+    return pd.Series(dtype = "int64", index = pd.MultiIndex.from_arrays([[], pd.DatetimeIndex([])], names = FILTER_COLUMNS[::-1]))
+  return pd.concat(parts).groupby(level = [0, 1]).sum()
+
+@instrumented
+def filter_crawl_cube(cube, start_date = None, end_date = None, domains = None):
+  """Keep the days of a crawl count cube (see build_crawl_cube()) within a date range and/or set of domains.
+
+    The date range covers whole days, as in filter_rows().
+  """
+  mask = np.ones(len(cube), dtype = bool)
+  days = cube.index.get_level_values("crawl_date")
+  start, end = day_bounds(start_date, end_date)
+  if start is not None:
+    mask &= days >= start
+  if end is not None:
+    mask &= days < end
+  if domains is not None:
+    mask &= cube.index.get_level_values("domain").isin(domains)
+  return cube[mask]
+
+def period_frequency(freq):
+  """Make a pandas frequency alias work with the installed pandas version.
+
+    Month, quarter and year ends are "ME", "QE" and "YE" from pandas 2.2, where "M", "Q" and "Y"
+    are deprecated (and removed in pandas 3), and only the old aliases work before it. Either 
+    spelling is accepted, ex. "1M" and "1ME" are both monthly.
+
+    Args:
+      freq (str): a frequency alias, ex. "1ME", "1M" or "1W".
+
+    Returns:
+      the alias pandas accepts.
+  """
+  import warnings
+  from pandas.tseries.frequencies import to_offset
+  alternatives = [freq]
+  if re.search(r"[MQY]$", freq):
+    alternatives.append(freq + "E")
+  elif re.search(r"[MQY]E$", freq):
+    alternatives.append(freq[:-1])
+  for alias in alternatives:
+    try:
+      with warnings.catch_warnings():
+        warnings.simplefilter("error", FutureWarning)
+        to_offset(alias)
+      return alias
+    except (ValueError, FutureWarning):
+      continue
+  return freq
 
 # Fletcher's code to download a WARC file from a direct link 
-def download_file(url, filepath='', filename=None, loud=True):
-  """Displays a text box to specify URL to download file from.
+def download_file(url, filepath='', filename=None, loud=True, checksum=None, segments=DOWNLOAD_SEGMENTS, 
+                  session=None, retries=DOWNLOAD_RETRIES):
+  """Download a file from a URL, resuming from where an earlier attempt stopped.
+
+  The file is downloaded to a ".part" file, which is renamed once the download is complete 
+  (and the checksum, if given, matches). If the server supports byte ranges, an interrupted 
+  download continues from the end of the ".part" file, and large files are downloaded as 
+  several segments in parallel. Dropped connections are retried. 
+
+  A download is only resumed if the file's ETag (or Last-Modified date) and size are the same as 
+  when it started, and the ranges are requested with If-Range, so that a file which changed on 
+  the server is downloaded again from the start instead of being appended to the old bytes. 
 
   Args: 
     url : the URL path to download the file from 
@@ -67,87 +820,1281 @@ def download_file(url, filepath='', filename=None, loud=True):
     filename : the filename to give to the downloaded file 
                (if None, the filename will be extracted from the URL)
     loud : boolean indicating whether or not to display download progress
+    checksum : an optional checksum to verify the file against, as "algorithm:hexdigest" 
+               ex. "sha1:2fd4e1c6...", or just the hexdigest for sha256
+    segments : the number of byte ranges to download in parallel, 1 to download in a single stream
+    session : an optional requests.Session to download with (see download_files())
+    retries : the number of times to retry after a dropped connection
+
+  Returns: 
+    the path of the downloaded file.
   """
+  import requests
+  import json
+  import threading
+  from concurrent.futures import ThreadPoolExecutor
+
   if not filename:
     filename = url.split('/')[-1]
     if "?" in filename: 
         filename = filename.split("?")[0]
-  
-  r = requests.get(url, stream=True)
+  destination = filepath + filename
+  partial = destination + ".part"
+  progress_file = partial + ".json"
+  session = session or requests.Session()
+
+  # find the size of the file, whether the server supports byte ranges, and the version of the file
+  size, ranges, validator = None, False, None
+  try: 
+    head = session.head(url, allow_redirects=True, timeout=DOWNLOAD_TIMEOUT)
+    if head.ok: 
+      size = int(head.headers["Content-Length"]) if "Content-Length" in head.headers else None
+      ranges = head.headers.get("Accept-Ranges", "") == "bytes"
+      # If-Range only accepts a strong ETag
+      etag = head.headers.get("ETag")
+      validator = etag if etag and not etag.startswith("W/") else head.headers.get("Last-Modified")
+  except requests.RequestException: 
+    pass
+
+  # the record of an earlier attempt, resumed only if the file is still the same
+  saved = None
+  if os.path.exists(partial) and os.path.exists(progress_file): 
+    with open(progress_file) as f: 
+      saved = json.load(f)
+    if saved.get("size") != size or saved.get("validator") != validator: 
+      saved = None
+
   if loud:
-    total_bytes_dl = 0
-    content_len = int(r.headers['Content-Length'])
-    prog_bar = widgets.IntProgress(value=1, min=0, max=100, step=1, bar_style='info',orientation='horizontal')
-    print(f'Download progress of {filename}:')
-    display(prog_bar)
-
-  with open(filepath + filename, 'wb') as fd:
-      for chunk in r.iter_content(chunk_size=4096):
-          fd.write(chunk)
-          if loud:
-            total_bytes_dl += 4096
-            percent = int((total_bytes_dl / content_len) * 100.0)
-            prog_bar.value = percent
-  r.close()
+    import ipywidgets as widgets
+    from IPython.display import display
+    if size:
+      prog_bar = widgets.IntProgress(value=0, min=0, max=100, step=1, bar_style='info',orientation='horizontal')
+      print(f'Download progress of {filename}:')
+      display(prog_bar)
+    else: 
+      print(f'Downloading {filename} (size unknown)...')
+  lock = threading.Lock()
+  def show_progress(done): 
+    if loud and size: 
+      prog_bar.value = int((done / size) * 100.0)
+
+  def fetch(start, end, fd, done): 
+    """Write bytes start..end (inclusive, end None for the rest of the file) to fd, retrying on errors.
+    done is a list holding the number of bytes of the range written so far. Returns False if the
+    server didn't send the range, because it ignored the request, the file changed (If-Range) 
+    or the range is past the end of the file (416)."""
+    if end is not None and start + done[0] > end: 
+      return True
+    for attempt in range(retries + 1): 
+      headers = {}
+      if start + done[0] > 0 or end is not None: 
+        headers["Range"] = f"bytes={start + done[0]}-" + ("" if end is None else str(end))
+        if validator is not None: 
+          headers["If-Range"] = validator
+      try: 
+        with session.get(url, stream=True, headers=headers, timeout=DOWNLOAD_TIMEOUT) as r: 
+          if "Range" in headers and r.status_code == 416: 
+            return False
+          r.raise_for_status()
+          if "Range" in headers and r.status_code != 206: 
+            return False
+          for chunk in r.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+            with lock: 
+              fd.seek(start + done[0])
+              fd.write(chunk)
+              done[0] += len(chunk)
+              save_progress()
+        return True
+      except requests.RequestException: 
+        if attempt == retries: 
+          raise
+        time.sleep(2 ** attempt)
+
+  segmented = ranges and size and segments > 1 and size > segments * DOWNLOAD_CHUNK_SIZE
+  if segmented: 
+    # split the file into byte ranges, keeping the progress of each range from an earlier attempt
+    bounds = [(size * i // segments, size * (i + 1) // segments - 1) for i in range(segments)]
+    progress = [[0] for b in bounds]
+    if saved is not None and saved.get("bounds") == [list(b) for b in bounds]: 
+      progress = [[d] for d in saved["done"]]
+    def save_progress(): 
+      with open(progress_file, "w") as f: 
+        json.dump({"size": size, "validator": validator, "bounds": bounds, 
+                   "done": [d[0] for d in progress]}, f)
+      show_progress(sum(d[0] for d in progress))
+
+    mode = "r+b" if os.path.exists(partial) and saved is not None else "wb"
+    with open(partial, mode) as fd: 
+      fd.truncate(size)
+      with ThreadPoolExecutor(max_workers=segments) as pool: 
+        results = list(pool.map(lambda b, d: fetch(b[0], b[1], fd, d), bounds, progress))
+    # if the file changed while it was downloading, or the server ignored the ranges, 
+    # download it again from the start, in a single stream
+    segmented = all(results)
+    saved = None
+  if not segmented: 
+    # a single stream, resumed from the end of the partial file if the server supports it, 
+    # and the partial file was written by a single stream (a segmented download writes it at 
+    # its full size from the start, so its size doesn't say how much was downloaded)
+    resume = ranges and saved is not None and saved.get("bounds") is None
+    done = [os.path.getsize(partial) if resume else 0]
+    with open(progress_file, "w") as f: 
+      json.dump({"size": size, "validator": validator, "bounds": None}, f)
+    def save_progress(): 
+      show_progress(done[0])
+    with open(partial, "r+b" if done[0] else "wb") as fd: 
+      if done[0] == size: 
+        pass # already complete
+      elif not fetch(0, None, fd, done): 
+        # the server sent the whole file (or the partial file is longer than it), start again
+        fd.seek(0)
+        fd.truncate()
+        done[0] = 0
+        fetch(0, None, fd, done)
+      fd.truncate(done[0])
+
+  if checksum is not None: 
+    verify_checksum(partial, checksum)
+  os.replace(partial, destination)
+  if os.path.exists(progress_file): 
+    os.remove(progress_file)
   print("File download completed.")
+  return destination
+
+
+def verify_checksum(filename, checksum): 
+  """Check a file against a checksum, raising a ValueError if it doesn't match.
+
+  Args: 
+    filename : the path of the file to check
+    checksum : the expected checksum, as "algorithm:hexdigest", or just the hexdigest for sha256
+  """
+  import hashlib
+  algorithm, expected = checksum.split(":", 1) if ":" in checksum else ("sha256", checksum)
+  digest = hashlib.new(algorithm)
+  with open(filename, "rb") as f: 
+    for block in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b""): 
+      digest.update(block)
+  if digest.hexdigest().lower() != expected.lower(): 
+    raise ValueError(f"The {algorithm} checksum of {filename} does not match, expected {expected} but got {digest.hexdigest()}")
+
+
+def download_files(urls, filepath='', loud=True, checksums=None, max_workers=DOWNLOAD_WORKERS): 
+  """Download several files at once, over a shared pool of connections.
+
+  Args: 
+    urls : a list of URLs to download
+    filepath : the file path specifying the folder to save the files into
+    loud : boolean indicating whether or not to display download progress
+    checksums : an optional dict of URL -> checksum, see download_file()
+    max_workers : the number of files to download at the same time
+
+  Returns: 
+    a dict of URL -> the path of the downloaded file, or the exception raised while downloading it.
+  """
+  import requests
+  from concurrent.futures import ThreadPoolExecutor
+  checksums = checksums or {}
+  session = requests.Session()
+  adapter = requests.adapters.HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers * DOWNLOAD_SEGMENTS)
+  session.mount("http://", adapter)
+  session.mount("https://", adapter)
+
+  def download(url): 
+    try: 
+      return download_file(url, filepath, loud=loud, checksum=checksums.get(url), session=session)
+    except Exception as e: 
+      print(f"Could not download {url}: {e}")
+      return e
+  with ThreadPoolExecutor(max_workers=max_workers) as pool: 
+    results = dict(zip(urls, pool.map(download, urls)))
+  session.close()
+  return results
 
 
 def display_download_file(): 
-    """Display textbox to download file from specified URL.
+    """Display textbox to download files from specified URLs, one URL per line.
     """
-    txt_url = widgets.Text(description="W/ARC URL: ")
+    import ipywidgets as widgets
+    from IPython.display import display
+    txt_url = widgets.Textarea(description="W/ARC URLs: ", placeholder="One URL per line")
     btn_download = widgets.Button(description = "Download W/ARC")
     def btn_download_action(btn): 
-        url = txt_url.value
-        if url != '': 
-            download_file(url, path + "/") # download the file to the specified folder set in the above section
+        urls = [url.strip() for url in txt_url.value.splitlines() if url.strip() != '']
+        if len(urls) == 1: 
+            download_file(urls[0], path + "/") # download the file to the specified folder set in the above section
+        elif urls: 
+            download_files(urls, path + "/")
         else: 
             print("Please specify a URL in the textbox above.")
     btn_download.on_click(btn_download_action)
     display(txt_url)
     display(btn_download)
 
+@instrumented
+def append_file(source, destination, offset=0, length=None): 
+  """Append the bytes of a file to an open binary file, without parsing them.
+
+  Uses a zero-copy copy (copy_file_range, or sendfile) where the operating system supports it, 
+  and a large buffered copy otherwise. Linux doesn't allow copy_file_range into a file opened in 
+  append mode ("ab"), so open the destination with "wb" or "r+b" instead.
+
+  Args: 
+    source : the path of the file to copy from
+    destination : the binary file object to append to
+    offset : the number of bytes at the start of source to skip
+    length : the number of bytes to copy, everything after offset is copied if None
+  """
+  destination.seek(0, os.SEEK_END)
+  destination.flush()
+  position = destination.tell()
+  with open(source, "rb") as src: 
+    end = os.fstat(src.fileno()).st_size
+    if length is not None: 
+      end = min(end, offset + length)
+    copy = getattr(os, "copy_file_range", None)
+    if copy is None and hasattr(os, "sendfile"): 
+      # sendfile writes at the destination's file position, which is already at the end
+      copy = lambda src_fd, dst_fd, count, offset_src, offset_dst: os.sendfile(dst_fd, src_fd, offset_src, count)
+    try: 
+      while copy is not None and offset < end: 
+        copied = copy(src.fileno(), destination.fileno(), end - offset, offset, position)
+        if copied == 0: 
+          break
+        offset += copied
+        position += copied
+    except OSError: 
+      # not supported for these files (ex. a network file system), fall back to a buffered copy
+      pass
+    # the zero-copy functions write past the file object's position, so move it to the end of the copy
+    destination.seek(position)
+    src.seek(offset)
+    while offset < end: 
+      block = src.read(min(COPY_BUFFER_SIZE, end - offset))
+      if not block: 
+        break
+      destination.write(block)
+      offset += len(block)
+
+def expand_sources(source_file): 
+  """Expand a W/ARC path, glob pattern, or list of paths / patterns into a list of paths.
+
+  Args: 
+    source_file : a path or glob pattern (str), or a list of them
+
+  Returns: 
+    a list of paths, patterns that don't match any local files are kept as they are 
+    (ex. for paths on HDFS, which Spark expands itself).
+  """
+  import glob
+  patterns = [source_file] if isinstance(source_file, str) else list(source_file)
+  source_files = []
+  for pattern in patterns: 
+    source_files.extend(sorted(glob.glob(pattern)) or [pattern])
+  return source_files
+
+@instrumented
+def merge_csv_parts(parts, output_path, append=False): 
+  """Merge CSV part files, which each start with the same header, into a single CSV file.
+
+  The parts are copied as bytes (see append_file()), and each part is removed once it has 
+  been copied, so the merge needs little more disk space than the parts themselves.
+
+  Args: 
+    parts : the paths of the part files, in order
+    output_path : the path of the merged file
+    append : if True, the rows of the parts are added to the end of an existing merged file
+  """
+  header_written = append and os.path.exists(output_path) and os.path.getsize(output_path) > 0
+  # not "ab": append_file() can't copy into a file opened in append mode without copying through memory
+  with open(output_path, "r+b" if append and os.path.exists(output_path) else "wb") as output: 
+    for part in parts: 
+      with open(part, "rb") as f: 
+        header = f.readline()
+      # empty parts have no header
+      if header: 
+        append_file(part, output, len(header) if header_written else 0)
+        header_written = True
+      os.remove(part)
+
+@instrumented
+def merge_parquet_parts(parts, output_path): 
+  """Merge Parquet part files into a single Parquet file, one row group at a time.
+
+  Args: 
+    parts : the paths of the part files, in order
+    output_path : the path of the merged file
+  """
+  import pyarrow.parquet as pq
+  writer = None
+  for part in parts: 
+    part_file = pq.ParquetFile(part)
+    if writer is None: 
+      writer = pq.ParquetWriter(output_path, part_file.schema_arrow)
+    for i in range(part_file.num_row_groups): 
+      writer.write_table(part_file.read_row_group(i))
+    os.remove(part)
+  if writer is not None: 
+    writer.close()
+
+def source_info(source_file): 
+  """Describe a W/ARC file for a derivative manifest: its path, size, modification time and digest.
+  """
+  if not os.path.exists(source_file): 
+    return {"path": source_file}
+  stats = os.stat(source_file)
+  return {"path": source_file, "size": stats.st_size, "mtime": stats.st_mtime, 
+          "digest": source_digest(source_file)}
+
+def source_unchanged(saved, source_file): 
+  """Check whether a W/ARC file still matches its description in a derivative manifest (see source_info()).
+  """
+  if not os.path.exists(source_file): 
+    # ex. a path on HDFS, which can't be checked
+    return True
+  stats = os.stat(source_file)
+  if (stats.st_size, stats.st_mtime) == (saved.get("size"), saved.get("mtime")): 
+    return True
+  # the file was touched, check whether the content changed
+  return stats.st_size == saved.get("size") and source_digest(source_file) == saved.get("digest")
+
+def source_stats(datafile):
+  """The size and modification time (in ns) of a derivative file, or of each of the files in a derivative folder.
+
+    Any change to a file changes these, even one that source_digest()'s samples miss.
+  """
+  if os.path.isdir(datafile):
+    return [[os.path.relpath(f, datafile)] + source_stats(f)
+            for f in sorted(os.path.join(dirpath, f) for dirpath, subdirs, fs in os.walk(datafile) for f in fs)]
+  stats = os.stat(datafile)
+  return [stats.st_size, stats.st_mtime_ns]
+
+@instrumented
+def source_digest(datafile):
+  """Compute a digest of the content of a derivative file, or of all the files in a derivative folder.
+
+    To keep this fast for multi-GB derivatives, the digest covers the size of the file and
+    DIGEST_SAMPLES blocks spread evenly through it, rather than every byte. Digests are
+    remembered for as long as a file's size and modification time don't change.
+
+    Args:
+      datafile (str): the path to the derivative file, or a folder of part files.
+
+    Returns:
+      the hex digest (str).
+  """
+  import hashlib
+  if os.path.isdir(datafile):
+    files = sorted(os.path.join(dirpath, f) for dirpath, subdirs, fs in os.walk(datafile) for f in fs)
+    return hashlib.sha1("".join(source_digest(f) for f in files).encode()).hexdigest()
+
+  stats = os.stat(datafile)
+  signature = (os.path.abspath(datafile), stats.st_size, stats.st_mtime)
+  if signature not in source_digests:
+    digest = hashlib.sha1(str(stats.st_size).encode())
+    with open(datafile, "rb") as f:
+      for i in range(DIGEST_SAMPLES):
+        f.seek(stats.st_size * i // DIGEST_SAMPLES)
+        digest.update(f.read(DIGEST_BLOCK_SIZE))
+    source_digests[signature] = digest.hexdigest()
+  return source_digests[signature]
+
+
+class ResourceCache: 
+    """Keeps analysis results so that they only need to be computed once per project.
+
+    Implements the save-state paradigm from design_notes.md: a resource is looked up in memory, then
+    in its folder of the project folder ("text", "collection", "network" or "file_formats"), and is 
+    only generated if neither has it. Generated resources are saved to disk and kept in memory.
+
+    Resources are keyed on their name, their parameters and the size, modification time and
+    content of the source file they are computed from (see source_stats() and source_digest()),
+    so a changed derivative gets new results. The memory
+    tier holds at most max_memory bytes (by pickled size), dropping the least recently used
+    resources first. 
+    """
+    def __init__(self, project_folder = None, max_memory = CACHE_MEMORY_SIZE): 
+        """
+        Args: 
+          project_folder (str): the folder to save resources in. If None, the working folder (path) is used, 
+            or the current directory if path is still the Google Drive default and Drive isn't mounted 
+            (ex. when running from jobs.py or a script outside of Colab).
+          max_memory (int): the maximum number of bytes of resources to keep in memory.
+        """
+        from collections import OrderedDict
+        self.project_folder = project_folder
+        self.max_memory = max_memory
+        self.memory = OrderedDict() # key -> (resource, size in bytes)
+        self.memory_size = 0
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+
+    def key(self, name, source = None, **params): 
+        """Create the key for a resource, from its name, source file and parameters.
+        """
+        import hashlib
+        import json
+        description = json.dumps({"name": name, 
+                                  "source": source_digest(source) if source is not None else None, 
+                                  "stats": source_stats(source) if source is not None else None, 
+                                  "params": params}, sort_keys = True, default = str)
+        return hashlib.sha1(description.encode()).hexdigest()
+
+    def resource_file(self, folder, name, key): 
+        """The path a resource is saved to.
+        """
+        project_folder = self.project_folder
+        if project_folder is None: 
+            drive_mounted = os.path.isdir(os.path.dirname(DRIVE_FOLDER.rstrip("/")))
+            project_folder = os.getcwd() if path == DRIVE_FOLDER and not drive_mounted else path
+        return os.path.join(project_folder, folder, f"{name}_{key[:16]}.pkl")
+
+    def get(self, folder, name, generate, source = None, **params): 
+        """Get a resource, generating and saving it if it isn't cached yet.
+
+        Args: 
+          folder (str): the project sub folder the resource belongs in, one of RESOURCE_FOLDERS.
+          name (str): the name of the resource, ex. "domain_counts".
+          generate: a function with no arguments which computes the resource.
+          source (str): the path of the derivative the resource is computed from, if any.
+          **params: any parameters that the resource depends on.
+
+        Returns: 
+          the resource.
+        """
+        import pickle
+        if folder not in RESOURCE_FOLDERS: 
+          raise ValueError(f"{folder} is not a resource folder, use one of {RESOURCE_FOLDERS}")
+        key = self.key(folder + "/" + name, source, **params)
+        if key in self.memory: 
+          self.stats["memory_hits"] += 1
+          self.memory.move_to_end(key)
+          return self.memory[key][0]
+
+        resource_file = self.resource_file(folder, name, key)
+        if os.path.exists(resource_file): 
+          self.stats["disk_hits"] += 1
+          with open(resource_file, "rb") as f: 
+            resource = pickle.load(f)
+          self.remember(key, resource, os.path.getsize(resource_file))
+          return resource
+
+        self.stats["misses"] += 1
+        resource = generate()
+        saved = pickle.dumps(resource, protocol = pickle.HIGHEST_PROTOCOL)
+        try: 
+          os.makedirs(os.path.dirname(resource_file), exist_ok = True)
+          with open(resource_file, "wb") as f: 
+            f.write(saved)
+        except OSError as e: 
+          print(f"{name} could not be saved to {resource_file}: {e}")
+        self.remember(key, resource, len(saved))
+        return resource
+
+    def remember(self, key, resource, size): 
+        """Keep a resource in memory, dropping the least recently used resources if needed.
+        """
+        if size > self.max_memory: 
+          return
+        self.memory[key] = (resource, size)
+        self.memory_size += size
+        while self.memory_size > self.max_memory: 
+          dropped_key, (dropped, dropped_size) = self.memory.popitem(last = False)
+          self.memory_size -= dropped_size
+
+    def clear(self, folder = None): 
+        """Remove the cached resources from memory, and from disk for the given folder.
+
+        Args: 
+          folder (str): an optional resource folder to delete the saved resources of.
+        """
+        self.memory.clear()
+        self.memory_size = 0
+        if folder is not None: 
+          resource_folder = os.path.dirname(self.resource_file(folder, "", ""))
+          if os.path.isdir(resource_folder): 
+            for f in os.scandir(resource_folder): 
+              if f.name.endswith(".pkl"): 
+                os.remove(f.path)
+
+
+# The cache shared by all of the Analyzers in a session
+cache = ResourceCache()
+
+def get_spark_session(cores=None, memory=None, shuffle_partitions=None, config=None): 
+  """Get the Spark session shared by all DerivativeGenerators, starting it on first use.
+
+  Starting Spark (and loading the AUT) takes a while, so one session is kept for the whole 
+  Python session, and reused if Spark was already started elsewhere. The cores, memory and 
+  other config settings only apply when the session is started, the number of shuffle 
+  partitions can be changed at any time. 
+
+  Args: 
+    cores : the number of local cores for Spark to use (default: all of them)
+    memory : the amount of memory for the Spark driver / executors, ex. "8g"
+    shuffle_partitions : the number of partitions Spark uses when shuffling data
+    config : a dict of any other Spark configuration settings
+
+  Returns: 
+    the pyspark SparkSession.
+  """
+  global spark_session
+  if spark_session is None or spark_session.sparkContext._jsc is None: 
+    import atexit
+    import findspark
+    findspark.init()
+    import pyspark
+    from pyspark.sql import SparkSession
+    conf = pyspark.SparkConf()
+    if cores: 
+      conf.setMaster(f"local[{cores}]")
+    if memory: 
+      conf.set("spark.driver.memory", memory).set("spark.executor.memory", memory)
+    for key, value in (config or {}).items(): 
+      conf.set(key, str(value))
+    spark_session = SparkSession.builder.config(conf=conf).getOrCreate()
+    atexit.register(stop_spark)
+  if shuffle_partitions: 
+    spark_session.conf.set("spark.sql.shuffle.partitions", str(shuffle_partitions))
+  return spark_session
+
+def stop_spark(): 
+  """Stop the shared Spark session, if it was started.
+  """
+  global spark_session
+  if spark_session is not None: 
+    spark_session.stop()
+    spark_session = None
+
+
+def mix_hashes(values):
+  """Scramble 64 bit hashes (the splitmix64 finalizer), so that all of their bits depend on all of the input bits.
+  """
+  values = values ^ (values >> np.uint64(30))
+  values = values * np.uint64(0xBF58476D1CE4E5B9)
+  values = values ^ (values >> np.uint64(27))
+  values = values * np.uint64(0x94D049BB133111EB)
+  return values ^ (values >> np.uint64(31))
+
+def fingerprint_documents(texts, num_perm = MINHASH_PERMUTATIONS, shingle_size = SHINGLE_SIZE, seed = 0):
+  """Compute the exact hashes and MinHash signatures of a batch of documents.
+
+    Documents are compared as lowercased words, so differences in case and whitespace are ignored. 
+    The MinHash signature is computed over the document's shingles (runs of shingle_size words), 
+    the fraction of matching signature values of two documents estimates the Jaccard similarity of 
+    their shingles. Documents with fewer words than a shingle only match exact duplicates. 
+
+    All of the words of the batch are hashed at once, and the shingle hashes are rolled up from the 
+    word hashes, so there is no per-shingle Python code. 
+
+    Args:
+      texts (list of str): the document texts.
+      num_perm (int): the number of hash functions (values in each signature).
+      shingle_size (int): the number of words in each shingle.
+      seed (int): the seed of the hash functions, signatures are only comparable with the same seed.
+
+    Returns:
+      a numpy array of the exact hash of each document, and a (documents, num_perm) array 
+      of their MinHash signatures.
+  """
+  words = [text.lower().split() for text in texts]
+  lengths = np.array([len(w) for w in words], dtype = np.int64)
+  exact = pd.util.hash_array(np.array([" ".join(w) for w in words], dtype = object))
+  word_hashes = pd.util.hash_array(np.array([word for w in words for word in w], dtype = object))
+
+  # the shingle starting at each word, kept if it ends in the same document
+  n_starts = max(len(word_hashes) - shingle_size + 1, 0)
+  shingles = word_hashes[:n_starts].copy()
+  for i in range(1, shingle_size):
+    shingles = shingles * np.uint64(0x9E3779B97F4A7C15) + word_hashes[i:i + n_starts]
+  document_ids = np.repeat(np.arange(len(texts)), lengths)
+  valid = document_ids[:n_starts] == document_ids[shingle_size - 1:shingle_size - 1 + n_starts]
+  shingles, shingle_documents = shingles[valid], document_ids[:n_starts][valid]
+  counts = np.bincount(shingle_documents, minlength = len(texts))
+  has_shingles = counts > 0
+  starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[has_shingles]
+
+  rng = np.random.default_rng(seed)
+  multipliers = rng.integers(1, 2**63, size = num_perm, dtype = np.uint64) | np.uint64(1)
+  offsets = rng.integers(0, 2**63, size = num_perm, dtype = np.uint64)
+  signatures = np.empty((len(texts), num_perm), dtype = np.uint64)
+  for p in range(num_perm):
+    if len(starts):
+      signatures[has_shingles, p] = np.minimum.reduceat(mix_hashes(shingles * multipliers[p] + offsets[p]), starts)
+    # short documents get the signature of their exact hash, so they only match exact duplicates
+    signatures[~has_shingles, p] = mix_hashes(exact[~has_shingles] * multipliers[p] + offsets[p])
+  return exact, signatures
+
+def band_keys(signatures, bands):
+  """Hash each band of rows of the MinHash signatures into a locality-sensitive hashing bucket key.
+
+    Args:
+      signatures: a (documents, num_perm) array of MinHash signatures, num_perm must be a multiple of bands.
+      bands (int): the number of bands to split each signature into.
+
+    Returns:
+      a (documents, bands) array of bucket keys.
+  """
+  n, num_perm = signatures.shape
+  if num_perm % bands:
+    raise ValueError(f"The {num_perm} MinHash permutations can't be split into {bands} bands.")
+  rows = signatures.reshape(n, bands, num_perm // bands)
+  keys = rows[:, :, 0].copy()
+  for i in range(1, rows.shape[2]):
+    keys = mix_hashes(keys) + rows[:, :, i]
+  return keys
+
+def fingerprint_batch(texts, num_perm, bands, shingle_size, seed):
+  """Fingerprint a batch of documents in a worker process, see fingerprint_documents() and band_keys().
+  """
+  exact, signatures = fingerprint_documents(texts, num_perm, shingle_size, seed)
+  return exact, signatures, band_keys(signatures, bands)
+
+def bucket_pairs(keys, max_bucket = DUPLICATE_MAX_BUCKET):
+  """Pair up the documents which fall in the same bucket.
+
+    Every pair of documents in a bucket of up to max_bucket documents is returned. In larger buckets, 
+    each document is only paired with the max_bucket - 1 documents before it (in the order of their 
+    positions), so the number of pairs grows at most linearly with the number of documents, but 
+    near-duplicates far apart in a very common bucket can be missed (unless they share another bucket).
+
+    Args:
+      keys: a numpy array of the bucket key of each document.
+      max_bucket (int): the bucket size up to which all the pairs of documents are returned, 
+        2 pairs each document with the one before it, which is enough for exact hashes.
+
+    Returns:
+      two numpy arrays, the positions of the first and second document of each pair (first < second).
+  """
+  order = np.argsort(keys, kind = "stable")
+  sorted_keys = keys[order]
+  new_bucket = np.ones(len(keys), dtype = bool)
+  new_bucket[1:] = sorted_keys[1:] != sorted_keys[:-1]
+  # the position (in sorted order) of the start of each document's bucket
+  starts = np.flatnonzero(new_bucket)[np.cumsum(new_bucket) - 1]
+  positions = np.arange(len(keys))
+  first, second = [], []
+  for offset in range(1, max_bucket):
+    paired = positions[positions - offset >= starts]
+    if not len(paired):
+      break
+    first.append(order[paired - offset])
+    second.append(order[paired])
+  if not first:
+    return np.empty(0, dtype = np.int64), np.empty(0, dtype = np.int64)
+  return np.concatenate(first), np.concatenate(second)
+
+def candidate_pairs(exact, keys, max_bucket = DUPLICATE_MAX_BUCKET):
+  """Find the pairs of documents to compare when looking for duplicates.
+
+    Exact duplicates are chained together (see bucket_pairs()), and only one representative of 
+    each set of exact duplicates goes through the LSH buckets, so a page recaptured on every crawl 
+    adds no more candidates than a page crawled once. The pairs of each band are merged into the 
+    pairs found so far as they are made, rather than all at once.
+
+    Args:
+      exact: a numpy array of the exact hash of each document.
+      keys: a (documents, bands) array of the LSH bucket keys of each document, see band_keys().
+      max_bucket (int): the bucket size up to which all the pairs of documents are returned.
+
+    Returns:
+      the positions of the first and second documents of the exact duplicate pairs, and of the 
+      candidate near-duplicate pairs (first < second, each pair only once).
+  """
+  n = len(exact)
+  representatives = np.sort(np.unique(exact, return_index = True)[1])
+  codes = np.empty(0, dtype = np.int64)
+  for band in range(keys.shape[1]):
+    first, second = bucket_pairs(keys[representatives, band], max_bucket)
+    codes = np.union1d(codes, representatives[first].astype(np.int64) * n + representatives[second])
+  return bucket_pairs(exact, 2), (codes // n, codes % n)
+
+def signature_similarity(signatures, first, second, batch_size = CHUNKSIZE):
+  """Estimate the Jaccard similarity of pairs of documents from their MinHash signatures.
+
+    Args:
+      signatures: a (documents, num_perm) array of MinHash signatures (it can be memory-mapped).
+      first, second: numpy arrays of the positions of the documents of each pair.
+      batch_size (int): the number of pairs to compare at a time.
+
+    Returns:
+      a numpy array of the fraction of matching signature values of each pair.
+  """
+  similarity = np.empty(len(first))
+  for i in range(0, len(first), batch_size):
+    a, b = first[i:i + batch_size], second[i:i + batch_size]
+    similarity[i:i + batch_size] = (signatures[a] == signatures[b]).mean(axis = 1)
+  return similarity
+
+def load_stopwords(stopword_files = (), extra_stopwords = (), language = "english"):
+  """Build a set of stopwords, for quick lookups.
+
+    Args:
+      stopword_files (list of str): paths of text files of extra stopwords, one per line
+        (blank lines and lines starting with "#" are skipped).
+      extra_stopwords (list of str): any other stopwords.
+      language (str): the language of NLTK's stopword list to start from, or None for no list.
+
+    Returns:
+      a frozenset of the lowercased stopwords.
+  """
+  stop_words = set()
+  if language is not None:
+    import nltk
+    try:
+      stop_words.update(nltk.corpus.stopwords.words(language))
+    except LookupError:
+      nltk.download("stopwords", quiet = True)
+      stop_words.update(nltk.corpus.stopwords.words(language))
+  for stopword_file in stopword_files:
+    with open(stopword_file, encoding = "utf-8") as f:
+      stop_words.update(line.strip() for line in f if line.strip() and not line.startswith("#"))
+  stop_words.update(extra_stopwords)
+  return frozenset(word.lower() for word in stop_words)
+
+def tokenize_documents(documents, stop_words):
+  """Tokenize documents with gensim's simple_preprocess(), leaving out stopwords.
+
+    Args:
+      documents: an iterable of document texts.
+      stop_words (set of str): the stopwords to leave out, see load_stopwords().
+
+    Yields:
+      the remaining tokens of each document, joined by spaces.
+  """
+  from gensim.utils import simple_preprocess
+  for document in documents:
+    yield " ".join(word for word in simple_preprocess(str(document), deacc = True) if word not in stop_words)
+
+class TokenFile:
+  """A token file (see Analyzer.preprocess_text()), which can be iterated over many times 
+    without being loaded into memory. Each iteration yields the tokens of each document.
+  """
+  def __init__(self, tokens_file):
+    self.tokens_file = tokens_file
+
+  def __iter__(self):
+    with open(self.tokens_file, encoding = "utf-8") as f:
+      for line in f:
+        yield line.split()
+
+@instrumented
+def build_bow_corpus(tokens_file, corpus_file, no_below = None, no_above = None, keep_n = None):
+  """Build a bag-of-words corpus from a token file, and serialize it in Matrix Market format.
+
+    The token file is streamed twice, once to build the dictionary and once to write the corpus,
+    so neither the documents nor the corpus are held in memory. The dictionary is saved next to 
+    the corpus, as corpus_file + ".dict".
+
+    Args:
+      tokens_file (str): the path of the token file, one document per line.
+      corpus_file (str): the path of the Matrix Market file to write, ex. "models/corpus.mm".
+      no_below (int): if set, leave out tokens in fewer documents than this.
+      no_above (float): if set, leave out tokens in more than this fraction of the documents.
+      keep_n (int): if set, only keep this many of the most frequent tokens.
+
+    Returns:
+      the corpus (a gensim MmCorpus, streamed from disk) and the dictionary.
+  """
+  from gensim import corpora
+  dictionary = corpora.Dictionary(TokenFile(tokens_file))
+  if no_below is not None or no_above is not None or keep_n is not None:
+    dictionary.filter_extremes(no_below = no_below or 1, no_above = no_above or 1.0, keep_n = keep_n)
+  corpora.MmCorpus.serialize(corpus_file, (dictionary.doc2bow(tokens) for tokens in TokenFile(tokens_file)), 
+                             id2word = dictionary)
+  dictionary.save(corpus_file + ".dict")
+  return load_bow_corpus(corpus_file)
+
+def load_bow_corpus(corpus_file):
+  """Load a corpus saved by build_bow_corpus(), and its dictionary.
+  """
+  from gensim import corpora
+  return corpora.MmCorpus(corpus_file), corpora.Dictionary.load(corpus_file + ".dict")
+
+def lda_pass(model, corpus, n):
+  """Run pass n (from 0) of LDA training over the corpus, with the learning rate of a single LdaMulticore 
+    run with passes > n.
+
+    Each update() call counts its passes from 0, and gensim's learning rate is 
+    (offset + pass + updates / chunksize) ** -decay, where the updates are only counted during the first 
+    pass. So for the later passes, the offset is moved on by the pass number and the updates aren't 
+    counted, which gives the same schedule as training all of the passes in one call.
+  """
+  if n == 0:
+    model.update(corpus)
+    return
+  offset = model.offset
+  model.offset = offset + n
+  # the maximization steps of the later passes of a single run don't count their updates
+  model.do_mstep = lambda rho, other, extra_pass = False: type(model).do_mstep(model, rho, other, True)
+  try:
+    model.update(corpus)
+  finally:
+    model.offset = offset
+    del model.do_mstep
+
+def train_lda_model(corpus_file, num_topics, model_file, passes = LDA_PASSES, workers = None, **lda_params):
+  """Train an LDA model with gensim's LdaMulticore, checkpointing it after each pass over the corpus.
+
+    The corpus is streamed from disk on every pass. If training was interrupted, it resumes 
+    from the last checkpoint, as long as the corpus file and its dictionary (compared by their 
+    size, modification time and digest), the number of topics and the other settings are the same. 
+    Checkpoints alternate between two sets of files (model_file + ".checkpoint0" / "1"), 
+    so a checkpoint that was being saved when the run stopped is never the one resumed from. 
+    The learning rate decays over the passes as it would in a single run (see lda_pass()).
+
+    Args:
+      corpus_file (str): the path of a corpus saved by build_bow_corpus().
+      num_topics (int): the number of topics.
+      model_file (str): the path to save the trained model to.
+      passes (int): the number of passes over the corpus.
+      workers (int): the number of worker processes (default: one less than the number of cores).
+      **lda_params: any other LdaMulticore settings, ex. iterations or random_state.
+
+    Returns:
+      the trained model.
+  """
+  import json
+  from gensim.models import LdaMulticore
+  corpus, dictionary = load_bow_corpus(corpus_file)
+  lda_params = dict({"iterations": LDA_ITERATIONS, "chunksize": LDA_CHUNKSIZE, 
+                     "random_state": LDA_RANDOM_STATE}, **lda_params)
+  # a rebuilt corpus or dictionary invalidates the checkpoints, even at the same path
+  dictionary_file = corpus_file + ".dict"
+  settings = {"corpus": os.path.abspath(corpus_file), 
+              "corpus_file": {"stats": source_stats(corpus_file), "digest": source_digest(corpus_file)}, 
+              "dictionary": {"size": len(dictionary), "stats": source_stats(dictionary_file), 
+                             "digest": source_digest(dictionary_file)}, 
+              "num_topics": num_topics, "params": lda_params}
+  state_file = model_file + ".json"
+
+  done = 0
+  if os.path.exists(state_file):
+    with open(state_file) as f:
+      state = json.load(f)
+    if state["settings"] == json.loads(json.dumps(settings)):
+      model = LdaMulticore.load(state["checkpoint"])
+      done = state["passes"]
+      if done < passes:
+        print(f"Resuming training of {model_file} after {done} of {passes} passes")
+    else:
+      print(f"The corpus or settings of {model_file} changed since its last checkpoint, training from the start")
+  if done == 0:
+    model = LdaMulticore(id2word = dictionary, num_topics = num_topics, workers = workers, passes = 1, **lda_params)
+  # keep the workers in step with the caller's setting, if a checkpoint is resumed on another machine
+  model.workers = workers or max(1, (os.cpu_count() or 1) - 1)
+
+  for n in range(done, passes):
+    lda_pass(model, corpus, n)
+    checkpoint = f"{model_file}.checkpoint{n % 2}"
+    model.save(checkpoint)
+    with open(state_file + ".tmp", "w") as f:
+      json.dump({"settings": settings, "passes": n + 1, "checkpoint": checkpoint}, f)
+    os.replace(state_file + ".tmp", state_file)
+  model.save(model_file)
+  return model
+
+def lda_coherence(model, corpus_file, tokens_file = None, coherence = "c_v"):
+  """Score the topics of an LDA model.
+
+    Args:
+      model: the trained LDA model.
+      corpus_file (str): the path of the corpus the model was trained on.
+      tokens_file (str): the path of the token file the corpus was built from, needed for 
+        the sliding window measures (ex. "c_v"), but not for "u_mass".
+      coherence (str): the coherence measure, see gensim's CoherenceModel.
+
+    Returns:
+      the coherence score.
+  """
+  from gensim.models import CoherenceModel
+  corpus, dictionary = load_bow_corpus(corpus_file)
+  texts = TokenFile(tokens_file) if tokens_file is not None else None
+  return CoherenceModel(model = model, corpus = corpus, texts = texts, dictionary = dictionary, 
+                        coherence = coherence, processes = 1).get_coherence()
+
+def sweep_lda_model(corpus_file, tokens_file, num_topics, model_folder, passes, workers, coherence, lda_params):
+  """Train and score the LDA model for one topic count of a sweep (see Analyzer.sweep_topic_models()).
+  """
+  model_file = os.path.join(model_folder, f"lda_{num_topics}.model")
+  model = train_lda_model(corpus_file, num_topics, model_file, passes, workers, **lda_params)
+  return {"num_topics": num_topics, "coherence": lda_coherence(model, corpus_file, tokens_file, coherence), 
+          "model_file": model_file}
+
+def sentence_stats(corpus_file):
+  """Count the sentences and words of a corpus file (one sentence per line) in one streaming pass.
+
+    Returns:
+      a dict of the number of sentences and words, and the longest and mean sentence length in words.
+  """
+  sentences = words = longest = 0
+  with open(corpus_file, encoding = "utf-8") as f:
+    for line in f:
+      length = len(line.split())
+      sentences += 1
+      words += length
+      longest = max(longest, length)
+  return {"sentences": sentences, "words": words, "max_length": longest, 
+          "mean_length": words / sentences if sentences else 0}
+
+def parameter_grid(parameters):
+  """All combinations of parameter values, ex. {"window": [2, 5], "sg": [0, 1]} gives 4 dicts of settings.
+  """
+  from itertools import product
+  return [dict(zip(parameters, values)) for values in product(*parameters.values())]
+
+def word_vector_file_name(algorithm, params):
+  """The file name of a word vector model, from its algorithm and settings, ex. "w2v_vs_100_wn_5_sg_0.bin".
+  """
+  filename = algorithm + "".join(f"_{k}_{v}" for k, v in params.items()) + ".bin"
+  for name, abbreviation in MODEL_NAME_ABBREVIATIONS:
+    filename = filename.replace(name, abbreviation)
+  return filename
+
+def train_word_vector_model(algorithm, corpus_file, model_file, workers, params):
+  """Train one word vector model on a corpus file, and save its vectors in binary word2vec format.
+
+    gensim reads the corpus file directly (its corpus_file mode), each worker thread taking its 
+    own range of the file, so the corpus is never loaded into memory.
+
+    Returns:
+      the path of the saved model.
+  """
+  from gensim.models import Word2Vec, FastText
+  model_class = {"word2vec": Word2Vec, "fasttext": FastText}[algorithm]
+  model = model_class(corpus_file = corpus_file, workers = workers, **params)
+  # save under a temporary name, so that a half saved file is never taken for a finished model
+  model.wv.save_word2vec_format(model_file + ".tmp", binary = True)
+  os.replace(model_file + ".tmp", model_file)
+  return model_file
+
+@instrumented
+def train_word_vectors(corpus_file, model_folder, parameters, algorithms = WORD_VECTOR_ALGORITHMS, 
+                       max_parallel = None, overwrite = False):
+  """Train word vector models for every combination of settings, in parallel.
+
+    The models are trained in a pool of processes that share the cores, all reading the same 
+    corpus file, and each model is saved as soon as it is trained. Models that were already 
+    saved (ex. by an interrupted run) are skipped, unless overwrite is True.
+
+    Args:
+      corpus_file (str): the path of the corpus, one sentence per line with the tokens separated 
+        by spaces (ex. a token file from Analyzer.preprocess_text()).
+      model_folder (str): the folder to save the models in.
+      parameters (dict): lists of values for each setting, ex. {"vector_size": [50, 100], "window": [2, 5]}.
+      algorithms (list of str): the algorithms to train, "word2vec" and / or "fasttext".
+      max_parallel (int): the number of models to train at once (default: up to half of the cores).
+      overwrite (bool): retrain models that were already saved.
+
+    Returns:
+      a list of the paths of the models, in grid order.
+  """
+  from concurrent.futures import ProcessPoolExecutor, as_completed
+  os.makedirs(model_folder, exist_ok = True)
+  stats = sentence_stats(corpus_file)
+  print(f"{stats['sentences']} sentences, {stats['words']} words "
+        f"(longest: {stats['max_length']}, mean: {stats['mean_length']:.1f})")
+
+  models = [(algorithm, params, os.path.join(model_folder, word_vector_file_name(algorithm, params))) 
+            for algorithm in algorithms for params in parameter_grid(parameters)]
+  to_train = [m for m in models if overwrite or not os.path.exists(m[2])]
+  if not to_train:
+    return [model_file for algorithm, params, model_file in models]
+  cores = os.cpu_count() or 1
+  max_parallel = max_parallel or max(1, min(len(to_train), cores // 2))
+  # each model gets a share of the cores for its worker threads
+  workers = max(1, cores // max_parallel)
+  with ProcessPoolExecutor(max_workers = max_parallel) as pool:
+    jobs = [pool.submit(train_word_vector_model, algorithm, corpus_file, model_file, workers, params) 
+            for algorithm, params, model_file in to_train]
+    for done, job in enumerate(as_completed(jobs), 1):
+      print(f"[{done}/{len(jobs)}] saved {job.result()}")
+  return [model_file for algorithm, params, model_file in models]
+
+class TextExtractor(HTMLParser): 
+  """Collects the text of an HTML document, leaving out scripts and styles.
+  """
+  def __init__(self): 
+    super().__init__(convert_charrefs=True)
+    self.text = []
+    self.skip = 0
+
+  def handle_starttag(self, tag, attrs): 
+    if tag in ("script", "style"): 
+      self.skip += 1
+
+  def handle_endtag(self, tag): 
+    if tag in ("script", "style") and self.skip: 
+      self.skip -= 1
+
+  def handle_data(self, data): 
+    if not self.skip: 
+      self.text.append(data)
+
+class LinkExtractor(HTMLParser): 
+  """Collects the targets of the links (<a href="...">) of an HTML document.
+  """
+  def __init__(self): 
+    super().__init__(convert_charrefs=True)
+    self.links = []
+
+  def handle_starttag(self, tag, attrs): 
+    if tag == "a": 
+      href = dict(attrs).get("href")
+      if href: 
+        self.links.append(href.strip())
+
+def url_domain(url): 
+  """The host name of a URL, without "www." (like the AUT's extract_domain() and remove_prefix_www()).
+  """
+  from urllib.parse import urlsplit
+  try: 
+    domain = urlsplit(url).hostname or ""
+  except ValueError: 
+    return ""
+  return domain[4:] if domain.startswith("www.") else domain
+
+def html_to_text(html): 
+  """Extract the text from an HTML document, with whitespace collapsed (like the AUT's remove_html()).
+  """
+  parser = TextExtractor()
+  parser.feed(html)
+  parser.close()
+  return " ".join(" ".join(parser.text).split())
+
+def read_html_responses(source_file): 
+  """Stream the HTML web pages in a W/ARC file, one record at a time.
+
+  Only successful (200) responses for HTML pages are included, as with the AUT's webpages(). 
 
+  Args: 
+    source_file : the path of the W/ARC(.gz) file
+
+  Returns: 
+    a generator of (crawl_date, url, HTTP headers, decoded HTML) tuples, with 14 digit crawl dates.
+  """
+  from warcio.archiveiterator import ArchiveIterator
+  with open(source_file, "rb") as stream: 
+    for record in ArchiveIterator(stream, arc2warc=True): 
+      if record.rec_type != "response" or record.http_headers is None: 
+        continue
+      url = record.rec_headers.get_header("WARC-Target-URI") or ""
+      if record.http_headers.get_statuscode() != "200" or url.lower().endswith("robots.txt"): 
+        continue
+      content_type = record.http_headers.get_header("Content-Type") or ""
+      mime_type = content_type.split(";")[0].strip().lower()
+      if mime_type not in WEBPAGE_MIME_TYPES and not url.lower().split("?")[0].endswith(WEBPAGE_EXTENSIONS): 
+        continue
+
+      charset = re.search(r"charset=[\"']?([\w-]+)", content_type)
+      body = record.content_stream().read()
+      try: 
+        html = body.decode(charset.group(1) if charset else "utf-8", errors="replace")
+      except LookupError: 
+        html = body.decode("utf-8", errors="replace")
+      crawl_date = re.sub(r"\D", "", record.rec_headers.get_header("WARC-Date") or "")[:14]
+      yield crawl_date, url, record.http_headers, html
+
+def read_webpages(source_file, text_filters=0): 
+  """Stream the web pages in a W/ARC file, one record at a time (see read_html_responses()).
+
+  Args: 
+    source_file : the path of the W/ARC(.gz) file
+    text_filters : 0 to include the HTTP headers in the text content, 1 to leave them out
+
+  Returns: 
+    a generator of (crawl_date, domain, url, content) tuples, with 14 digit crawl dates.
+  """
+  for crawl_date, url, http_headers, html in read_html_responses(source_file): 
+    content = html_to_text(html)
+    if text_filters == 0: 
+      content = " ".join(http_headers.to_str().split()) + " " + content
+    yield crawl_date, url_domain(url), url, content
+
+def write_webpages(source_file, part_path, file_type="csv", text_filters=0): 
+  """Write the web pages in a W/ARC file to a derivative part file (see read_webpages()).
+
+  Args: 
+    source_file : the path of the W/ARC(.gz) file
+    part_path : the path of the part file to write
+    file_type : the file format of the part file, "csv" or "parquet"
+    text_filters : 0 to include the HTTP headers in the text content, 1 to leave them out
+
+  Returns: 
+    the number of web pages written.
+  """
+  import itertools
+  pages = read_webpages(source_file, text_filters)
+  count = 0
+  if file_type == "csv": 
+    import csv
+    with open(part_path, "w", newline="", encoding="utf-8") as f: 
+      writer = csv.writer(f, lineterminator="\n")
+      writer.writerow(DERIVATIVE_COLUMNS)
+      for page in pages: 
+        writer.writerow(page)
+        count += 1
+  else: 
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([(column, pa.string()) for column in DERIVATIVE_COLUMNS])
+    with pq.ParquetWriter(part_path, schema) as writer: 
+      for batch in iter(lambda: list(itertools.islice(pages, DERIVATIVE_BATCH_SIZE)), []): 
+        # the columns of the batch of rows
+        writer.write_table(pa.Table.from_arrays([pa.array(column, pa.string()) for column in zip(*batch)], 
+                                                schema=schema))
+        count += len(batch)
+  return count
+
+def read_links(source_file): 
+  """Stream the links of the web pages in a W/ARC file, one link at a time.
+
+  The web pages are the same as those of read_webpages(), relative links are resolved against the 
+  page's URL and only links to http(s) URLs are included, as with the AUT's webgraph(). 
+
+  Args: 
+    source_file : the path of the W/ARC(.gz) file
+
+  Returns: 
+    a generator of (crawl_date, source url, destination url) tuples, with 14 digit crawl dates.
+  """
+  from urllib.parse import urljoin
+  for crawl_date, url, http_headers, html in read_html_responses(source_file): 
+    parser = LinkExtractor()
+    parser.feed(html)
+    parser.close()
+    for href in parser.links: 
+      try: 
+        dest = urljoin(url, href)
+      except ValueError: 
+        continue
+      if dest.startswith(("http://", "https://")): 
+        yield crawl_date, url, dest
+
+def write_domain_graph(source_file, part_path): 
+  """Write the domain graph of a W/ARC file to a Parquet part file, see read_links() and GRAPH_COLUMNS.
+
+  Args: 
+    source_file : the path of the W/ARC(.gz) file
+    part_path : the path of the part file to write
+
+  Returns: 
+    the number of edges written.
+  """
+  import collections
+  import pyarrow as pa
+  import pyarrow.parquet as pq
+  counts = collections.Counter()
+  for crawl_date, src, dest in read_links(source_file): 
+    src_domain, dest_domain = url_domain(src), url_domain(dest)
+    if src_domain and dest_domain: 
+      counts[crawl_date[:8], src_domain, dest_domain] += 1
+  edges = list(zip(*counts.keys())) or [[], [], []]
+  pq.write_table(pa.table({"crawl_date": pa.array(edges[0], pa.string()), "src_domain": pa.array(edges[1], pa.string()), 
+                           "dest_domain": pa.array(edges[2], pa.string()), 
+                           "count": pa.array(list(counts.values()), pa.int64())}), part_path)
+  return len(counts)
+
+def merge_domain_graph(folder, output_path): 
+  """Merge the Parquet part files of a domain graph into a single file, adding up the counts of the same edges.
+
+  The edges are sorted by source and destination domain, so that the dictionary encoded domain 
+  columns compress well. 
+
+  Args: 
+    folder : the folder of part files, written by Spark or write_domain_graph()
+    output_path : the path of the merged Parquet file
+
+  Returns: 
+    the number of edges written.
+  """
+  import pyarrow.dataset as ds
+  import pyarrow.parquet as pq
+  table = ds.dataset(folder, format="parquet").to_table(columns=GRAPH_COLUMNS)
+  table = table.group_by(GRAPH_COLUMNS[:3]).aggregate([("count", "sum")])
+  # the order of the aggregate's columns depends on the pyarrow version, so pick them by name
+  table = table.select(GRAPH_COLUMNS[:3] + ["count_sum"]).rename_columns(GRAPH_COLUMNS)
+  table = table.sort_by([("src_domain", "ascending"), ("dest_domain", "ascending"), ("crawl_date", "ascending")])
+  pq.write_table(table, output_path)
+  return table.num_rows
 
 class DerivativeGenerator: 
     """Creates derivative files from W/ARCs. 
     
     This class contains all of the functions relating to derivative generation."""
-    def __init__(self):
+    def __init__(self, cores=None, memory=None, shuffle_partitions=None, config=None, backend="spark", workers=None):
         """ Initialize the dependencies for creating derivatives.
+
+        All DerivativeGenerators share one Spark session (see get_spark_session()), which is only 
+        started when the first derivative is generated, and then reused.
+
+        The "python" backend doesn't need Spark, a JVM or the AUT: it streams the W/ARC records 
+        with warcio, and processes the W/ARC files in parallel in a pool of processes. It supports 
+        text_filters 0 and 1, and is quicker to start and lighter on memory for small and medium jobs. 
+
+        Args: 
+            backend: "spark" to generate derivatives with the AUT, or "python" 
+            workers: the number of processes for the "python" backend (default: one per core)
+            cores: the number of local cores for Spark to use (default: all of them)
+            memory: the amount of memory for Spark to use, ex. "8g"
+            shuffle_partitions: the number of partitions Spark uses when shuffling data
+            config: a dict of any other Spark configuration settings
         """
-        # initialize the PySpark context
-        import findspark
-        findspark.init()
-        import pyspark
-        self.sc = pyspark.SparkContext()
+        if backend not in ("spark", "python"): 
+            raise ValueError(f"Unknown backend {backend!r}, use 'spark' or 'python'.")
+        self.spark_settings = {"cores": cores, "memory": memory, 
+                               "shuffle_partitions": shuffle_partitions, "config": config}
+        self.backend = backend
+        self.workers = workers
+
+    @property
+    def sc(self): 
+        """The shared SparkContext."""
+        return get_spark_session(**self.spark_settings).sparkContext
+
+    @property
+    def sqlContext(self): 
+        """An SQLContext for the shared Spark session, as used by the AUT."""
         from pyspark.sql import SQLContext
-        self.sqlContext = SQLContext(self.sc)
+        session = get_spark_session(**self.spark_settings)
+        return SQLContext(session.sparkContext, session)
 
+    @instrumented
     def create_csv_with_header(self, headers, datafile, outputfile): 
       """ Create a version of datafile with the specified headers. 
 
+      The rows of datafile are copied as bytes, without parsing them, using a zero-copy 
+      file copy where the operating system supports it.
+
       Args: 
         headers: a list of column headers in the desired order
         datafile: the path of the CSV file, without headers, to add headers to
         outputfile: the path of the desired output file 
       """
       import csv
-      with open(outputfile, "w", newline = "") as csvfile: 
-        writer = csv.writer(csvfile, delimiter=",")
-        writer.writerow(headers)
-        with open(datafile, "r") as datafile: 
-          reader = csv.reader(datafile)
-          for row in reader: 
-            writer.writerow(row)
+      import io
+      header = io.StringIO()
+      # Spark writes "\n" line endings, so use the same for the header
+      csv.writer(header, delimiter=",", lineterminator="\n").writerow(headers)
+      with open(outputfile, "wb") as csvfile: 
+        csvfile.write(header.getvalue().encode("utf-8"))
+        append_file(datafile, csvfile)
 
     # a messy first guess at derivative generation
-    def generate_derivative(self, source_file, output_folder, file_type="csv", text_filters=0):
-        """Create a text derivative file from the specified source file.
-
-        Create a text derivative from the specified W/ARC source file, using the output settings specified. 
+    @instrumented
+    def generate_derivative(self, source_file, output_folder, file_type="csv", text_filters=0, merge=True, 
+                            incremental=False):
+        """Create a text derivative file from the specified source file(s).
+
+        Create a text derivative from the specified W/ARC source file(s), using the output settings specified. 
+        All of the source files are processed together, in parallel, by Spark or the Python backend. 
+
+        A manifest of the processed W/ARC files and the derivative files produced from them is saved to 
+        _manifest.json in the output folder. In incremental mode, an existing derivative in the output 
+        folder is updated instead: only the W/ARC files which are new, or have changed since they were 
+        processed, are run through Spark, and the results are added to the derivative. 
         Args: 
-            source_file: the path to the W/ARC file to generatet the derivative from 
+            source_file: the path to the W/ARC file to generatet the derivative from, a glob pattern 
+                        (ex. "warcs/*.warc.gz") or a list of paths / patterns 
             output_folder: the name for the output folder to save the derivative into 
                         (Note: this is currently a relative path, the folder will be created as a 
                                 sub-folder of the working folder)
@@ -157,18 +2104,88 @@ class DerivativeGenerator:
                         0 : return the complete text content of each webpage (with HTML tags removed)
                         1 : return the complete text with HTTP headers removed 
                         2 : return the text with the boilerplate removed (boilerplate includes nav bars etc) 
+            merge: if True, the part files written by Spark are merged into a single derivative file. 
+                    If False, they are kept as a partitioned derivative in the output folder 
+                    (Parquet only, CSV derivatives are always merged). 
+            incremental: if True, update the derivative already in the output folder (if any) 
+                    with the new and changed W/ARC files. 
         """ 
+        import json
+        import shutil
+        if self.backend == "python" and text_filters not in (0, 1): 
+            raise ValueError("The python backend doesn't remove boilerplate, use text_filters 0 or 1, or the spark backend.")
+
+        source_files = expand_sources(source_file)
+        # name the derivative after the W/ARC file, if there is only one
+        if len(source_files) == 1: 
+            name = source_files[0].split("/")[-1].split(".")[0]
+        else: 
+            name = "derivative"
+
+        manifest_path = os.path.join(output_folder, "_manifest.json")
+        runs = []
+        spark_folder = output_folder
+        if incremental and os.path.exists(manifest_path): 
+            with open(manifest_path) as f: 
+                manifest = json.load(f)
+            if manifest["file_type"] != file_type or manifest["text_filters"] != text_filters: 
+                raise ValueError(f"The derivative in {output_folder} was created with file_type={manifest['file_type']} "
+                                 f"and text_filters={manifest['text_filters']}, it can only be updated with the same settings.")
+            name = manifest.get("name", name)
+            # manifests from before incremental mode describe a single run
+            runs = manifest.get("runs", [dict(manifest, run=0)])
+            source_files, runs = self.plan_incremental_run(source_files, runs, output_folder, name, file_type)
+            if not source_files: 
+                print("The derivative is up to date, there are no new or changed W/ARC files.")
+                return True
+            # Spark can't write into an existing folder, so write this run's results to a sub folder
+            spark_folder = os.path.join(output_folder, "_run")
+            if os.path.exists(spark_folder): 
+                shutil.rmtree(spark_folder)
+
+        if self.backend == "spark": 
+            self.write_parts_spark(source_files, spark_folder, file_type, text_filters)
+        else: 
+            self.write_parts_python(source_files, spark_folder, file_type, text_filters)
+
+        run = max([r["run"] for r in runs], default=-1) + 1
+        success, outputs, byte_range = self.collect_parts(spark_folder, output_folder, name, file_type, 
+                                                          merge or file_type == "csv", 
+                                                          run if incremental else None)
+        if spark_folder != output_folder: 
+            shutil.rmtree(spark_folder)
+        if success: 
+            runs.append({"run": run, "sources": [source_info(f) for f in source_files], 
+                         "outputs": outputs, "byte_range": byte_range})
+        elif incremental: 
+            # leave the failed run out of the derivative and the manifest, so that its W/ARC files 
+            # are processed again by the next incremental run
+            if byte_range is not None: 
+                os.truncate(os.path.join(output_folder, name + ".csv"), byte_range[0])
+            else: 
+                for output in outputs: 
+                    os.remove(os.path.join(output_folder, output["path"]))
+        else: 
+            # a partial derivative isn't recorded as processed
+            return success
+        with open(manifest_path, "w") as f: 
+            json.dump({"name": name, "file_type": file_type, "text_filters": text_filters, "runs": runs}, f, indent=2)
+        return success
+
+    @instrumented
+    def write_parts_spark(self, source_files, folder, file_type, text_filters): 
+        """Write the text of the web pages in the W/ARC files to part files in folder, with Spark and the AUT.
+        """
         # import the AUT (needs to be done after the PySpark set-up)
         from aut import WebArchive, remove_html, remove_http_header, extract_boilerplate
-        from pyspark.sql.functions import col, desc
 
-        # create our WebArchive object from the W/ARC file
-        archive = WebArchive(self.sc, self.sqlContext, source_file)
+        # create our WebArchive object from the W/ARC file(s), Spark accepts a comma separated list of paths
+        archive = WebArchive(self.sc, self.sqlContext, ",".join(source_files))
 
         if text_filters == 0: 
-            content = remove_html("content")
+            content = remove_html("content").alias("content")
         elif text_filters == 1: 
-            content = remove_html(remove_http_header("content"))
+            content = remove_html(remove_http_header("content")).alias("content")
         else: 
             content = extract_boilerplate(remove_http_header("content")).alias("content")
 
@@ -176,59 +2193,246 @@ class DerivativeGenerator:
             .select("crawl_date", "domain", "url", content) \
             .write \
             .option("timestampFormat", "yyyy/MM/dd HH:mm:ss ZZ") \
+            .option("header", "true") \
             .format(file_type) \
             .option("escape", "\"") \
             .option("encoding", "utf-8") \
-            .save(output_folder)
-
-        # rename the datafile to have a meaningful title, remove the success file
-        success = False
-        # the folder will contain exactly 2 files, a _SUCCESS file and the resulting datafile
-        for f in os.scandir(output_folder): 
-            if f.path.split("/")[-1] == "_SUCCESS": 
-                # indicate that the derivative was generated successfully
-                success = True
-                # remove the success indicator file
-                os.remove(f.path)
-            # for the datafile
-            if f.path.split(".")[-1] == file_type: 
-                source_file_name = source_file.split(".")[0]
-                source_file_name = source_file_name.split("/")[-1]
-                # add the appropriate headers
-                if file_type == "csv": 
-                  headers = []
-                  # for all text_filters between 0 and 2, we'll use the same header
-                  # if adding different derivatives, add the appropriate headers here! 
-                  if text_filters >= 0 and text_filters <= 2: 
-                    headers = ["crawl_date", "domain", "url", "content"]
-                  output_path = output_folder + source_file_name + ".csv"
-                  self.create_csv_with_header(headers, f.path, output_path)
-                  os.remove(f.path)
-                else:   
-                  os.rename(f.path, output_folder + source_file_name + "." + file_type)
+            .save(folder)
+
+    @instrumented
+    def write_parts_python(self, source_files, folder, file_type, text_filters): 
+        """Write the text of the web pages in the W/ARC files to part files in folder, without Spark.
+
+        Each W/ARC file is streamed into its own part file by a pool of processes, and the folder 
+        is laid out as Spark would (part-00000.csv, ..., and _SUCCESS if every file was processed). 
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        os.makedirs(folder)
+        success = True
+        with ProcessPoolExecutor(max_workers=self.workers) as pool: 
+            jobs = {source: pool.submit(write_webpages, source, os.path.join(folder, f"part-{i:05d}.{file_type}"), 
+                                        file_type, text_filters) 
+                    for i, source in enumerate(source_files)}
+            for source, job in jobs.items(): 
+                try: 
+                    job.result()
+                except Exception as e: 
+                    print(f"Unable to process {source}: {e}")
+                    success = False
+        if success: 
+            open(os.path.join(folder, "_SUCCESS"), "w").close()
+
+    @instrumented
+    def generate_link_graph(self, source_file, output_folder): 
+        """Create a domain graph derivative from the specified source file(s).
+
+        The links of the web pages are counted per source domain, destination domain and day, 
+        with Spark and the AUT's webgraph(), or with the Python backend, and saved as an edge list 
+        in a Parquet file (see GRAPH_COLUMNS) in the output folder, named after the W/ARC file if 
+        there is only one (ex. "example-domain-graph.parquet"). 
+        Load it for analysis with Analyzer.set_graph(). 
+
+        Args: 
+            source_file: the path to the W/ARC file, a glob pattern or a list of paths / patterns 
+            output_folder: the folder to save the domain graph into 
+
+        Returns: 
+            True if the domain graph was generated successfully.
+        """
+        import shutil
+        source_files = expand_sources(source_file)
+        name = source_files[0].split("/")[-1].split(".")[0] if len(source_files) == 1 else "links"
+        os.makedirs(output_folder, exist_ok=True)
+        # the part files are written to a sub folder, then merged into a single file
+        parts_folder = os.path.join(output_folder, "_run")
+        if os.path.exists(parts_folder): 
+            shutil.rmtree(parts_folder)
+
+        if self.backend == "spark": 
+            self.write_graph_parts_spark(source_files, parts_folder)
+        else: 
+            self.write_graph_parts_python(source_files, parts_folder)
+
+        success = os.path.exists(os.path.join(parts_folder, "_SUCCESS"))
+        if success: 
+            with stage("merge_domain_graph") as record: 
+                record["rows"] = merge_domain_graph(parts_folder, os.path.join(output_folder, f"{name}-domain-graph.parquet"))
+        shutil.rmtree(parts_folder)
         return success
 
+    @instrumented
+    def write_graph_parts_spark(self, source_files, folder): 
+        """Write the domain graph of the W/ARC files to Parquet part files in folder, with Spark and the AUT.
+        """
+        from aut import WebArchive, extract_domain, remove_prefix_www
+        from pyspark.sql.functions import col, substring
+
+        archive = WebArchive(self.sc, self.sqlContext, ",".join(source_files))
+        archive.webgraph() \
+            .select(substring(col("crawl_date"), 1, 8).alias("crawl_date"), 
+                    remove_prefix_www(extract_domain("src")).alias("src_domain"), 
+                    remove_prefix_www(extract_domain("dest")).alias("dest_domain")) \
+            .filter((col("src_domain") != "") & (col("dest_domain") != "")) \
+            .groupBy("crawl_date", "src_domain", "dest_domain") \
+            .count() \
+            .write \
+            .format("parquet") \
+            .save(folder)
+
+    @instrumented
+    def write_graph_parts_python(self, source_files, folder): 
+        """Write the domain graph of each W/ARC file to a Parquet part file in folder, without Spark.
+
+        The W/ARC files are processed by a pool of processes (see write_domain_graph()), and _SUCCESS 
+        is written if every file was processed, as with write_parts_python(). 
+        """
+        from concurrent.futures import ProcessPoolExecutor
+        os.makedirs(folder)
+        success = True
+        with ProcessPoolExecutor(max_workers=self.workers) as pool: 
+            jobs = {source: pool.submit(write_domain_graph, source, os.path.join(folder, f"part-{i:05d}.parquet")) 
+                    for i, source in enumerate(source_files)}
+            for source, job in jobs.items(): 
+                try: 
+                    job.result()
+                except Exception as e: 
+                    print(f"Unable to process {source}: {e}")
+                    success = False
+        if success: 
+            open(os.path.join(folder, "_SUCCESS"), "w").close()
+
+    @instrumented
+    def plan_incremental_run(self, source_files, runs, output_folder, name, file_type): 
+        """Work out which W/ARC files need to be processed to bring a derivative up to date.
+
+        W/ARC files that are new, or have changed since they were processed, need processing. 
+        The rows from a changed file can't be told apart from the others produced in the same run, 
+        so the results of that whole run are removed from the derivative, and all of its W/ARC 
+        files are processed again. 
+
+        Args: 
+            source_files: the W/ARC files the derivative should include 
+            runs: the runs recorded in the derivative's manifest 
+            output_folder: the folder of the derivative 
+            name: the name of the derivative file(s) 
+            file_type: the file format of the derivative, "csv" or "parquet" 
+
+        Returns: 
+            the list of W/ARC files to process, and the list of runs that were kept.
+        """
+        processed = {s["path"]: s for r in runs for s in r["sources"]}
+        changed = {f for f in source_files if f in processed and not source_unchanged(processed[f], f)}
+        affected = [r for r in runs if any(s["path"] in changed for s in r["sources"])]
+        kept = [r for r in runs if r not in affected]
+
+        to_process = [f for f in source_files if f not in processed or f in changed]
+        to_process += [s["path"] for r in affected for s in r["sources"] 
+                       if s["path"] not in to_process and os.path.exists(s["path"])]
+
+        if affected and file_type == "csv": 
+            # the rows of each run are a continuous range of bytes in the CSV file, keep the others
+            csv_path = os.path.join(output_folder, name + ".csv")
+            with open(csv_path, "rb") as f: 
+                header = f.readline()
+            with open(csv_path + ".tmp", "wb") as output: 
+                output.write(header)
+                for r in kept: 
+                    start, end = r.get("byte_range") or (len(header), os.path.getsize(csv_path))
+                    new_start = output.tell()
+                    append_file(csv_path, output, start, end - start)
+                    r["byte_range"] = [new_start, output.tell()]
+            os.replace(csv_path + ".tmp", csv_path)
+        else: 
+            for r in affected: 
+                for output in r["outputs"]: 
+                    if os.path.exists(os.path.join(output_folder, output["path"])): 
+                        os.remove(os.path.join(output_folder, output["path"]))
+        return to_process, kept
+
+    @instrumented
+    def collect_parts(self, spark_folder, output_folder, name, file_type, merge, run=None): 
+        """Tidy up the part files that Spark wrote to a folder.
+
+        Spark writes one part file per task, which are either merged into a single file named 
+        name.file_type, or renamed to name-00000.file_type, name-00001.file_type, ... 
+        For an incremental run, CSV rows are added to the existing name.csv, and Parquet files are 
+        named after the run (name-r0001.parquet, or name-r0001-00000.parquet, ...). 
+
+        Args: 
+            spark_folder: the folder Spark wrote the derivative to 
+            output_folder: the folder to save the derivative file(s) in 
+            name: the name to give the derivative file(s) 
+            file_type: the file format of the derivative, "csv" or "parquet" 
+            merge: whether or not to merge the part files into a single file 
+            run: the number of the incremental run, or None 
+
+        Returns: 
+            True if Spark reported that the derivative was generated successfully, a list of the 
+            derivative files (for the manifest), and for CSV files the range of bytes the rows take up.
+        """
+        # indicate whether the derivative was generated successfully, and remove Spark's other files
+        success = os.path.exists(os.path.join(spark_folder, "_SUCCESS"))
+        for f in os.scandir(spark_folder): 
+            if f.name == "_SUCCESS" or f.name.endswith(".crc"): 
+                os.remove(f.path)
+        parts = sorted(f.path for f in os.scandir(spark_folder) 
+                       if f.name.startswith("part-") and f.name.endswith("." + file_type))
+        if run is not None and file_type != "csv": 
+            name = f"{name}-r{run:04d}"
+        output_path = os.path.join(output_folder, name + "." + file_type)
+
+        byte_range = None
+        if file_type == "csv": 
+            start = os.path.getsize(output_path) if os.path.exists(output_path) else 0
+            merge_csv_parts(parts, output_path, append=run is not None)
+            if start == 0: 
+                # the rows start after the header
+                with open(output_path, "rb") as f: 
+                    start = len(f.readline())
+            byte_range = [start, os.path.getsize(output_path)]
+            outputs = [output_path]
+        elif not parts: 
+            outputs = []
+        elif len(parts) == 1: 
+            os.rename(parts[0], output_path)
+            outputs = [output_path]
+        elif merge and file_type == "parquet": 
+            merge_parquet_parts(parts, output_path)
+            outputs = [output_path]
+        else: 
+            outputs = [os.path.join(output_folder, f"{name}-{i:05d}.{file_type}") for i in range(len(parts))]
+            for part, output in zip(parts, outputs): 
+                os.rename(part, output)
+        outputs = [{"path": os.path.basename(f), "size": os.path.getsize(f)} for f in outputs]
+        return success, outputs, byte_range
+
     def display_derivative_creation_options(self): 
         """ Displays a form to set options for derivative file creation. 
 
-        Displays 4 form elements to select: 
-        - any W/ARC file from within the defined working folder to create a derivative of
+        Displays 6 form elements to select: 
+        - any W/ARC files from within the defined working folder to create a derivative of
+        - the derivative to create, the text of the web pages or the domain graph of their links
         - desired type of derivative (i.e. what content to include in the derivative)
         - the output folder for the derivative (will be created within the working directory)
         - the desired output file type (csv or parquet)
+        - whether to update an existing derivative with only the new / changed W/ARC files
 
-        Also displays a button which, on-click, will run generate_derivative(), 
-        passing in the settings specified in the form. 
+        Also displays a button which, on-click, will run generate_derivative() (or 
+        generate_link_graph()), passing in the settings specified in the form. 
         """
-        # file picker for W/ARC files in the specified folder
-        data_files = get_files(path, (".warc", ".arc", "warc.gz", ".arc.gz"))
-        file_options = widgets.Dropdown(description="W/ARC file:", options =  data_files)
+        # file picker for W/ARC files in the specified folder, several files can be selected at once
+        import ipywidgets as widgets
+        from IPython.display import display
+        data_files = index_files(path, (".warc", ".arc", "warc.gz", ".arc.gz"))
+        file_options = widgets.SelectMultiple(description="W/ARC files:", options = file_choices(data_files))
+        derivative_choice = widgets.Dropdown(description="Derivative:", options=["Web page text", "Domain graph"])
         out_text = widgets.Text(description="Output folder:", value="output/")
         format_choice = widgets.Dropdown(description="File type:",options=["csv", "parquet"], value="csv")
         # text content choices 
         content_options = ["All text content", "Text content without HTTP headers", "Text content without boilerplate"]
         content_choice = widgets.Dropdown(description="Content:", options=content_options)
         content_val = content_options.index(content_choice.value)
+        incremental_check = widgets.Checkbox(description="Only add new / changed W/ARCs", value=False)
         button = widgets.Button(description="Create derivative")
 
         # this function is defined here in order to keep the other form elements 
@@ -240,22 +2444,562 @@ class DerivativeGenerator:
             generate_derivative() to create a derivative file using the selected settings. 
             """
             content_options = ["All text content", "Text content without HTTP headers", "Text content without boilerplate"]
-            input_file = path + "/" + file_options.value
+            if not file_options.value: 
+                print("Please select at least one W/ARC file.")
+                return
+            input_file = [path + "/" + f for f in file_options.value]
             output_location = path + "/" + out_text.value
             content_val = content_options.index(content_choice.value)
             print("Creating derivative file... (this may take several minutes)")
-            if self.generate_derivative(input_file, output_location, format_choice.value, content_val):
+            if derivative_choice.value == "Domain graph": 
+                generated = self.generate_link_graph(input_file, output_location)
+            else: 
+                generated = self.generate_derivative(input_file, output_location, format_choice.value, content_val, 
+                                                     incremental=incremental_check.value)
+            if generated: 
                 print("Derivative generated, saved to: " + output_location)
             else: 
                 print("An error occurred while processing the W/ARC. Derivative file may not have been generated successfully.")
         button.on_click(btn_create_deriv)
         display(file_options)
+        display(derivative_choice)
         display(out_text)
         display(format_choice)
         display(content_choice)
+        display(incremental_check)
         display(button)
 
 
+class LinkGraph: 
+  """A directed graph of the links between domains, held as a sparse (CSR) adjacency matrix.
+
+    Row i of the matrix holds the links from nodes[i], column j the links to nodes[j], and 
+    the values are the numbers of links. 
+  """
+  def __init__(self, nodes, matrix): 
+    """
+      Args: 
+        nodes (pandas Index): the domain of each node.
+        matrix (scipy.sparse.csr_matrix): the (nodes, nodes) matrix of link counts.
+    """
+    self.nodes = nodes
+    self.matrix = matrix
+
+  @classmethod
+  def from_edges(cls, src, dest, counts = None, self_links = False): 
+    """Build a graph from an edge list, the counts of repeated edges (ex. on different days) are added up.
+
+      The domains are numbered with Arrow's dictionary encoding, so there is no per-edge Python code.
+
+      Args: 
+        src, dest: arrays (numpy, pandas or pyarrow) of the source and destination domain of each edge.
+        counts: an optional array of the number of links of each edge, 1 if None.
+        self_links (bool): whether to keep the links from domains to themselves (ex. site navigation).
+
+      Returns: 
+        a LinkGraph.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    from scipy.sparse import csr_matrix
+    def as_array(values): 
+      if isinstance(values, pa.ChunkedArray): 
+        values = values.combine_chunks()
+      elif not isinstance(values, pa.Array): 
+        values = pa.array(np.asarray(values, dtype = object), from_pandas = True)
+      return values
+    src, dest = as_array(src).cast(pa.string()), as_array(dest).cast(pa.string())
+    counts = as_array(counts).cast(pa.float64()) if counts is not None else pa.array(np.ones(len(src)))
+    valid = pc.and_(src.is_valid(), dest.is_valid())
+    src, dest, counts = src.filter(valid), dest.filter(valid), counts.filter(valid)
+
+    encoded = pa.concat_arrays([src, dest]).dictionary_encode()
+    codes = encoded.indices.to_numpy()
+    src_codes, dest_codes = codes[:len(src)], codes[len(src):]
+    weights = counts.to_numpy(zero_copy_only = False)
+    if not self_links: 
+      keep = src_codes != dest_codes
+      src_codes, dest_codes, weights = src_codes[keep], dest_codes[keep], weights[keep]
+    n = len(encoded.dictionary)
+    matrix = csr_matrix((weights, (src_codes, dest_codes)), shape = (n, n))
+    matrix.sum_duplicates()
+    return cls(pd.Index(encoded.dictionary.to_pandas(), name = "domain"), matrix)
+
+  def degrees(self): 
+    """The degree of each domain.
+
+      Returns: 
+        a pandas DataFrame of the number of domains linking to (in_degree) and linked from (out_degree) 
+        each domain, and the numbers of links to (in_links) and from (out_links) it.
+    """
+    return pd.DataFrame({"in_degree": np.diff(self.matrix.tocsc().indptr), "out_degree": np.diff(self.matrix.indptr), 
+                         "in_links": np.asarray(self.matrix.sum(axis = 0)).ravel().astype(np.int64), 
+                         "out_links": np.asarray(self.matrix.sum(axis = 1)).ravel().astype(np.int64)}, 
+                        index = self.nodes)
+
+  def pagerank(self, damping = PAGERANK_DAMPING, weighted = True, tolerance = PAGERANK_TOLERANCE, 
+               max_iterations = PAGERANK_ITERATIONS): 
+    """Compute the PageRank of each domain, by power iteration with sparse matrix products.
+
+      The rank of domains without outgoing links is spread evenly over all of the domains.
+
+      Args: 
+        damping (float): the probability of following a link rather than jumping to a random domain.
+        weighted (bool): if True, links are followed in proportion to their counts, 
+          otherwise each linked domain is equally likely.
+        tolerance (float): stop once the ranks change by less than this in total.
+        max_iterations (int): the maximum number of iterations.
+
+      Returns: 
+        a pandas Series of the PageRank of each domain, which add up to 1.
+    """
+    n = len(self.nodes)
+    if n == 0: 
+      return pd.Series(dtype = "float64", index = self.nodes, name = "pagerank")
+    matrix = self.matrix if weighted else (self.matrix != 0).astype(np.float64)
+    out_links = np.asarray(matrix.sum(axis = 1)).ravel()
+    dangling = out_links == 0
+    scale = np.divide(1.0, out_links, out = np.zeros(n), where = ~dangling)
+    transposed = matrix.T.tocsr()
+    ranks = np.full(n, 1.0 / n)
+    for _ in range(max_iterations): 
+      new_ranks = damping * (transposed @ (ranks * scale)) + (damping * ranks[dangling].sum() + 1 - damping) / n
+      change = np.abs(new_ranks - ranks).sum()
+      ranks = new_ranks
+      if change < tolerance: 
+        break
+    else: 
+      print(f"PageRank did not converge in {max_iterations} iterations.")
+    return pd.Series(ranks, index = self.nodes, name = "pagerank")
+
+  def components(self, connection = "weak"): 
+    """Find the connected components of the graph.
+
+      Args: 
+        connection (str): "weak" to connect domains linked in either direction, or "strong" 
+          to only connect domains which can reach each other by following links.
+
+      Returns: 
+        a pandas Series of the component of each domain, numbered from the largest (0) to the smallest.
+    """
+    from scipy.sparse.csgraph import connected_components
+    labels = connected_components(self.matrix, directed = True, connection = connection)[1]
+    order = np.argsort(-np.bincount(labels), kind = "stable")
+    renumbered = np.empty_like(order)
+    renumbered[order] = np.arange(len(order))
+    return pd.Series(renumbered[labels], index = self.nodes, name = "component")
+
+@instrumented
+def read_link_graph(graphfile, start_date = None, end_date = None, self_links = False): 
+  """Read a domain graph derivative into a LinkGraph.
+
+    Works for the Parquet domain graphs of DerivativeGenerator.generate_link_graph() (files or folders of 
+    part files), and for CSV domain graphs such as ARCH's domain-graph.csv. Only the edge columns are read.
+
+    Args: 
+      graphfile (str): the path to the domain graph.
+      start_date: an optional date (str or datetime), the earliest crawl_date to keep.
+      end_date: an optional date (str or datetime), the latest crawl_date to keep.
+      self_links (bool): whether to keep the links from domains to themselves.
+
+    Returns: 
+      a LinkGraph.
+  """
+  import pyarrow as pa
+  import pyarrow.compute as pc
+  import pyarrow.dataset as ds
+  dataset = ds.dataset(graphfile, format = derivative_format(graphfile))
+  names = [ARCH_GRAPH_COLUMNS.get(c, c) for c in dataset.schema.names]
+  columns = [c for c, name in zip(dataset.schema.names, names) if name in GRAPH_COLUMNS]
+  table = dataset.to_table(columns = columns).rename_columns([ARCH_GRAPH_COLUMNS.get(c, c) for c in columns])
+
+  if (start_date is not None or end_date is not None) and "crawl_date" in table.column_names: 
+    # compare the days as 8 digit strings, whatever the layout of the crawl dates
+    days = pc.utf8_slice_codeunits(pc.replace_substring_regex(table["crawl_date"].cast(pa.string()), r"\D", ""), 0, 8)
+    mask = pc.is_valid(days)
+    if start_date is not None: 
+      mask = pc.and_(mask, pc.greater_equal(days, pd.Timestamp(start_date).strftime("%Y%m%d")))
+    if end_date is not None: 
+      mask = pc.and_(mask, pc.less_equal(days, pd.Timestamp(end_date).strftime("%Y%m%d")))
+    table = table.filter(mask)
+  counts = table["count"] if "count" in table.column_names else None
+  return LinkGraph.from_edges(table["src_domain"], table["dest_domain"], counts, self_links)
+
+def tokenize_text(text): 
+  """Split a text into lowercased words, as they are indexed by TextIndex.
+  """
+  return re.findall(TOKEN_PATTERN, text.lower())
+
+def gather_ranges(values, starts, ends): 
+  """Concatenate values[starts[i]:ends[i]] for each i, without a Python loop.
+  """
+  lengths = ends - starts
+  total = int(lengths.sum())
+  if total == 0: 
+    return np.asarray(values[:0])
+  shifts = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+  return np.asarray(values[np.arange(total) + shifts])
+
+def sorted_isin(values, sorted_values): 
+  """Like np.isin(), for a sorted array to look the values up in, which saves sorting it.
+  """
+  if not len(sorted_values): 
+    return np.zeros(len(values), dtype = bool)
+  found = np.minimum(np.searchsorted(sorted_values, values), len(sorted_values) - 1)
+  return np.asarray(sorted_values[found]) == values
+
+def write_index_segment(segment_folder, texts, first_doc, max_term_bytes = MAX_TERM_BYTES): 
+  """Write the inverted index of a batch of documents to a segment folder (see TextIndex).
+
+    The postings are built with array operations: every word of the batch is numbered at once 
+    (pandas' factorize), and a stable sort by term groups the word positions into postings, which 
+    stay sorted by document and position. 
+
+    Args: 
+      segment_folder (str): the folder to write the segment's arrays to.
+      texts (list of str): the text of each document.
+      first_doc (int): the number of the first document, the others are numbered from it.
+      max_term_bytes (int): words longer than this (in UTF-8) are left out of the index.
+
+    Returns: 
+      the number of terms in the segment.
+  """
+  tokens = [tokenize_text(text) for text in texts]
+  lengths = np.array([len(t) for t in tokens], dtype = np.int64)
+  codes, words = pd.factorize(np.array([word for t in tokens for word in t], dtype = object))
+  encoded = [word.encode("utf-8") for word in words]
+  indexed = np.array([len(word) <= max_term_bytes for word in encoded], dtype = bool)
+  terms = np.array([word for word, keep in zip(encoded, indexed) if keep], dtype = f"S{max_term_bytes}")
+  order = np.argsort(terms, kind = "stable")
+  terms = terms[order]
+  term_numbers = np.full(len(words), -1, dtype = np.int64)
+  term_numbers[np.flatnonzero(indexed)[order]] = np.arange(len(terms))
+
+  term_ids = term_numbers[codes]
+  docs = np.repeat(np.arange(first_doc, first_doc + len(texts), dtype = np.int64), lengths)
+  positions = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+  kept = term_ids >= 0
+  order = np.argsort(term_ids[kept], kind = "stable")
+  term_ids, docs, positions = term_ids[kept][order], docs[kept][order], positions[kept][order]
+
+  # a posting is the positions of a term in a document
+  new_posting = np.ones(len(term_ids), dtype = bool)
+  new_posting[1:] = (term_ids[1:] != term_ids[:-1]) | (docs[1:] != docs[:-1])
+  posting_starts = np.flatnonzero(new_posting)
+  os.makedirs(segment_folder, exist_ok = True)
+  arrays = {"terms": terms, 
+            "term_offsets": np.searchsorted(term_ids[posting_starts], np.arange(len(terms) + 1)).astype(np.int64), 
+            "docs": docs[posting_starts].astype(np.uint32), 
+            "position_offsets": np.append(posting_starts, len(positions)).astype(np.int64), 
+            "positions": positions.astype(np.uint32)}
+  for name, array in arrays.items(): 
+    np.save(os.path.join(segment_folder, name + ".npy"), array)
+  return len(terms)
+
+def parse_query(query): 
+  """Parse a search query into a tree of (operation, ...) tuples, see TextIndex.search().
+
+    Words are combined with AND (which is implied between words), OR and NOT, and grouped with 
+    parentheses. Text in double quotes is a phrase, so is a word which splits into several words 
+    (ex. e-mail). 
+  """
+  parts = re.findall(r'"[^"]*"|\(|\)|[^\s()"]+', query)
+  position = 0
+
+  def peek(): 
+    return parts[position] if position < len(parts) else None
+
+  def take(): 
+    nonlocal position
+    position += 1
+    return parts[position - 1]
+
+  def parse_or(): 
+    node = parse_and()
+    while peek() == "OR": 
+      take()
+      node = ("or", node, parse_and())
+    return node
+
+  def parse_and(): 
+    node = parse_not()
+    while peek() not in (None, ")", "OR"): 
+      if peek() == "AND": 
+        take()
+      node = ("and", node, parse_not())
+    return node
+
+  def parse_not(): 
+    if peek() == "NOT": 
+      take()
+      return ("not", parse_not())
+    return parse_atom()
+
+  def parse_atom(): 
+    part = take() if peek() is not None else None
+    if part == "(": 
+      node = parse_or()
+      if peek() != ")": 
+        raise ValueError(f"Unbalanced parentheses in the query {query!r}.")
+      take()
+      return node
+    if part is None or part in (")", "AND", "OR"): 
+      raise ValueError(f"The query {query!r} is incomplete.")
+    words = tokenize_text(part.strip('"'))
+    if not words: 
+      raise ValueError(f"{part} in the query {query!r} doesn't contain any words.")
+    return ("phrase", words) if len(words) > 1 else ("term", words[0])
+
+  if not parts: 
+    raise ValueError("The query is empty.")
+  tree = parse_or()
+  if peek() is not None: 
+    raise ValueError(f"Unbalanced parentheses in the query {query!r}.")
+  return tree
+
+class TextIndex: 
+  """An on-disk inverted index of the text content of derivatives, for searching them without loading the text.
+
+    The index is a folder of segments, each of which indexes up to INDEX_SEGMENT_SIZE documents 
+    (see write_index_segment()), with NumPy arrays which are memory-mapped when the index is opened: 
+    the sorted terms, the postings (documents) of each term and the word positions of each posting. 
+    The crawl_date, domain and url of the documents, and the derivative row they come from, are kept 
+    in a Parquet file per segment. _manifest.json lists the segments and the indexed derivatives, so 
+    that new and changed derivatives can be added later (see add()). 
+  """
+  def __init__(self, index_folder): 
+    """
+      Args: 
+        index_folder (str): the folder of the index, which is created if it doesn't exist.
+    """
+    import json
+    self.folder = index_folder
+    self.manifest_path = os.path.join(index_folder, "_manifest.json")
+    if os.path.exists(self.manifest_path): 
+      with open(self.manifest_path) as f: 
+        self.manifest = json.load(f)
+    else: 
+      self.manifest = {"documents": 0, "max_term_bytes": MAX_TERM_BYTES, "segments": [], "sources": []}
+    self.segments = [self.open_segment(segment) for segment in self.manifest["segments"]]
+    self.document_info = None
+
+  def open_segment(self, segment): 
+    """Memory-map the arrays of a segment, described by its manifest entry.
+    """
+    folder = os.path.join(self.folder, segment["name"])
+    arrays = {name: np.load(os.path.join(folder, name + ".npy"), mmap_mode = "r") 
+              for name in ("terms", "term_offsets", "docs", "position_offsets", "positions")}
+    return dict(segment, **arrays)
+
+  def save_manifest(self): 
+    import json
+    with open(self.manifest_path + ".tmp", "w") as f: 
+      json.dump(self.manifest, f, indent = 2)
+    os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+  @instrumented
+  def add(self, datafile, chunksize = CHUNKSIZE, segment_size = INDEX_SEGMENT_SIZE): 
+    """Add derivatives to the index, streaming through each of them once.
+
+      Derivatives which were already indexed are skipped if they haven't changed. If they have, 
+      the documents indexed from them are marked as deleted, and they are indexed again. 
+
+      Args: 
+        datafile: the path to a derivative file (or folder of part files), a glob pattern or a list of them.
+        chunksize (int): the number of rows to read at a time from the derivative.
+        segment_size (int): the number of documents in each segment.
+
+      Returns: 
+        the number of documents added.
+    """
+    added = 0
+    for source in expand_sources(datafile): 
+      source = os.path.abspath(source)
+      indexed = [s for s in self.manifest["sources"] if s["path"] == source and not s["deleted"]]
+      if indexed and source_unchanged(indexed[0], source): 
+        print(f"{source} is already indexed.")
+        continue
+      for s in indexed: 
+        s["deleted"] = True
+
+      first_doc = self.manifest["documents"]
+      source_id = len(self.manifest["sources"])
+      batch = []
+      def write_segment(): 
+        documents = pd.concat(batch)
+        name = f"segment-{len(self.manifest['segments']):05d}"
+        first = self.manifest["documents"]
+        with stage("write_index_segment") as record: 
+          write_index_segment(os.path.join(self.folder, name), documents["content"].fillna("").astype(str).tolist(), 
+                              first, self.manifest["max_term_bytes"])
+          record["rows"] = len(documents)
+        info = pd.DataFrame({"doc": np.arange(first, first + len(documents)), "source": source_id, 
+                             "row": documents.index.to_numpy()})
+        for column in COLLECTION_COLUMNS: 
+          info[column] = documents[column].to_numpy() if column in list(documents) else None
+        info["domain"] = info["domain"].astype(str)
+        info.to_parquet(os.path.join(self.folder, name, "documents.parquet"), index = False)
+        segment = {"name": name, "first_doc": first, "documents": len(documents)}
+        self.manifest["segments"].append(segment)
+        self.manifest["documents"] += len(documents)
+        self.segments.append(self.open_segment(segment))
+        batch.clear()
+
+      position = 0
+      for chunk in read_chunks(source, ["content"] + COLLECTION_COLUMNS, chunksize): 
+        # number the rows as they are in the derivative
+        chunk.index = pd.RangeIndex(position, position + len(chunk))
+        position += len(chunk)
+        while len(chunk): 
+          needed = segment_size - sum(len(b) for b in batch)
+          batch.append(chunk.iloc[:needed])
+          chunk = chunk.iloc[needed:]
+          if sum(len(b) for b in batch) == segment_size: 
+            write_segment()
+      if batch: 
+        write_segment()
+
+      info = source_info(source)
+      info.update({"first_doc": first_doc, "last_doc": self.manifest["documents"], "deleted": False})
+      self.manifest["sources"].append(info)
+      self.save_manifest()
+      self.document_info = None
+      added += self.manifest["documents"] - first_doc
+      print(f"Indexed {self.manifest['documents'] - first_doc} documents of {source}.")
+    return added
+
+  def documents(self): 
+    """The crawl_date, domain, derivative and row of every indexed document (without the urls), 
+      loaded once and kept in memory for filtering search results.
+
+      Returns: 
+        a pandas DataFrame with a row per document, in document order.
+    """
+    if self.document_info is None: 
+      frames = [pd.read_parquet(os.path.join(self.folder, segment["name"], "documents.parquet"), 
+                                columns = ["source", "row", "crawl_date", "domain"]) 
+                for segment in self.manifest["segments"]]
+      info = pd.concat(frames, ignore_index = True) if frames else \
+        pd.DataFrame({"source": [], "row": [], "crawl_date": pd.to_datetime([]), "domain": []})
+      info["domain"] = info["domain"].astype("category")
+      self.document_info = info
+    return self.document_info
+
+  def postings(self, segment, word): 
+    """The range of a word's postings in a segment, (0, 0) if it isn't in the segment.
+    """
+    key = word.encode("utf-8")
+    terms = segment["terms"]
+    if len(key) > terms.dtype.itemsize: 
+      return 0, 0
+    i = int(np.searchsorted(terms, key))
+    if i == len(terms) or terms[i] != key: 
+      return 0, 0
+    return int(segment["term_offsets"][i]), int(segment["term_offsets"][i + 1])
+
+  def term_docs(self, word): 
+    """The documents containing a word, sorted.
+    """
+    parts = []
+    for segment in self.segments: 
+      start, end = self.postings(segment, word)
+      parts.append(np.asarray(segment["docs"][start:end], dtype = np.int64))
+    return np.concatenate(parts) if parts else np.array([], dtype = np.int64)
+
+  def phrase_docs(self, words): 
+    """The documents containing the words one after another, sorted.
+    """
+    parts = []
+    for segment in self.segments: 
+      ranges = [self.postings(segment, word) for word in words]
+      docs, offsets, positions = segment["docs"], segment["position_offsets"], segment["positions"]
+      candidates = None
+      for start, end in ranges: 
+        word_docs = np.asarray(docs[start:end])
+        candidates = word_docs if candidates is None else np.intersect1d(candidates, word_docs)
+      if candidates is None or not len(candidates): 
+        continue
+      # the documents where word i is at position p + i for every word i, for some p, checked 
+      # with (document, position) keys, which are sorted as the postings are
+      matches = None
+      for i, (start, end) in enumerate(ranges): 
+        selected = start + np.flatnonzero(sorted_isin(np.asarray(docs[start:end]), candidates))
+        starts, ends = np.asarray(offsets[selected]), np.asarray(offsets[selected + 1])
+        places = gather_ranges(positions, starts, ends).astype(np.int64) - i
+        owners = np.repeat(np.asarray(docs[selected], dtype = np.int64), ends - starts)
+        keys = ((owners << 32) + places)[places >= 0]
+        matches = keys if matches is None else matches[sorted_isin(matches, keys)]
+        candidates = np.unique(matches >> 32)
+      parts.append(candidates)
+    return np.concatenate(parts) if parts else np.array([], dtype = np.int64)
+
+  def evaluate(self, node): 
+    """The documents matching a parsed query (see parse_query()), sorted.
+    """
+    operation = node[0]
+    if operation == "term": 
+      return self.term_docs(node[1])
+    if operation == "phrase": 
+      return self.phrase_docs(node[1])
+    if operation == "not": 
+      return np.setdiff1d(np.arange(self.manifest["documents"]), self.evaluate(node[1]), assume_unique = True)
+    if operation == "and" and node[2][0] == "not": 
+      return np.setdiff1d(self.evaluate(node[1]), self.evaluate(node[2][1]), assume_unique = True)
+    left, right = self.evaluate(node[1]), self.evaluate(node[2])
+    if operation == "and": 
+      return np.intersect1d(left, right, assume_unique = True)
+    return np.union1d(left, right)
+
+  @instrumented
+  def search(self, query, start_date = None, end_date = None, domains = None, limit = None): 
+    """Find the documents matching a query, without reading the text of the derivatives.
+
+      Queries combine words with AND (implied between words), OR and NOT, grouped with parentheses, 
+      and phrases in double quotes, ex. '"climate change" (flood OR drought) NOT sports'. 
+      Words are matched ignoring case. 
+
+      Args: 
+        query (str): the query.
+        start_date: an optional date (str or datetime), the first day of the crawl_dates to match.
+        end_date: an optional date (str or datetime), the last day of the crawl_dates to match (inclusive).
+        domains (list of str): an optional list of the domains to match.
+        limit (int): the maximum number of documents to return, all of them if None.
+
+      Returns: 
+        a pandas DataFrame of the matching documents, indexed by document number, with their 
+        crawl_date, domain, url, and the derivative (datafile) and row they come from.
+    """
+    docs = self.evaluate(parse_query(query))
+    info = self.documents()
+    keep = np.ones(len(docs), dtype = bool)
+    for source in self.manifest["sources"]: 
+      if source["deleted"]: 
+        keep &= (docs < source["first_doc"]) | (docs >= source["last_doc"])
+    dates = info["crawl_date"].to_numpy()[docs]
+    start, end = day_bounds(start_date, end_date)
+    if start is not None: 
+      keep &= dates >= start.to_datetime64()
+    if end is not None: 
+      keep &= dates < end.to_datetime64()
+    if domains is not None: 
+      keep &= info["domain"].iloc[docs].isin(list(domains)).to_numpy()
+    docs = docs[keep][:limit]
+
+    # the urls are only read for the segments with matches
+    results = info.iloc[docs].copy()
+    results.index = pd.Index(docs, name = "doc")
+    first_docs = np.array([segment["first_doc"] for segment in self.manifest["segments"]])
+    urls = np.empty(len(docs), dtype = object)
+    segment_of = np.searchsorted(first_docs, docs, side = "right") - 1
+    for s in np.unique(segment_of): 
+      segment = self.manifest["segments"][s]
+      selected = segment_of == s
+      table = pd.read_parquet(os.path.join(self.folder, segment["name"], "documents.parquet"), columns = ["url"])
+      urls[selected] = table["url"].to_numpy()[docs[selected] - segment["first_doc"]]
+    results["url"] = urls
+    results["datafile"] = [self.manifest["sources"][s]["path"] for s in results["source"]]
+    return results[["crawl_date", "domain", "url", "datafile", "row"]]
+
 class Analyzer: 
     
     """ Tools for analyzing W/ARC derivatives.
@@ -263,48 +3007,131 @@ class Analyzer:
     def __init__(self): 
         # initialize the data attribute to None -- should possibly be an empty dataframe? consult with appropriate design patterns
         self.data = None
+        self.datafile = None
+        self.data_filter = {}
+        self.cache = cache
         self.number_LDA_Topics = None
-        
-    def set_data(self, datafile): 
-      """ Sets the data attribute for the Analyzer. 
-
-      Parses columns to appropriate types if applicable. 
-
-      Args: 
-        datafile (str): the path to the datafile to analyze. 
+        # the labels of the rows of data which are duplicates of other rows, see find_duplicates()
+        self.duplicates = None
+        # the domain graph loaded with set_graph(), and the file and filters it was loaded with
+        self.graph = None
+        self.graphfile = None
+        self.graph_filter = {}
+        # the full-text index of the data, see build_text_index()
+        self.text_index = None
+
+    @instrumented
+    def set_data(self, datafile, columns = None, chunksize = CHUNKSIZE, start_date = None, end_date = None, domains = None):
+      """ Sets the data attribute for the Analyzer.
+
+      Parses columns to appropriate types if applicable.
+
+      CSV, Parquet and Arrow IPC derivatives are supported, as well as folders of
+      Parquet / Arrow part files (ex. a partitioned derivative written by Spark) and 
+      folders of CSV files (ex. the output folder of generate_derivative()).
+
+      If columns are specified, only those columns are read from the datafile,
+      in chunks of chunksize rows, and stored with compact types (categorical domain,
+      datetime crawl_date). This keeps the large content column out of memory, it can be
+      added later on with load_content().
+
+      If a date range or domains are specified, only the matching rows are kept. For
+      Parquet and Arrow derivatives the filter is pushed down to the reader, so that
+      row groups which can't match are skipped instead of being parsed.
+
+      Args:
+        datafile (str): the path to the datafile (or folder of datafiles) to analyze.
+        columns (list of str): an optional list of the columns to load,
+          ex. COLLECTION_COLUMNS. If None, the complete datafile is loaded.
+        chunksize (int): the number of rows to read at a time from a CSV file when
+          columns or filters are specified.
+        start_date: an optional date (str or datetime), the first day of the crawl_dates to keep.
+        end_date: an optional date (str or datetime), the last day of the crawl_dates to keep (inclusive).
+        domains (list of str): an optional list of the domains to keep.
       """
-      self.data = pd.read_csv(datafile)
-      
-      # if the crawl_date column is included on the frame, make it a date
-      if "crawl_date" in list(self.data): 
-        # currently pandas is not doing a great job of auto-detecting the date format correctly
-        # temporarily, this code is included to correctly detect and parse the date formats that we have tested on 
-        # this process should be made more robust in the future
-        # get the first date, convert to str
-        date = str(self.data['crawl_date'].iloc[0])
-        if re.match(r"^[0-9]+$", date): 
-          if len(date) == 14: # format='%Y%m%d%H%M%S'
-            self.data['crawl_date'] = pd.to_datetime(self.data['crawl_date'], format = '%Y%m%d%H%M%S')
-          elif len(date) == 8: # format='%Y%m%d'
-            self.data['crawl_date'] = pd.to_datetime(self.data['crawl_date'], format = '%Y%m%d')
-          else: # hope that pandas figures it out 
-            self.data['crawl_date']= pd.to_datetime(self.data['crawl_date'])
-        else: 
-           self.data['crawl_date']= pd.to_datetime(self.data['crawl_date'])
-
-    def load_data(self):
-        """Load a datafile to work with. 
+      self.datafile = datafile
+      self.data_filter = {"start_date": start_date, "end_date": end_date, "domains": domains}
+      self.duplicates = None
+      file_format = derivative_format(datafile)
+      if file_format != "csv":
+        self.data = read_dataset(datafile, file_format, columns, **self.data_filter)
+        return
+
+      filtered = any(v is not None for v in self.data_filter.values())
+      if columns is None and not filtered:
+        with stage("read_csv") as record:
+          files = csv_files(datafile)
+          self.data = pd.read_csv(files[0]) if len(files) == 1 else \
+              pd.concat([pd.read_csv(f) for f in files], ignore_index = True)
+          record["rows"] = len(self.data)
+        # if the crawl_date column is included on the frame, make it a date
+        if "crawl_date" in list(self.data):
+          self.data["crawl_date"] = parse_crawl_dates(self.data["crawl_date"])
+        return
+
+      with stage("read_chunks") as record:
+        frames = [filter_rows(chunk, **self.data_filter) for chunk in read_chunks(datafile, columns, chunksize)]
+        record["rows"] = sum(len(f) for f in frames)
+      if not frames:
+        self.data = pd.read_csv(csv_files(datafile)[0], usecols = columns)
+        return
+      # categoricals with different categories can't be concatenated directly,
+      # so combine the categories of each chunk first
+      categoricals = [c for c in list(frames[0]) if isinstance(frames[0][c].dtype, pd.CategoricalDtype)]
+      data = pd.concat([f.drop(columns = categoricals) for f in frames])
+      for c in categoricals:
+        data[c] = union_categoricals([f[c] for f in frames]).remove_unused_categories()
+      self.data = data[list(frames[0])]
+
+    @instrumented
+    def load_content(self):
+      """ Adds the content column to the data, if it was not loaded by set_data().
+
+      The content is read from the datafile, using the same filters that were
+      passed to set_data(), and aligned with the rows that are already loaded.
+
+      Returns:
+        the content column of the data.
+      """
+      if "content" not in list(self.data):
+        file_format = derivative_format(self.datafile)
+        if file_format == "csv":
+          # the CSV chunks keep their row numbers as the index, so only keep the loaded rows
+          reader = read_csv_chunks(self.datafile, ["content"])
+          content = pd.concat(chunk["content"][chunk.index.isin(self.data.index)] for chunk in reader)
+          self.data["content"] = content.reindex(self.data.index)
+        else:
+          # reading with the same filters returns the rows in the same order
+          content = read_dataset(self.datafile, file_format, ["content"] + FILTER_COLUMNS, **self.data_filter)
+          self.data["content"] = content["content"].values
+      return self.data["content"]
+
+    def load_data(self, columns = None):
+        """Load a datafile to work with.
+
+        Args:
+          columns (list of str): an optional list of the columns to load, passed on to set_data().
+            Use COLLECTION_COLUMNS to leave the text content out of memory.
         """
-        # display the options available in the working directory
-        # Parquet files are not currently supported, if/when they are, add '".parquet", ".pqt"' to the file ending options 
+        # display the options available in the working directory,
+        # folders of Parquet / Arrow part files are listed as a single option
+        import ipywidgets as widgets
+        from IPython.display import display
+        data_files = index_files(path, DERIVATIVE_FILE_TYPES)
+        dataset_folders = {}
+        for f, size, file_type in data_files: 
+          if os.path.dirname(f) and file_type != "csv": 
+            folder = os.path.dirname(f) + "/"
+            dataset_folders[folder] = dataset_folders.get(folder, 0) + size
+        dataset_folders = [(folder, size, "folder") for folder, size in sorted(dataset_folders.items())]
         label = widgets.Label("Derivative file to analyze ")
-        file_options = widgets.Dropdown(description = "", options = get_files(path, (".csv")))
+        file_options = widgets.Dropdown(description = "", options = file_choices(data_files + dataset_folders))
         button = widgets.Button(description = "Select file")
         
         def btn_select_file(btn): 
             selected_file = path + "/" + file_options.value
             print("Loading data...")
-            self.set_data(selected_file)
+            self.set_data(selected_file, columns)
             print(f"Data loaded from: {selected_file}")
         
         button.on_click(btn_select_file)
@@ -314,6 +3141,7 @@ class Analyzer:
     def date_range_select(self):
       """ Create a date range selector for valid dates in the data.
       """
+      import ipywidgets as widgets
       from IPython.display import display, Javascript
       valid_range = self.data.reset_index()['crawl_date'].agg(['min', 'max'])
       start_label = widgets.Label("Select a start date  ")
@@ -341,10 +3169,13 @@ class Analyzer:
       return [(start_label, start_picker), (end_label, end_picker), script]
 
 
+    @instrumented
     def display_top_domains(self): 
         """Display the most frequently crawled domains in the dataset.
         """
-        domain_values = self.data["domain"].value_counts();
+        import ipywidgets as widgets
+        from IPython.display import display
+        domain_values = self.get_resource("collection", "domain_counts", lambda: self.data["domain"].value_counts())
         n_domains = len(domain_values)
         def top_domains(n): 
             print(domain_values.head(n))
@@ -354,38 +3185,32 @@ class Analyzer:
         display(n_slider)
         display(out)
   
+    @instrumented
     def plot_3d_crawl_frequency(self, aggregated_crawl_count):
         """Creates a 3-dimensional plot of the crawl frequency in the passed dataframe.
 
         Args: 
-          aggregated_crawl_count: a pandas dataframe containing the domains of interest to be plotted, 
-            with their crawl counts aggregated by some frequency
+          aggregated_crawl_count: a pandas dataframe of crawl counts, as returned by crawl_counts(), 
+            with a row for each domain of interest and a column for each time period
         """
+        import matplotlib.pyplot as plt
         from matplotlib.collections import PolyCollection
 
         # first get the crawl dates for the axis labels 
-        crawl_dates = sorted(set(aggregated_crawl_count.index.get_level_values('crawl_date').to_pydatetime()))
-        cd_to_xtick = {d:i for i,d in enumerate(crawl_dates)}
-        reverse_cd_map = {i:d for i,d in enumerate(crawl_dates)}
+        date_labels = aggregated_crawl_count.columns.strftime("%Y-%m-%d")
         # domain names by number of crawls, least -> greatest
-        domains_by_num_crawls = aggregated_crawl_count.groupby(level=0).sum().url.sort_values().index
-
-        verts = []
-        last_domain = None
-        max_crawl_count = 0
-
-        for d in domains_by_num_crawls: 
-           current_polygon = []
-           for t in aggregated_crawl_count.loc[d].sort_index().itertuples(): 
-              tstamp = t.Index.to_pydatetime()
-              tstamp_int = cd_to_xtick[tstamp]
-              crawl_count = t.url
-              max_crawl_count = max(crawl_count, max_crawl_count)
-              if not current_polygon: # for the first polygon
-                current_polygon.append((tstamp_int, 0))
-              current_polygon.append((tstamp_int, crawl_count))
-           current_polygon.append((current_polygon[-1][0], 0))
-           verts.append(current_polygon)
+        domains_by_num_crawls = aggregated_crawl_count.index
+
+        counts = aggregated_crawl_count.to_numpy()
+        max_crawl_count = counts.max()
+        n_domains, n_dates = counts.shape
+
+        # build all of the polygons at once, as an array of shape (domains, points, 2) 
+        # each polygon starts and ends at 0 crawls, with a point for each crawl date in between
+        verts = np.zeros((n_domains, n_dates + 2, 2))
+        verts[:, 1:-1, 0] = np.arange(n_dates)
+        verts[:, -1, 0] = n_dates - 1
+        verts[:, 1:-1, 1] = counts
 
         # now that we have the polygons, set up the plot itself
         fig, (ax1, ax2) = plt.subplots(2, 1, figsize=(18, 24), subplot_kw={'projection': '3d'})
@@ -396,7 +3221,7 @@ class Analyzer:
         poly = PolyCollection(verts, facecolors = facecolors, alpha = 0.7)
         ax1.add_collection3d(poly, zs=zs, zdir='x')
 
-        max_y = max(reverse_cd_map)
+        max_y = n_dates - 1
         ax1.set(xlim=(0, max(zs)+2), ylim=(-1, max_y+1), zlim=(0, max_crawl_count), 
                 xlabel = '', ylabel = '', zlabel = 'crawls')
         ax1.invert_xaxis()
@@ -404,73 +3229,133 @@ class Analyzer:
         ax1.set_xticks(zs)
         ax1.set_xticklabels(domains_by_num_crawls, rotation = 40, ha = "right")
 
-        ytick_labels = [reverse_cd_map[i].strftime("%Y-%m-%d") for i in sorted(reverse_cd_map)]
-        ax1.set_yticklabels(ytick_labels, rotation = -20, ha = "left")
         ax1.set_yticks(range(max_y+1))
+        ax1.set_yticklabels(date_labels, rotation = -20, ha = "left")
 
         # # 2nd plot? 
         poly = PolyCollection(verts, facecolors=facecolors, alpha=.7)
         ax2.add_collection3d(poly, zs=zs, zdir='y')
 
-        max_x = max(reverse_cd_map)
+        max_x = n_dates - 1
         ax2.set(xlim=(-1,max_x+1), ylim=(0,max(zs)+2), zlim=(0, max_crawl_count),
               xlabel='', ylabel='', zlabel='crawls')
         ax2.invert_xaxis()
 
         ax2.set_xticks(range(max_x+1))
-        x_tick_labels = [reverse_cd_map[i].strftime("%Y-%m-%d") for i in sorted(reverse_cd_map)]
-        ax2.set_xticklabels(x_tick_labels,rotation=40,ha='right')
+        ax2.set_xticklabels(date_labels,rotation=40,ha='right')
         ax2.set_yticks(zs)
         ax2.set_yticklabels(domains_by_num_crawls,rotation=-20,ha="left")
 
+    @instrumented
     def plot_2d_crawl_frequency(self, aggregated_crawl_count, inflation_factor = 2.5):
       """Creates a 2D plot of the crawl frequency for the given dataframe. 
       
       Args: 
-        aggregated_crawl_count: a pandas dataframe containing the domains of interest to be plotted, 
-          with their crawl counts aggregated by some frequency
+        aggregated_crawl_count: a pandas dataframe of crawl counts, as returned by crawl_counts(), 
+          with a row for each domain of interest and a column for each time period
         inflation_factor: an optional float that changes the circle sizes on the plot
       """
 
+      import matplotlib.pyplot as plt
       import math 
       fig, ax = plt.subplots(figsize=(18,12))
-      crawl_dates = sorted(set(aggregated_crawl_count.index.get_level_values('crawl_date').to_pydatetime()))
-      domains_by_ncrawls = aggregated_crawl_count.groupby(level=0).sum().url.sort_values().index
-
-      max_crawl_count = 0
-      y = -1
-      for d in domains_by_ncrawls:
-        xaxis = []
-        zaxis = []  
-        y = y + 1
-
-        for t in aggregated_crawl_count.loc[d].sort_index().itertuples():
-          tstamp = t.Index.to_pydatetime()
-          crawl_count = t.url
-          max_crawl_count = max(crawl_count, max_crawl_count)
-
-          xaxis.append(tstamp)
-          zaxis.append(crawl_count**inflation_factor) #artificially inflate size to create larger circles
-        scatter = ax.scatter(xaxis,[d]*len(xaxis),s=zaxis)
+      crawl_dates = aggregated_crawl_count.columns
+      domains_by_ncrawls = aggregated_crawl_count.index
+
+      # compute the points for all of the domains at once, leaving out the periods without crawls 
+      counts = aggregated_crawl_count.to_numpy()
+      domain_pos, date_pos = np.nonzero(counts)
+      # give each domain its own colour from the colour cycle, as separate scatter calls would
+      cycle = plt.rcParams["axes.prop_cycle"].by_key()["color"]
+      colors = np.array(cycle)[np.arange(len(domains_by_ncrawls)) % len(cycle)]
+      scatter = ax.scatter(crawl_dates[date_pos], domain_pos, c = colors[domain_pos], 
+                           s = counts[domain_pos, date_pos]**inflation_factor) #artificially inflate size to create larger circles
+      ax.set_yticks(range(len(domains_by_ncrawls)))
+      ax.set_yticklabels(domains_by_ncrawls)
 
       # Here we create a legend:
       # we'll plot empty lists with the desired size and label
-      sizes = sorted(set(map(lambda t: t.url**inflation_factor, aggregated_crawl_count.loc[domains_by_ncrawls].itertuples())))
-      if 0 in sizes: 
-        sizes.remove(0)
+      sizes = np.unique(counts[counts > 0])**inflation_factor
       for area in sizes:
           ax.scatter([], [], color=scatter.cmap(0.7), s=area, label=str(math.ceil(area**(1/inflation_factor ))))
       ax.legend(scatterpoints=1, loc="upper left",bbox_to_anchor=(1.025, 1), fancybox=True, frameon=True, shadow=True, handleheight=2.2,
                 borderaxespad=0., borderpad=1, labelspacing=3.5, handlelength=4, handletextpad=3,  title='Crawl count by size')    
 
       
-    def create_crawl_frequency_graph(self, n, graph_type, freq = "1M",  start_date = None, end_date = None): 
+    def get_resource(self, folder, name, generate, **params): 
+      """Get a result computed from the loaded data, through the resource cache.
+
+      Results are keyed on the datafile and the filters used to load it, as well as the 
+      given parameters. If the data was not loaded from a datafile, the result is generated. 
+
+      Args: 
+        folder (str): the project sub folder the result belongs in, one of RESOURCE_FOLDERS.
+        name (str): the name of the result, ex. "domain_counts".
+        generate: a function with no arguments which computes the result.
+        **params: any other parameters that the result depends on.
+      """
+      if self.datafile is None: 
+        return generate()
+      return self.cache.get(folder, name, generate, source = self.datafile, **self.data_filter, **params)
+
+    @instrumented
+    def get_crawl_cube(self): 
+      """Returns the number of crawls of each domain on each day, for the whole datafile. 
+
+      The counts are kept in the resource cache (in the "collection" folder), so that they 
+      only need to be computed once for each derivative. 
+
+      Returns: 
+        a pandas Series of crawl counts, indexed by domain and day.
+      """
+      if self.datafile is None: 
+        return count_daily_crawls(self.data)
+      # the counts are for the whole datafile, whatever filters were used to load it
+      return self.cache.get("collection", "crawl_counts", lambda: build_crawl_cube(self.datafile), 
+                            source = self.datafile)
+
+    @instrumented
+    def crawl_counts(self, n, freq = "1ME", start_date = None, end_date = None):
+      """Counts the crawls of the top n domains in the dataset, per time period.
+
+      The counts are rolled up from the daily counts of get_crawl_cube(), so changing the 
+      date range, frequency or number of domains doesn't require going through the data again.
+
+      Args: 
+        n: the number of the top domains to count
+        freq: the frequency to aggregate the data by, see create_crawl_frequency_graph()
+        start_date: an optional date, the first date of interest in the dataset
+        end_date: an optional date, the last date of interest in the dataset
+
+      Returns: 
+        a pandas dataframe with a row for each of the top n domains (ordered from the least to 
+        the most crawled) and a column for each time period, containing the number of crawls.
+      """
+      freq = period_frequency(freq)
+      # the cube covers the whole datafile, so also apply any filters used when loading the data
+      cube = filter_crawl_cube(self.get_crawl_cube(), **self.data_filter)
+      cube = filter_crawl_cube(cube, start_date, end_date)
+      top_domains = cube.groupby(level = "domain").sum().sort_values(ascending = False, kind = "stable").head(n).index
+      cube = filter_crawl_cube(cube, domains = top_domains)
+      counts = cube.groupby([pd.Grouper(level = "domain"), pd.Grouper(level = "crawl_date", freq = freq)])\
+          .sum()\
+          .unstack(fill_value = 0)
+      if counts.empty: 
+        return counts
+      # include the time periods without any crawls, so that the time axis is evenly spaced
+      # (with the grouping frequency, the columns' own freq can be inferred from the gaps, ex. "2ME")
+      periods = pd.date_range(counts.columns.min(), counts.columns.max(), freq = freq)
+      counts = counts.reindex(columns = periods, fill_value = 0)
+      return counts.loc[counts.sum(axis = 1).sort_values(kind = "stable").index]
+
+    @instrumented
+    def create_crawl_frequency_graph(self, n, graph_type, freq = "1ME",  start_date = None, end_date = None): 
       """Plots the crawl frequency of the top n domains in the dataset. 
 
       Args: 
         n: the number of the top domains to plot
-        freq: the frequency to aggregate the data by. "1M" aggregates it in 1 month groups, 
-          "1W" in 1 week groups. A full list of frequencies is available: 
+        freq: the frequency to aggregate the data by. "1ME" (or "1M", see period_frequency()) 
+          aggregates it in 1 month groups, "1W" in 1 week groups. A full list of frequencies is available: 
           https://pandas.pydata.org/pandas-docs/stable/user_guide/timeseries.html#offset-aliases
         graph_type: either '2d' for a 2-dimensional visualization of the crawl frequency, or 
           '3d' for a 3-dimensional visualization of the crawl frequency. 
@@ -484,25 +3369,11 @@ class Analyzer:
       # this is a temporary line to ignore warning output for the demo video
       import warnings
       warnings.filterwarnings("ignore")
-      # if no start date is specified, select the min date
-      if start_date == None: 
-         start_date = self.data["crawl_date"].min()
-      # similiarly for the end date
-      if end_date == None: 
-         end_date = self.data["crawl_date"].max()
-
-      date_mask = (self.data["crawl_date"] >= start_date) & (self.data["crawl_date"] <= end_date)
-      subset_data = self.data.loc[date_mask]
       # aggregate the data
-      domains = set(subset_data.groupby("domain")\
-          .count()\
-          .sort_values(by = "crawl_date", ascending = False)\
-          .head(n).index)
-      frames = []
-      for d in domains: 
-          # for each domain, get the count of all crawls in each month 
-          frames.append(subset_data.loc[self.data['domain'] == d].groupby(pd.Grouper(key = 'crawl_date', freq = freq)).count())
-      aggregated_crawl_count = pd.concat(frames, keys=list(domains))
+      aggregated_crawl_count = self.crawl_counts(n, freq, start_date, end_date)
+      if aggregated_crawl_count.empty: 
+        print("There are no crawls in the selected date range.")
+        return aggregated_crawl_count
 
       # create the appropriate graph  
       if graph_type == "3D": 
@@ -517,6 +3388,8 @@ class Analyzer:
 
     def display_crawl_frequency(self): 
       # set-up two panes so we can clear the output of the graphs
+      import ipywidgets as widgets
+      from IPython.display import clear_output, display
       out = widgets.Output()
 
       graph_options = widgets.RadioButtons(
@@ -533,14 +3406,14 @@ class Analyzer:
       num_domains = widgets.IntSlider(
          value = 10, 
          min = 1, 
-         max = 12, 
+         max = MAX_PLOT_DOMAINS, 
          step = 1, 
       )
       num_domains_label = widgets.Label("Number of domains: ")
 
       freq_options = widgets.Dropdown(
-         options = [("Monthly", "1M"), ("Weekly", "1W"), ("Daily", "1D")], 
-         value = "1M")
+         options = [("Monthly", "1ME"), ("Weekly", "1W"), ("Daily", "1D")], 
+         value = "1ME")
       freq_label = widgets.Label("Time scale")
 
       def create_crawl_btn(btn): 
@@ -585,12 +3458,56 @@ class Analyzer:
 
       display_options()
 
+    @instrumented
+    def set_graph(self, graphfile, start_date = None, end_date = None, self_links = False): 
+      """ Load a domain graph derivative for analysis, see read_link_graph().
+
+      Args:
+        graphfile (str): the path to the domain graph, ex. made by DerivativeGenerator.generate_link_graph().
+        start_date: an optional date (str or datetime), the earliest crawl_date to keep.
+        end_date: an optional date (str or datetime), the latest crawl_date to keep.
+        self_links (bool): whether to keep the links from domains to themselves.
+
+      Returns:
+        the LinkGraph, which is also kept in the graph attribute.
+      """
+      self.graphfile = graphfile
+      self.graph_filter = {"start_date": start_date, "end_date": end_date, "self_links": self_links}
+      self.graph = read_link_graph(graphfile, **self.graph_filter)
+      print(f"Loaded {len(self.graph.nodes)} domains and {self.graph.matrix.nnz} links between them.")
+      return self.graph
+
+    @instrumented
+    def rank_domains(self, damping = PAGERANK_DAMPING, weighted = True, connection = "weak"): 
+      """ Rank the domains of the graph loaded with set_graph().
+
+      The ranks are kept in the resource cache (in the "network" folder). 
+
+      Args:
+        damping (float): the PageRank damping factor, see LinkGraph.pagerank().
+        weighted (bool): whether PageRank follows links in proportion to their counts.
+        connection (str): "weak" or "strong" connected components, see LinkGraph.components().
+
+      Returns:
+        a pandas DataFrame of the degrees, PageRank and component of each domain, 
+        from the highest to the lowest PageRank.
+      """
+      def generate(): 
+        ranks = self.graph.degrees()
+        ranks["pagerank"] = self.graph.pagerank(damping, weighted)
+        ranks["component"] = self.graph.components(connection)
+        return ranks.sort_values("pagerank", ascending = False, kind = "stable")
+      return self.cache.get("network", "domain_ranks", generate, source = self.graphfile, **self.graph_filter, 
+                            damping = damping, weighted = weighted, connection = connection)
+
 ###
 ### Topic Modelling Additions
 ###
     def set_LDA_model_topics(self):
       """ Sets the topic model number of topics for Analyzer Object
       """
+      import ipywidgets as widgets
+      from IPython.display import display
       t_choice = widgets.BoundedIntText(
         value = 5,
         min = 2,
@@ -609,4 +3526,350 @@ class Analyzer:
       t_Button.on_click(btn_set_topics)
       display(widgets.HBox([t_label, t_choice,t_Button]))
 
+    @instrumented
+    def build_topic_corpus(self, tokens_file, corpus_file, no_below = None, no_above = None, keep_n = None):
+      """ Build the bag-of-words corpus for topic modelling from a token file, see build_bow_corpus().
+
+      Returns:
+        the corpus (streamed from disk) and its dictionary.
+      """
+      return build_bow_corpus(tokens_file, corpus_file, no_below, no_above, keep_n)
+
+    @instrumented
+    def train_topic_model(self, corpus_file, model_file, num_topics = None, passes = LDA_PASSES, workers = None, **lda_params):
+      """ Train an LDA topic model on a corpus saved by build_topic_corpus(), see train_lda_model().
+
+      Training is checkpointed after each pass, and an interrupted run picks up where it left off 
+      when it is run again.
+
+      Args:
+        corpus_file (str): the path of the corpus.
+        model_file (str): the path to save the model to.
+        num_topics (int): the number of topics (default: the number set with set_LDA_model_topics()).
+        passes (int): the number of passes over the corpus.
+        workers (int): the number of worker processes.
+        **lda_params: any other LdaMulticore settings.
+
+      Returns:
+        the trained model.
+      """
+      num_topics = num_topics or self.number_LDA_Topics
+      return train_lda_model(corpus_file, num_topics, model_file, passes, workers, **lda_params)
+
+    @instrumented
+    def sweep_topic_models(self, corpus_file, topic_counts, model_folder, tokens_file = None, coherence = None, 
+                           passes = LDA_PASSES, max_parallel = None, **lda_params):
+      """ Train LDA models for several numbers of topics in parallel, and score their coherence.
+
+      The models are trained in separate processes, which share the cores between them. Each model 
+      is saved to model_folder as lda_<topics>.model, and is checkpointed like train_topic_model().
+
+      Args:
+        corpus_file (str): the path of the corpus.
+        topic_counts (list of int): the numbers of topics to try.
+        model_folder (str): the folder to save the models in.
+        tokens_file (str): the path of the token file the corpus was built from.
+        coherence (str): the coherence measure, "c_v" if tokens_file is given, otherwise "u_mass".
+        passes (int): the number of passes over the corpus.
+        max_parallel (int): the number of models to train at once (default: all of them, up to the number of cores).
+        **lda_params: any other LdaMulticore settings.
+
+      Returns:
+        a pandas DataFrame of the coherence of the model for each number of topics.
+      """
+      from concurrent.futures import ProcessPoolExecutor
+      os.makedirs(model_folder, exist_ok = True)
+      coherence = coherence or ("c_v" if tokens_file is not None else "u_mass")
+      cores = os.cpu_count() or 1
+      max_parallel = max_parallel or max(1, min(len(topic_counts), cores // 2))
+      # each model gets a share of the cores for its LdaMulticore workers
+      workers = max(1, cores // max_parallel - 1)
+      with ProcessPoolExecutor(max_workers = max_parallel) as pool:
+        jobs = [pool.submit(sweep_lda_model, corpus_file, tokens_file, n, model_folder, passes, workers, coherence, lda_params) 
+                for n in topic_counts]
+        results = [job.result() for job in jobs]
+      return pd.DataFrame(results).sort_values("num_topics").reset_index(drop = True)
+
+    def iter_chunks(self, columns, chunksize = CHUNKSIZE):
+      """ Stream columns of the data in chunks of rows, with the filters passed to set_data().
+
+      The chunks are indexed like data (see set_data()), so results computed from them line up 
+      with the loaded rows. If the content was loaded (see load_content()) the data is used as is.
+
+      Args:
+        columns (list of str): the columns to read, any the derivative doesn't have are left out.
+        chunksize (int): the number of rows to read at a time from the datafile.
+
+      Yields:
+        pandas DataFrames of the rows of each chunk.
+      """
+      if self.data is not None and "content" in list(self.data):
+        yield self.data[[c for c in columns if c in list(self.data)]]
+        return
+      csv = derivative_format(self.datafile) == "csv"
+      position = 0
+      for chunk in read_chunks(self.datafile, list(columns) + FILTER_COLUMNS, chunksize):
+        chunk = filter_rows(chunk, **self.data_filter)
+        if not csv:
+          # Parquet / Arrow data is numbered from 0 after filtering, see read_dataset()
+          chunk.index = pd.RangeIndex(position, position + len(chunk))
+          position += len(chunk)
+        yield chunk
+
+    def iter_content(self, language = None, chunksize = CHUNKSIZE, deduplicate = False, search = None):
+      """ Stream the text content of the data, one document at a time.
+
+      If the content was loaded (see load_content()) it is used as is, otherwise it is read from 
+      the datafile in chunks, with the filters passed to set_data(), so it is never all in memory.
+
+      Args:
+        language (str): if the derivative has a language column, only keep documents in this 
+          language, ex. "en".
+        chunksize (int): the number of rows to read at a time from the datafile.
+        deduplicate (bool): if True, leave out the duplicate pages found by find_duplicates() 
+          (which is run if needed).
+        search (str): an optional query, only the documents matching it in the text index are 
+          streamed, see build_text_index() and search_rows().
+
+      Yields:
+        the text of each document, missing content is skipped.
+      """
+      if deduplicate and self.duplicates is None:
+        self.find_duplicates(chunksize = chunksize)
+      rows = self.search_rows(search) if search is not None else None
+      for chunk in self.iter_chunks(["content", "language"], chunksize):
+        if deduplicate:
+          chunk = chunk[~chunk.index.isin(self.duplicates)]
+        if rows is not None:
+          chunk = chunk[chunk.index.isin(rows)]
+        if language is not None and "language" in list(chunk):
+          chunk = chunk[chunk["language"] == language]
+        yield from chunk["content"].dropna()
+
+    @instrumented
+    def build_text_index(self, index_folder, chunksize = CHUNKSIZE): 
+      """ Index the text content of the datafile for searching (see TextIndex), or update the index 
+      if the datafile changed since it was indexed. The whole datafile is indexed, whatever filters 
+      were passed to set_data().
+
+      Args:
+        index_folder (str): the folder of the index, an existing index is added to.
+        chunksize (int): the number of rows to read at a time from the datafile.
+
+      Returns:
+        the TextIndex, which is also kept in the text_index attribute.
+      """
+      self.text_index = TextIndex(index_folder)
+      self.text_index.add(self.datafile, chunksize)
+      return self.text_index
+
+    def search(self, query, start_date = None, end_date = None, domains = None, limit = None): 
+      """ Search the text index built with build_text_index() (or set as text_index), see TextIndex.search().
+
+      Returns:
+        a pandas DataFrame of the matching documents.
+      """
+      results = self.text_index.search(query, start_date, end_date, domains, limit)
+      print(f"{len(results)} documents match {query}")
+      return results
+
+    def search_rows(self, query): 
+      """ The labels of the rows of data whose content matches a query, see search().
+
+      Only the documents of the datafile which pass the filters given to set_data() are included.
+      """
+      results = self.text_index.search(query, **self.data_filter)
+      rows = results["row"][results["datafile"] == os.path.abspath(self.datafile)].to_numpy()
+      if derivative_format(self.datafile) == "csv" or all(v is None for v in self.data_filter.values()): 
+        # the rows of data are labelled with their row numbers in the datafile
+        return pd.Index(rows)
+      # Parquet / Arrow data is numbered from 0 after filtering, see read_dataset()
+      kept = np.concatenate([chunk.index.isin(filter_rows(chunk, **self.data_filter).index) 
+                             for chunk in read_chunks(self.datafile, FILTER_COLUMNS)] or [np.array([], dtype = bool)])
+      return pd.Index((np.cumsum(kept) - 1)[rows])
+
+    @instrumented
+    def find_duplicates(self, threshold = DUPLICATE_THRESHOLD, num_perm = MINHASH_PERMUTATIONS, bands = MINHASH_BANDS, 
+                        shingle_size = SHINGLE_SIZE, workers = None, batch_size = DUPLICATE_BATCH_SIZE, 
+                        chunksize = CHUNKSIZE, seed = 0, max_bucket = DUPLICATE_MAX_BUCKET):
+      """ Find the pages of the data whose content is the same as, or nearly the same as, another page's.
+
+      The content is streamed from the data (see iter_chunks()) and fingerprinted in batches, in 
+      worker processes, with an exact hash and a MinHash signature (see fingerprint_documents()). 
+      Pages are only compared with the pages that share one of their locality-sensitive hashing 
+      buckets, so the time taken grows about linearly with the number of pages instead of with the 
+      number of pairs. Exact duplicates are grouped first, and only one page of each group goes 
+      through the buckets (see candidate_pairs()), so pages recaptured on every crawl don't multiply 
+      the comparisons. All the pages of a bucket are compared with each other, unless it holds more 
+      than max_bucket pages: then each page is only compared with the max_bucket - 1 pages before it 
+      (see bucket_pairs()), which keeps the time linear even for very common content (ex. boilerplate 
+      pages), at the cost of possibly missing some matches between pages far apart in the data. 
+      The signatures are kept in a temporary file rather than in memory.
+
+      Pages that match (directly or through other pages) form a cluster. The earliest crawl of each 
+      cluster is kept, the others are duplicates, see deduplicated(). The clusters are kept in the 
+      resource cache (in the "text" folder).
+
+      Args:
+        threshold (float): the estimated Jaccard similarity of their shingles from which pages are 
+          near-duplicates, 1 only finds exact duplicates (ignoring case and whitespace).
+        num_perm (int): the number of values in each MinHash signature.
+        bands (int): the number of LSH bands each signature is split into. With more bands, pages 
+          which are less similar are compared, num_perm must be a multiple of bands.
+        shingle_size (int): the number of words in each shingle.
+        workers (int): the number of worker processes (default: one per core).
+        batch_size (int): the number of pages sent to a worker process at a time.
+        chunksize (int): the number of rows to read at a time from the datafile.
+        seed (int): the seed of the MinHash hash functions.
+        max_bucket (int): the number of pages of an LSH bucket up to which all of them are compared.
+
+      Returns:
+        a pandas DataFrame with a row for each page in a cluster of duplicates, indexed like data, 
+        with the cluster number, whether the page is kept, whether it is an exact duplicate of the 
+        page that is kept, their estimated similarity, and its crawl_date, domain and url (if loaded).
+      """
+      clusters = self.get_resource("text", "duplicates", 
+                                   lambda: self.duplicate_clusters(threshold, num_perm, bands, shingle_size, workers, 
+                                                                   batch_size, chunksize, seed, max_bucket), 
+                                   threshold = threshold, num_perm = num_perm, bands = bands, 
+                                   shingle_size = shingle_size, seed = seed, max_bucket = max_bucket)
+      self.duplicates = clusters.index[~clusters["keep"].to_numpy(dtype = bool)]
+      print(f"Found {len(self.duplicates)} duplicates of {clusters['cluster'].nunique()} pages.")
+      return clusters
+
+    def duplicate_clusters(self, threshold, num_perm, bands, shingle_size, workers, batch_size, chunksize, seed, 
+                           max_bucket = DUPLICATE_MAX_BUCKET):
+      """ Compute the clusters of duplicate pages of the data, see find_duplicates().
+      """
+      import tempfile
+      from collections import deque
+      from concurrent.futures import ProcessPoolExecutor
+      from scipy.sparse import coo_matrix
+      from scipy.sparse.csgraph import connected_components
+      workers = workers or os.cpu_count()
+      rows, exact, keys = [], [], []
+
+      with tempfile.TemporaryDirectory() as folder:
+        signature_file = os.path.join(folder, "signatures")
+        with stage("fingerprint") as record, open(signature_file, "wb") as f, \
+             ProcessPoolExecutor(max_workers = workers) as pool:
+          pending = deque()
+          def collect():
+            index, job = pending.popleft()
+            batch_exact, signatures, batch_keys = job.result()
+            rows.append(index.to_numpy())
+            exact.append(batch_exact)
+            keys.append(batch_keys)
+            # the low 32 bits of the signature values are enough to compare them
+            f.write(signatures.astype(np.uint32).tobytes())
+          for chunk in self.iter_chunks(["content"], chunksize):
+            content = chunk["content"].dropna()
+            for i in range(0, len(content), batch_size):
+              batch = content.iloc[i:i + batch_size]
+              pending.append((batch.index, pool.submit(fingerprint_batch, batch.astype(str).tolist(), 
+                                                       num_perm, bands, shingle_size, seed)))
+              # only keep a few batches in flight, so the content is never all in memory
+              if len(pending) >= 2 * workers:
+                collect()
+          while pending:
+            collect()
+          record["rows"] = sum(len(r) for r in rows)
+
+        n = sum(len(r) for r in rows)
+        columns = ["cluster", "keep", "exact", "similarity"]
+        if n == 0:
+          return pd.DataFrame(columns = columns).astype({"cluster": "int64", "keep": bool, "exact": bool})
+        rows, exact, keys = np.concatenate(rows), np.concatenate(exact), np.concatenate(keys)
+        signatures = np.memmap(signature_file, dtype = np.uint32, mode = "r", shape = (n, num_perm))
+
+        with stage("candidates") as record:
+          # exact duplicates match without comparing their signatures
+          (exact_first, exact_second), (first, second) = \
+              candidate_pairs(exact, keys if threshold < 1 else keys[:, :0], max_bucket)
+          matches = signature_similarity(signatures, first, second) >= threshold
+          first = np.concatenate([exact_first, first[matches]])
+          second = np.concatenate([exact_second, second[matches]])
+          record["rows"] = len(first)
+
+        with stage("clusters") as record:
+          graph = coo_matrix((np.ones(len(first), dtype = np.int8), (first, second)), shape = (n, n))
+          labels = connected_components(graph, directed = False)[1]
+          positions = np.flatnonzero(np.bincount(labels)[labels] > 1)
+          clusters = pd.DataFrame({"cluster": labels[positions], "position": positions}, index = rows[positions])
+          if self.data is not None:
+            info = [c for c in COLLECTION_COLUMNS if c in list(self.data)]
+            clusters = clusters.join(self.data[info])
+          # keep the earliest crawl of each cluster, or the first page if the crawl dates aren't loaded
+          order = ["cluster", "crawl_date", "position"] if "crawl_date" in list(clusters) else ["cluster", "position"]
+          clusters = clusters.sort_values(order, kind = "stable")
+          clusters["keep"] = ~clusters["cluster"].duplicated()
+          kept = clusters["position"].where(clusters["keep"]).ffill().to_numpy(dtype = np.int64)
+          members = clusters["position"].to_numpy()
+          clusters["exact"] = exact[kept] == exact[members]
+          clusters["similarity"] = np.where(clusters["exact"], 1.0, signature_similarity(signatures, kept, members))
+          clusters["cluster"] = pd.factorize(clusters["cluster"])[0]
+          record["rows"] = len(clusters)
+          del signatures
+      clusters.index.name = self.data.index.name if self.data is not None else None
+      return clusters[columns + [c for c in COLLECTION_COLUMNS if c in list(clusters)]]
+
+    def deduplicated(self):
+      """ The data without the duplicate pages found by find_duplicates() (which is run if needed).
+
+      Only the earliest crawl of each page is kept, ex. analyzer.deduplicated()["domain"].value_counts() 
+      counts each page once.
+
+      Returns:
+        the rows of data which aren't duplicates.
+      """
+      if self.duplicates is None:
+        self.find_duplicates()
+      return self.data[~self.data.index.isin(self.duplicates)]
+
+    @instrumented
+    def preprocess_text(self, output_file, stopword_files = (), extra_stopwords = (), allowed_postags = ALLOWED_POSTAGS, 
+                        language = "en", model = SPACY_MODEL, n_process = None, batch_size = NLP_BATCH_SIZE, 
+                        chunksize = CHUNKSIZE, deduplicate = False, search = None):
+      """ Tokenize and lemmatize the text content of the data, for topic modelling.
+
+      Documents are streamed from the data (see iter_content()), tokenized with stopwords removed, 
+      and lemmatized by spaCy in batches, in n_process worker processes. The lemmas are written to 
+      output_file as they are produced, so memory use doesn't grow with the size of the derivative.
+
+      The output file has one line per document, with the lemmas separated by spaces 
+      (the format of gensim's LineSentence). 
+
+      Args:
+        output_file (str): the path of the token file to write.
+        stopword_files (list of str): paths of text files of extra stopwords, one per line.
+        extra_stopwords (list of str): any other stopwords.
+        allowed_postags (list of str): the parts of speech to keep, or None to keep every token.
+        language (str): only keep documents in this language, if the derivative has a language column.
+        model (str): the name (or path) of the spaCy model to lemmatize with.
+        n_process (int): the number of worker processes (default: one per core).
+        batch_size (int): the number of documents sent to a worker process at a time.
+        chunksize (int): the number of rows to read at a time from the datafile.
+        deduplicate (bool): if True, leave out the duplicate pages found by find_duplicates().
+        search (str): an optional query, only the documents matching it in the text index are 
+          preprocessed (ex. to model the topics of a subset of the collection), see iter_content().
+
+      Returns:
+        the number of documents written.
+      """
+      import spacy
+      stop_words = load_stopwords(stopword_files, extra_stopwords)
+      nlp = spacy.load(model, disable = ["parser", "ner"])
+      allowed_postags = set(allowed_postags) if allowed_postags is not None else None
+      # very long pages would go over spaCy's length limit, so cut them off there
+      texts = (text[:nlp.max_length] for text in tokenize_documents(self.iter_content(language, chunksize, deduplicate, search), stop_words))
+
+      count = 0
+      with open(output_file, "w", encoding = "utf-8") as f:
+        for doc in nlp.pipe(texts, n_process = n_process or os.cpu_count(), batch_size = batch_size):
+          f.write(" ".join(token.lemma_ or token.text for token in doc 
+                           if allowed_postags is None or token.pos_ in allowed_postags) + "\n")
+          count += 1
+      print(f"Preprocessed {count} documents, saved to: {output_file}")
+      return count
+
 
@@ -0,0 +1,224 @@
+""" AOY-TK benchmarks. Times the Analyzer and DerivativeGenerator hot paths on synthetic derivatives.
+
+Synthetic ARCH-style web page derivatives are generated at the requested sizes, and each hot path
+is run in a fresh process, so that its peak memory isn't mixed up with the others. The results
+are saved as JSON, and can be compared with the results of another version of the toolkit:
+
+    python benchmark.py --rows 10000 100000 --output new.json --compare old.json
+
+Runs headless (matplotlib's Agg backend), without Colab or Spark.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+import numpy as np
+import pandas as pd
+
+# Columns of an ARCH web pages derivative
+ARCH_COLUMNS = ["crawl_date", "domain", "url", "mime_type_web_server", "mime_type_tika", "language", "content"]
+# Words the synthetic page content is made of
+WORDS = np.array("archive web page crawl collection library digital history record news site link text "
+                 "university research community event government public report media story".split())
+# The hot paths to benchmark, see run_case()
+CASES = ["set_data", "set_data_columns", "load_content", "display_top_domains", "crawl_counts",
+         "create_crawl_frequency_graph_2d", "create_crawl_frequency_graph_3d", "create_csv_with_header"]
+
+
+def generate_derivative(datafile, rows, domains=100, days=365, content_length=1000, header=True, seed=0):
+  """Write a synthetic ARCH-style web pages derivative to a CSV file.
+
+    Domains are crawled with a skewed (Zipf-like) frequency, as in real collections.
+
+    Args:
+      datafile (str): the path of the CSV file to write.
+      rows (int): the number of web pages.
+      domains (int): the number of different domains.
+      days (int): the number of days the crawl dates are spread over.
+      content_length (int): the average number of characters of text content per page.
+      header (bool): whether to write a header row (ARCH derivatives have one, AUT output may not).
+      seed (int): the random seed, the same settings always give the same derivative.
+  """
+  rng = np.random.default_rng(seed)
+  chunksize = 100000
+  weights = 1 / np.arange(1, domains + 1)
+  weights /= weights.sum()
+  start = pd.Timestamp("2020-01-01")
+  with open(datafile, "w", newline="", encoding="utf-8") as f:
+    for first in range(0, rows, chunksize):
+      n = min(chunksize, rows - first)
+      domain = rng.choice(domains, size=n, p=weights)
+      dates = start + pd.to_timedelta(rng.integers(0, days * 86400, size=n), unit="s")
+      words = WORDS[rng.integers(0, len(WORDS), size=(n, max(1, content_length // 8)))]
+      chunk = pd.DataFrame({
+        "crawl_date": dates.strftime("%Y%m%d%H%M%S"),
+        "domain": [f"site{d}.org" for d in domain],
+        "url": [f"http://site{d}.org/page{first + i}" for i, d in enumerate(domain)],
+        "mime_type_web_server": "text/html",
+        "mime_type_tika": "text/html",
+        "language": "en",
+        "content": [" ".join(w) for w in words],
+      }, columns=ARCH_COLUMNS)
+      chunk.to_csv(f, header=header and first == 0, index=False, lineterminator="\n")
+
+
+def run_case(case, datafile, repeat):
+  """Run one hot path on a derivative, in this process, and measure it.
+
+    Returns:
+      a dict of the case's timings (seconds, best of repeat), its peak traced (Python / numpy)
+      memory and the peak resident memory of the process while it ran.
+  """
+  import shutil
+  import tempfile
+  import tracemalloc
+  import matplotlib.pyplot as plt
+  import aoytk
+
+  def loaded(columns=None):
+    analyzer = aoytk.Analyzer()
+    analyzer.set_data(datafile, columns)
+    return analyzer
+
+  def csv_with_header():
+    headerless = datafile + ".noheader"
+    if not os.path.exists(headerless):
+      with open(datafile, "rb") as src, open(headerless, "wb") as dst:
+        src.readline()
+        aoytk.append_file(datafile, dst, src.tell())
+    return headerless
+
+  # each case is (setup, run), the setup isn't timed
+  cases = {
+    "set_data": (lambda: None, lambda _: loaded()),
+    "set_data_columns": (lambda: None, lambda _: loaded(aoytk.COLLECTION_COLUMNS)),
+    "load_content": (lambda: loaded(aoytk.COLLECTION_COLUMNS), lambda a: a.load_content()),
+    "display_top_domains": (lambda: loaded(aoytk.COLLECTION_COLUMNS), lambda a: a.display_top_domains()),
+    "crawl_counts": (lambda: loaded(aoytk.COLLECTION_COLUMNS), lambda a: a.crawl_counts(50, "1W")),
+    "create_crawl_frequency_graph_2d": (lambda: loaded(aoytk.COLLECTION_COLUMNS),
+                                        lambda a: a.create_crawl_frequency_graph(50, "2D", "1W")),
+    "create_crawl_frequency_graph_3d": (lambda: loaded(aoytk.COLLECTION_COLUMNS),
+                                        lambda a: a.create_crawl_frequency_graph(50, "3D", "1W")),
+    "create_csv_with_header": (csv_with_header,
+                               lambda f: aoytk.DerivativeGenerator().create_csv_with_header(
+                                 ARCH_COLUMNS, f, datafile + ".header.csv")),
+  }
+  setup, run = cases[case]
+  timings = []
+  traced_peak = 0
+  rss_peak = 0
+  for _ in range(repeat):
+    state = setup()
+    # results are cached so that they're only computed once per project, start from an empty cache
+    # to measure the computation
+    project_folder = tempfile.mkdtemp()
+    aoytk.cache = aoytk.ResourceCache(project_folder=project_folder)
+    if isinstance(state, aoytk.Analyzer):
+      state.cache = aoytk.cache
+    aoytk.reset_peak_memory()
+    tracemalloc.start()
+    started = time.perf_counter()
+    run(state)
+    timings.append(time.perf_counter() - started)
+    traced_peak = max(traced_peak, tracemalloc.get_traced_memory()[1])
+    tracemalloc.stop()
+    rss_peak = max(rss_peak, aoytk.peak_memory_mb())
+    plt.close("all")
+    shutil.rmtree(project_folder)
+  return {"seconds": min(timings), "all_seconds": timings, "peak_traced_mb": traced_peak / 1024**2,
+          "peak_rss_mb": rss_peak}
+
+
+def run_benchmarks(sizes, cases, workdir, domains, days, content_length, repeat):
+  """Generate a derivative for each size, and run each case on it in a fresh process.
+
+    Returns:
+      a list of the results of each case and size.
+  """
+  os.makedirs(workdir, exist_ok=True)
+  results = []
+  for rows in sizes:
+    datafile = os.path.join(workdir, f"derivative_{rows}_{domains}_{days}_{content_length}.csv")
+    if not os.path.exists(datafile):
+      print(f"Generating {datafile}")
+      generate_derivative(datafile, rows, domains, days, content_length)
+    for case in cases:
+      # a fresh process for each case, so peak memory is per case
+      child = subprocess.run([sys.executable, __file__, "--run-case", case, datafile, "--repeat", str(repeat)],
+                             capture_output=True, text=True)
+      if child.returncode != 0:
+        print(f"{case} failed for {rows} rows:\n{child.stderr}")
+        result = {"error": child.stderr.strip().splitlines()[-1] if child.stderr.strip() else "failed"}
+      else:
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        print(f"{case:<34} {rows:>10} rows {result['seconds']:>9.3f} s {result['peak_rss_mb']:>9.1f} MB")
+      results.append(dict({"case": case, "rows": rows, "domains": domains, "days": days,
+                           "content_length": content_length, "bytes": os.path.getsize(datafile)}, **result))
+  return results
+
+
+def toolkit_version():
+  """The git commit of the toolkit, if it's in a git checkout, to label the results with.
+  """
+  try:
+    return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+  except OSError:
+    return None
+
+
+def compare(results, baseline):
+  """Print each result's time and peak memory relative to a baseline run.
+  """
+  previous = {(r["case"], r["rows"]): r for r in baseline["results"] if "error" not in r}
+  print(f"\nCompared with {baseline.get('version')} ({baseline.get('date')}):")
+  for r in results:
+    old = previous.get((r["case"], r["rows"]))
+    if old is None or "error" in r:
+      continue
+    print(f"{r['case']:<34} {r['rows']:>10} rows  time x{r['seconds'] / old['seconds']:.2f}  "
+          f"memory x{r['peak_rss_mb'] / old['peak_rss_mb']:.2f}")
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark the AOY-TK hot paths on synthetic derivatives.")
+  parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000], help="derivative sizes, in rows")
+  parser.add_argument("--domains", type=int, default=100, help="number of different domains")
+  parser.add_argument("--days", type=int, default=365, help="number of days the crawls are spread over")
+  parser.add_argument("--content-length", type=int, default=1000, help="characters of content per page")
+  parser.add_argument("--cases", nargs="+", default=CASES, choices=CASES, help="hot paths to benchmark")
+  parser.add_argument("--repeat", type=int, default=3, help="runs of each case, the best is kept")
+  parser.add_argument("--workdir", default="benchmark_data", help="folder for the synthetic derivatives")
+  parser.add_argument("--output", default="benchmark_results.json", help="file to save the results to")
+  parser.add_argument("--compare", help="results file of an earlier run to compare with")
+  parser.add_argument("--run-case", nargs=2, metavar=("CASE", "DATAFILE"), help=argparse.SUPPRESS)
+  args = parser.parse_args()
+
+  if args.run_case:
+    # a child process started by run_benchmarks(), the results go to stdout as the last line
+    print(json.dumps(run_case(args.run_case[0], args.run_case[1], args.repeat)))
+    return
+
+  results = run_benchmarks(args.rows, args.cases, args.workdir, args.domains, args.days,
+                           args.content_length, args.repeat)
+  report = {"version": toolkit_version(), "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(), "pandas": pd.__version__, "platform": platform.platform(),
+            "cpus": os.cpu_count(), "results": results}
+  with open(args.output, "w") as f:
+    json.dump(report, f, indent=2)
+  print(f"Results saved to: {args.output}")
+  if args.compare:
+    with open(args.compare) as f:
+      compare(results, json.load(f))
+  if any("error" in r for r in results):
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,331 @@
+""" AOY-TK job runner. Generates derivatives and collection reports from the command line, without a notebook.
+
+The jobs are described in a JSON job spec, ex.
+
+    {
+      "workers": 2,
+      "jobs": [
+        {"name": "derivative", "type": "derivative", "inputs": ["warcs/*.warc.gz"], "output": "derivatives/all",
+         "file_type": "parquet", "text_filters": 1, "backend": "python", "incremental": true},
+        {"name": "report", "type": "report", "input": "derivatives/all", "output": "reports/all",
+         "start_date": "2020-01-01", "end_date": "2020-12-31", "top_domains": 20, "freq": "1W",
+         "graphs": ["2D", "3D"], "after": ["derivative"]}
+      ]
+    }
+
+and run with:
+
+    python jobs.py jobspec.json --workers 4 --results results.json
+
+Relative paths in a job spec are relative to the folder of the job spec. Jobs run in parallel, in a pool
+of worker processes, except for jobs listed in a job's "after", which have to succeed before it starts.
+
+derivative jobs take the arguments of DerivativeGenerator() and DerivativeGenerator.generate_derivative():
+  inputs: a W/ARC file, a glob pattern or a list of them
+  output: the folder to save the derivative to
+  derivative: "webpages" (the text of the web pages, the default) or "domain_graph" (the links between
+    domains, see DerivativeGenerator.generate_link_graph(), which only uses the inputs, output and backend settings)
+  file_type ("csv"), text_filters (0), merge (true), incremental (false)
+  backend ("spark"), backend_workers, cores, memory, shuffle_partitions, spark_config
+
+report jobs load a derivative with Analyzer.set_data() and save its aggregations to the output folder:
+  domain_counts.csv, the number of crawls of each domain
+  crawl_counts.csv, the crawls of the top domains per time period, see Analyzer.crawl_counts()
+  crawl_frequency_2D.png / crawl_frequency_3D.png, see Analyzer.create_crawl_frequency_graph()
+  input can be a derivative file or a derivative job's output folder (CSV, Parquet or Arrow).
+  Settings: input, output, start_date, end_date, domains, top_domains (20), freq ("1W"), graphs (["2D"]),
+  project_folder (where results are cached, default: the output folder)
+
+Exit status: 0 if all of the jobs succeeded, 1 if any of them failed or were skipped, 2 if the job spec
+is invalid.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import sys
+import time
+import traceback
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+# The job types, and the settings each of them requires
+JOB_TYPES = {"derivative": ["inputs", "output"], "report": ["input", "output"]}
+# Settings which are paths, resolved relative to the job spec's folder
+PATH_SETTINGS = ["inputs", "output", "input", "project_folder"]
+# Exit status of a run
+EXIT_SUCCESS = 0
+EXIT_FAILED = 1
+EXIT_INVALID_SPEC = 2
+
+
+class JobSpecError(ValueError):
+  """A job spec which can't be run."""
+
+
+def resolve_path(value, base):
+  """Resolve a path (or list of paths) from a job spec relative to the job spec's folder.
+  """
+  if isinstance(value, list):
+    return [resolve_path(v, base) for v in value]
+  return os.path.normpath(os.path.join(base, os.path.expanduser(value)))
+
+
+def load_job_spec(spec_file):
+  """Read and check a job spec.
+
+    Args:
+      spec_file (str): the path of the JSON job spec.
+
+    Returns:
+      the job spec, with defaults filled in and the paths resolved.
+
+    Raises:
+      JobSpecError: if the job spec can't be read or isn't valid.
+  """
+  try:
+    with open(spec_file) as f:
+      spec = json.load(f)
+  except (OSError, ValueError) as e:
+    raise JobSpecError(f"The job spec {spec_file} could not be read: {e}")
+  if isinstance(spec, list):
+    spec = {"jobs": spec}
+  if not isinstance(spec, dict) or not isinstance(spec.get("jobs"), list) or not spec["jobs"]:
+    raise JobSpecError("The job spec should have a non-empty list of jobs.")
+
+  base = os.path.dirname(os.path.abspath(spec_file))
+  names = set()
+  for i, job in enumerate(spec["jobs"]):
+    if not isinstance(job, dict):
+      raise JobSpecError(f"Job {i} should be an object.")
+    job.setdefault("name", f"job{i}")
+    name = job["name"]
+    if name in names:
+      raise JobSpecError(f"There is more than one job named {name!r}.")
+    names.add(name)
+    if job.get("type") not in JOB_TYPES:
+      raise JobSpecError(f"Job {name!r} has an unknown type {job.get('type')!r}, use one of {list(JOB_TYPES)}.")
+    missing = [setting for setting in JOB_TYPES[job["type"]] if setting not in job]
+    if missing:
+      raise JobSpecError(f"Job {name!r} is missing {', '.join(missing)}.")
+    if job["type"] == "derivative":
+      if job.get("file_type", "csv") not in ("csv", "parquet"):
+        raise JobSpecError(f"Job {name!r} has an unknown file_type {job['file_type']!r}, use 'csv' or 'parquet'.")
+      if job.get("text_filters", 0) not in (0, 1, 2):
+        raise JobSpecError(f"Job {name!r} has an unknown text_filters {job['text_filters']!r}, use 0, 1 or 2.")
+      if job.get("derivative", "webpages") not in ("webpages", "domain_graph"):
+        raise JobSpecError(f"Job {name!r} has an unknown derivative {job['derivative']!r}, "
+                           "use 'webpages' or 'domain_graph'.")
+      if job.get("backend", "spark") not in ("spark", "python"):
+        raise JobSpecError(f"Job {name!r} has an unknown backend {job['backend']!r}, use 'spark' or 'python'.")
+    else:
+      graphs = job.setdefault("graphs", ["2D"])
+      if not isinstance(graphs, list) or any(g not in ("2D", "3D") for g in graphs):
+        raise JobSpecError(f"Job {name!r} has unknown graphs {graphs!r}, use a list of '2D' and '3D'.")
+    for setting in PATH_SETTINGS:
+      if setting in job:
+        job[setting] = resolve_path(job[setting], base)
+    job["after"] = job.get("after", [])
+
+  for job in spec["jobs"]:
+    unknown = [name for name in job["after"] if name not in names]
+    if unknown:
+      raise JobSpecError(f"Job {job['name']!r} runs after unknown jobs {unknown}.")
+  # make sure that the "after" dependencies don't go round in a circle
+  done = set()
+  remaining = list(spec["jobs"])
+  while remaining:
+    ready = [job for job in remaining if set(job["after"]) <= done]
+    if not ready:
+      raise JobSpecError(f"Jobs {[job['name'] for job in remaining]} wait for each other.")
+    done.update(job["name"] for job in ready)
+    remaining = [job for job in remaining if job["name"] not in done]
+  return spec
+
+
+def run_derivative_job(job):
+  """Generate a derivative, as described by a derivative job.
+
+    Returns:
+      a list of the files written.
+  """
+  import aoytk
+  generator = aoytk.DerivativeGenerator(cores=job.get("cores"), memory=job.get("memory"),
+                                        shuffle_partitions=job.get("shuffle_partitions"),
+                                        config=job.get("spark_config"), backend=job.get("backend", "spark"),
+                                        workers=job.get("backend_workers"))
+  if job.get("derivative", "webpages") == "domain_graph":
+    success = generator.generate_link_graph(job["inputs"], job["output"])
+  else:
+    success = generator.generate_derivative(job["inputs"], job["output"], job.get("file_type", "csv"),
+                                            job.get("text_filters", 0), job.get("merge", True),
+                                            job.get("incremental", False))
+  if not success:
+    raise RuntimeError(f"The derivative in {job['output']} was not generated successfully.")
+  return [os.path.join(job["output"], f) for f in sorted(os.listdir(job["output"]))]
+
+
+def run_report_job(job):
+  """Save the aggregations and crawl frequency graphs of a derivative, as described by a report job.
+
+    Returns:
+      a list of the files written.
+  """
+  import matplotlib.pyplot as plt
+  import aoytk
+  os.makedirs(job["output"], exist_ok=True)
+  analyzer = aoytk.Analyzer()
+  analyzer.cache = aoytk.ResourceCache(project_folder=job.get("project_folder", job["output"]))
+  analyzer.set_data(job["input"], aoytk.COLLECTION_COLUMNS, start_date=job.get("start_date"),
+                    end_date=job.get("end_date"), domains=job.get("domains"))
+  outputs = []
+
+  domain_counts = os.path.join(job["output"], "domain_counts.csv")
+  analyzer.get_resource("collection", "domain_counts", lambda: analyzer.data["domain"].value_counts())\
+    .rename_axis("domain").rename("crawls").to_csv(domain_counts)
+  outputs.append(domain_counts)
+
+  n, freq = job.get("top_domains", 20), job.get("freq", "1W")
+  crawl_counts = os.path.join(job["output"], "crawl_counts.csv")
+  counts = analyzer.crawl_counts(n, freq)
+  counts.to_csv(crawl_counts, date_format="%Y-%m-%d")
+  outputs.append(crawl_counts)
+  if counts.empty:
+    print(f"{job['name']}: there are no crawls in the selected date range, no graphs were made.")
+    return outputs
+
+  for graph_type in job["graphs"]:
+    graph = os.path.join(job["output"], f"crawl_frequency_{graph_type}.png")
+    analyzer.create_crawl_frequency_graph(n, graph_type, freq)
+    plt.gcf().savefig(graph, bbox_inches="tight")
+    plt.close("all")
+    outputs.append(graph)
+  return outputs
+
+
+def run_job(job, instrumentation=None):
+  """Run a job, in a worker process.
+
+    Errors are caught and returned, so that one failed job doesn't stop the others.
+
+    Args:
+      job (dict): a job from the job spec.
+      instrumentation (str): an optional aoytk instrumentation mode ("timing" or "profile"),
+        the timings are added to the results.
+
+    Returns:
+      a dict of the job's name, status ("succeeded" or "failed"), run time, the files it wrote
+      and the error, if it failed.
+  """
+  import aoytk
+  if instrumentation:
+    aoytk.set_instrumentation(instrumentation)
+  started = time.perf_counter()
+  result = {"name": job["name"], "type": job["type"]}
+  try:
+    if job["type"] == "derivative":
+      result["outputs"] = run_derivative_job(job)
+    else:
+      result["outputs"] = run_report_job(job)
+    result["status"] = "succeeded"
+  except Exception as e:
+    result["status"] = "failed"
+    result["error"] = f"{type(e).__name__}: {e}"
+    result["traceback"] = traceback.format_exc()
+  result["seconds"] = time.perf_counter() - started
+  if instrumentation:
+    result["instrumentation"] = aoytk.instrumentation_summary().to_dict("records")
+  return result
+
+
+def run_jobs(jobs, workers=1, instrumentation=None):
+  """Run jobs in a pool of worker processes.
+
+    A job starts once all of the jobs in its "after" list have succeeded, it is skipped if
+    one of them fails.
+
+    Args:
+      jobs (list of dict): the jobs of a job spec, see load_job_spec().
+      workers (int): the number of jobs to run at the same time.
+      instrumentation (str): an optional aoytk instrumentation mode, see run_job().
+
+    Returns:
+      a list of the results of each job, in the order of the jobs.
+  """
+  results = {}
+  pending = list(jobs)
+  running = {}
+  with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+    while pending or running:
+      for job in list(pending):
+        after = [results.get(name, {}).get("status") for name in job["after"]]
+        if any(status in ("failed", "skipped") for status in after):
+          results[job["name"]] = {"name": job["name"], "type": job["type"], "status": "skipped",
+                                  "error": "a job it runs after did not succeed"}
+          print(f"{job['name']}: skipped")
+          pending.remove(job)
+        elif all(status == "succeeded" for status in after):
+          print(f"{job['name']}: started")
+          running[executor.submit(run_job, job, instrumentation)] = job
+          pending.remove(job)
+      if not running:
+        continue
+      finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+      for future in finished:
+        job = running.pop(future)
+        try:
+          result = future.result()
+        except Exception as e:
+          # the worker process itself died, ex. it ran out of memory
+          result = {"name": job["name"], "type": job["type"], "status": "failed",
+                    "error": f"{type(e).__name__}: {e}"}
+        results[job["name"]] = result
+        print(f"{job['name']}: {result['status']}" +
+              (f" in {result['seconds']:.1f} s" if "seconds" in result else "") +
+              (f" ({result['error']})" if "error" in result else ""))
+  return [results[job["name"]] for job in jobs]
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description="Run AOY-TK derivative and report jobs from a JSON job spec.")
+  parser.add_argument("spec", help="the JSON job spec")
+  parser.add_argument("--workers", type=int, help="number of jobs to run at the same time "
+                      "(default: the job spec's workers, or 1)")
+  parser.add_argument("--only", nargs="+", metavar="JOB", help="only run these jobs")
+  parser.add_argument("--results", help="file to save the results of the jobs to, as JSON")
+  parser.add_argument("--instrumentation", choices=["timing", "profile"], help="time the stages of each job")
+  args = parser.parse_args(argv)
+
+  try:
+    spec = load_job_spec(args.spec)
+    jobs = spec["jobs"]
+    if args.only:
+      unknown = [name for name in args.only if name not in {job["name"] for job in jobs}]
+      if unknown:
+        raise JobSpecError(f"There are no jobs named {unknown}.")
+      jobs = [dict(job, after=[name for name in job["after"] if name in args.only])
+              for job in jobs if job["name"] in args.only]
+    workers = args.workers or spec.get("workers", 1)
+    if not isinstance(workers, int) or workers < 1:
+      raise JobSpecError(f"workers should be a positive number, not {workers!r}.")
+  except JobSpecError as e:
+    print(e, file=sys.stderr)
+    return EXIT_INVALID_SPEC
+
+  started = time.strftime("%Y-%m-%dT%H:%M:%S")
+  results = run_jobs(jobs, workers, args.instrumentation)
+  for result in results:
+    if result["status"] == "failed" and "traceback" in result:
+      print(f"\n{result['name']} failed:\n{result['traceback']}", file=sys.stderr)
+  if args.results:
+    with open(args.results, "w") as f:
+      json.dump({"spec": os.path.abspath(args.spec), "started": started, "workers": workers,
+                 "results": results}, f, indent=2)
+    print(f"Results saved to: {args.results}")
+  failed = [r["name"] for r in results if r["status"] != "succeeded"]
+  print(f"{len(results) - len(failed)} of {len(results)} jobs succeeded.")
+  return EXIT_FAILED if failed else EXIT_SUCCESS
+
+
+if __name__ == "__main__":
+  sys.exit(main())
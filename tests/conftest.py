@@ -0,0 +1,25 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+
+def write_warc(path, pages, date="2021-03-01T12:34:56Z"):
+  """Write a small WARC file of HTML pages, given as (url, html) pairs."""
+  from warcio.statusandheaders import StatusAndHeaders
+  from warcio.warcwriter import WARCWriter
+  with open(path, "wb") as f:
+    writer = WARCWriter(f, gzip=True)
+    for url, html in pages:
+      headers = StatusAndHeaders("200 OK", [("Content-Type", "text/html; charset=utf-8")], protocol="HTTP/1.1")
+      writer.write_record(writer.create_warc_record(url, "response", payload=io.BytesIO(html.encode()),
+                                                    http_headers=headers, warc_headers_dict={"WARC-Date": date}))
+
+
+@pytest.fixture
+def warc_writer():
+  return write_warc
@@ -0,0 +1,38 @@
+import os
+
+import aoytk
+
+
+def test_cache_key_changes_when_sampled_digest_misses_an_edit(tmp_path):
+  datafile = str(tmp_path / "derivative.csv")
+  # large enough that the digest's sampled blocks leave most of the file out
+  size = aoytk.DIGEST_SAMPLES * aoytk.DIGEST_BLOCK_SIZE * 4
+  with open(datafile, "wb") as f:
+    f.write(b"a" * size)
+  cache = aoytk.ResourceCache(project_folder=str(tmp_path / "project"))
+  assert cache.get("collection", "value", lambda: 1, source=datafile) == 1
+
+  digest = aoytk.source_digest(datafile)
+  stats = os.stat(datafile)
+  # change bytes between the sampled blocks, keeping the size
+  with open(datafile, "r+b") as f:
+    f.seek(aoytk.DIGEST_BLOCK_SIZE + 10)
+    f.write(b"b")
+  os.utime(datafile, ns=(stats.st_atime_ns, stats.st_mtime_ns + 1))
+  assert aoytk.source_digest(datafile) == digest
+  assert cache.get("collection", "value", lambda: 2, source=datafile) == 2
+
+
+def test_cache_defaults_to_the_working_directory_without_google_drive(tmp_path, monkeypatch):
+  monkeypatch.setattr(aoytk, "DRIVE_FOLDER", str(tmp_path / "drive" / "MyDrive" / "AOY") + "/")
+  monkeypatch.setattr(aoytk, "path", aoytk.DRIVE_FOLDER)
+  monkeypatch.chdir(tmp_path)
+  cache = aoytk.ResourceCache()
+  assert cache.get("collection", "value", lambda: 1) == 1
+  assert os.listdir(tmp_path / "collection")
+  assert not os.path.exists(tmp_path / "drive")
+
+  # once Drive is mounted, the default folder is used
+  os.makedirs(tmp_path / "drive" / "MyDrive")
+  assert cache.get("collection", "other", lambda: 2) == 2
+  assert os.listdir(tmp_path / "drive" / "MyDrive" / "AOY" / "collection")
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+
+import aoytk
+
+
+@pytest.mark.skipif(not hasattr(os, "copy_file_range"), reason="copy_file_range isn't available")
+def test_appending_csv_parts_uses_the_zero_copy_path(tmp_path, monkeypatch):
+  copied = []
+  copy_file_range = os.copy_file_range
+  def counting_copy(*args):
+    n = copy_file_range(*args)
+    copied.append(n)
+    return n
+  monkeypatch.setattr(os, "copy_file_range", counting_copy)
+
+  output = str(tmp_path / "merged.csv")
+  with open(output, "wb") as f:
+    f.write(b"a,b\n1,2\n")
+  part = str(tmp_path / "part-00000.csv")
+  with open(part, "wb") as f:
+    f.write(b"a,b\n3,4\n5,6\n")
+
+  aoytk.merge_csv_parts([part], output, append=True)
+  with open(output, "rb") as f:
+    assert f.read() == b"a,b\n1,2\n3,4\n5,6\n"
+  # every row was copied by copy_file_range, none by the buffered fallback
+  assert sum(copied) == len(b"3,4\n5,6\n")
@@ -0,0 +1,24 @@
+import os
+
+import pandas as pd
+
+import aoytk
+
+
+def test_incremental_run_retries_failed_sources(tmp_path, warc_writer):
+  good, bad = str(tmp_path / "a.warc.gz"), str(tmp_path / "b.warc.gz")
+  warc_writer(good, [("http://a.org/1", "<p>first page</p>")])
+  # a W/ARC path which can't be read
+  os.mkdir(bad)
+  output = str(tmp_path / "derivative")
+  generator = aoytk.DerivativeGenerator(backend="python", workers=1)
+
+  assert not generator.generate_derivative([good, bad], output, "csv", 1, incremental=True)
+  # nothing from the failed run is kept, or recorded as processed
+  assert pd.read_csv(os.path.join(output, "derivative.csv")).empty
+
+  os.rmdir(bad)
+  warc_writer(bad, [("http://b.org/1", "<p>second page</p>")])
+  assert generator.generate_derivative([good, bad], output, "csv", 1, incremental=True)
+  data = pd.read_csv(os.path.join(output, "derivative.csv"))
+  assert sorted(data["url"]) == ["http://a.org/1", "http://b.org/1"]
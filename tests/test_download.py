@@ -0,0 +1,120 @@
+import json
+import os
+
+import aoytk
+
+
+class FakeResponse:
+  def __init__(self, data, status_code=200, headers=None):
+    self.data, self.status_code, self.headers = data, status_code, headers or {}
+    self.ok = True
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    return False
+
+  def raise_for_status(self):
+    pass
+
+  def iter_content(self, chunk_size):
+    for i in range(0, len(self.data), chunk_size):
+      yield self.data[i:i + chunk_size]
+
+
+class FakeSession:
+  """Serves one file, with byte range and If-Range support."""
+  def __init__(self, data, etag=None):
+    self.data, self.etag = data, etag
+    self.requests = []
+
+  def head(self, url, **kwargs):
+    headers = {"Content-Length": str(len(self.data)), "Accept-Ranges": "bytes"}
+    if self.etag is not None:
+      headers["ETag"] = self.etag
+    return FakeResponse(b"", headers=headers)
+
+  def get(self, url, stream=True, headers=None, **kwargs):
+    headers = headers or {}
+    self.requests.append(headers)
+    if "Range" in headers and headers.get("If-Range", self.etag) == self.etag:
+      start, end = headers["Range"][len("bytes="):].split("-")
+      if int(start) >= len(self.data):
+        return FakeResponse(b"", 416)
+      return FakeResponse(self.data[int(start):int(end) + 1 if end else None], 206)
+    return FakeResponse(self.data)
+
+
+def interrupted_download(folder, data, etag):
+  """Leave the partial file of a single stream download of data, stopped half way."""
+  partial = folder + "file.bin.part"
+  with open(partial, "wb") as f:
+    f.write(data[:len(data) // 2])
+  with open(partial + ".json", "w") as f:
+    json.dump({"size": len(data), "validator": etag, "bounds": None}, f)
+
+
+def test_single_stream_resume_after_segmented_attempt(tmp_path):
+  data = os.urandom(1000)
+  destination = str(tmp_path) + "/"
+  partial = destination + "file.bin.part"
+  # an interrupted segmented download: the partial file is pre-allocated, and half of one segment is written
+  with open(partial, "wb") as f:
+    f.write(data[:250] + bytes(750))
+  with open(partial + ".json", "w") as f:
+    json.dump({"size": 1000, "bounds": [[0, 499], [500, 999]], "done": [250, 0]}, f)
+
+  path = aoytk.download_file("http://example.org/file.bin", destination, loud=False, segments=1,
+                             session=FakeSession(data))
+  with open(path, "rb") as f:
+    assert f.read() == data
+  assert not os.path.exists(partial + ".json")
+
+
+def test_resume_continues_an_unchanged_file(tmp_path):
+  data = os.urandom(1000)
+  destination = str(tmp_path) + "/"
+  interrupted_download(destination, data, '"v1"')
+  session = FakeSession(data, '"v1"')
+  path = aoytk.download_file("http://example.org/file.bin", destination, loud=False, segments=1, session=session)
+  with open(path, "rb") as f:
+    assert f.read() == data
+  assert session.requests == [{"Range": "bytes=500-", "If-Range": '"v1"'}]
+
+
+def test_resume_restarts_when_the_file_changed(tmp_path):
+  old, new = os.urandom(1000), os.urandom(1000)
+  destination = str(tmp_path) + "/"
+  interrupted_download(destination, old, '"v1"')
+  path = aoytk.download_file("http://example.org/file.bin", destination, loud=False, segments=1,
+                             session=FakeSession(new, '"v2"'))
+  with open(path, "rb") as f:
+    assert f.read() == new
+
+
+def test_resume_restarts_when_the_file_changed_after_the_head_request(tmp_path):
+  old, new = os.urandom(1000), os.urandom(1000)
+  destination = str(tmp_path) + "/"
+  interrupted_download(destination, old, '"v1"')
+  session = FakeSession(new, '"v1"')
+  # the HEAD request sees the old version, the If-Range check on the GET sees the new one
+  session.get = lambda url, get=session.get, **kwargs: (setattr(session, "etag", '"v2"'), get(url, **kwargs))[1]
+  path = aoytk.download_file("http://example.org/file.bin", destination, loud=False, segments=1, session=session)
+  with open(path, "rb") as f:
+    assert f.read() == new
+
+
+def test_resume_restarts_when_the_partial_file_is_longer_than_the_file(tmp_path):
+  old, new = os.urandom(1000), os.urandom(300)
+  destination = str(tmp_path) + "/"
+  interrupted_download(destination, old, None)
+  with open(destination + "file.bin.part.json", "w") as f:
+    json.dump({"size": None, "validator": None, "bounds": None}, f)
+  session = FakeSession(new)
+  # a server which reports neither the size nor a validator, so the range is past the end of the file
+  session.head = lambda url, **kwargs: FakeResponse(b"", headers={"Accept-Ranges": "bytes"})
+  path = aoytk.download_file("http://example.org/file.bin", destination, loud=False, segments=1, session=session)
+  with open(path, "rb") as f:
+    assert f.read() == new
+  assert session.requests == [{"Range": "bytes=500-"}, {}]
@@ -0,0 +1,34 @@
+import numpy as np
+
+import aoytk
+
+
+def pairs(first, second):
+  return sorted(zip(first.tolist(), second.tolist()))
+
+
+def test_bucket_pairs_compares_every_document_of_a_bucket():
+  # documents 2 and 3 are paired even though document 0 comes first in their bucket
+  keys = np.array([7, 3, 7, 7], dtype=np.uint64)
+  assert pairs(*aoytk.bucket_pairs(keys)) == [(0, 2), (0, 3), (2, 3)]
+
+
+def test_bucket_pairs_caps_large_buckets():
+  keys = np.zeros(5, dtype=np.uint64)
+  assert pairs(*aoytk.bucket_pairs(keys, max_bucket=2)) == [(0, 1), (1, 2), (2, 3), (3, 4)]
+  assert pairs(*aoytk.bucket_pairs(keys, max_bucket=3)) == [(0, 1), (0, 2), (1, 2), (1, 3), (2, 3), (2, 4), (3, 4)]
+  assert len(aoytk.bucket_pairs(np.arange(4, dtype=np.uint64))[0]) == 0
+
+
+def test_candidate_pairs_are_bounded_when_pages_repeat():
+  # 20 pages, each recaptured 100 times
+  texts = [f"page {p} " + " ".join(f"word{p}x{w}" for w in range(40)) for p in range(20)] * 100
+  exact, signatures = aoytk.fingerprint_documents(texts)
+  keys = aoytk.band_keys(signatures, aoytk.MINHASH_BANDS)
+
+  (exact_first, exact_second), (first, second) = aoytk.candidate_pairs(exact, keys)
+  assert len(exact_first) == len(texts) - 20
+  assert (exact[exact_first] == exact[exact_second]).all()
+  # only the 20 distinct pages are compared, at most once per pair
+  assert len(first) <= 20 * 19 // 2
+  assert len(set(zip(first.tolist(), second.tolist()))) == len(first)
@@ -0,0 +1,55 @@
+import pandas as pd
+
+import aoytk
+
+
+def test_crawl_counts_match_the_filtered_rows(tmp_path):
+  datafile = str(tmp_path / "webpages.csv")
+  pd.DataFrame({
+    "crawl_date": ["20200101093000", "20200115120000", "20200131235900", "20200201000000", "20200131000000"],
+    "domain": ["a.ca", "a.ca", "a.ca", "a.ca", "b.ca"],
+    "url": ["http://a.ca/1", "http://a.ca/2", "http://a.ca/3", "http://a.ca/4", "http://b.ca/1"],
+  }).to_csv(datafile, index=False)
+
+  analyzer = aoytk.Analyzer()
+  analyzer.cache = aoytk.ResourceCache(project_folder=str(tmp_path / "project"))
+  analyzer.set_data(datafile, columns=aoytk.COLLECTION_COLUMNS, start_date="2020-01-01 12:00", end_date="2020-01-31")
+
+  # whole days are kept, at both ends of the range
+  assert sorted(analyzer.data["url"]) == ["http://a.ca/1", "http://a.ca/2", "http://a.ca/3", "http://b.ca/1"]
+  counts = analyzer.crawl_counts(10, freq="1D").sum(axis=1)
+  assert counts.to_dict() == analyzer.data["domain"].astype(str).value_counts().to_dict()
+
+
+def test_parquet_rows_filtered_after_parsing_leave_no_unused_domains(tmp_path):
+  datafile = str(tmp_path / "webpages.parquet")
+  # slash-separated dates can't be filtered by the Parquet reader, only after parsing
+  pd.DataFrame({
+    "crawl_date": ["2020/01/05 10:00:00 +0000", "2020/01/06 10:00:00 +0000",
+                   "2020/03/01 10:00:00 +0000", "2020/04/01 10:00:00 +0000"],
+    "domain": ["a.ca", "b.ca", "c.ca", "d.ca"],
+    "url": ["http://a.ca/", "http://b.ca/", "http://c.ca/", "http://d.ca/"],
+  }).to_parquet(datafile)
+
+  analyzer = aoytk.Analyzer()
+  analyzer.set_data(datafile, columns=aoytk.COLLECTION_COLUMNS, end_date="2020-01-31")
+  assert list(analyzer.data["domain"].cat.categories) == ["a.ca", "b.ca"]
+  assert analyzer.data["domain"].value_counts().to_dict() == {"a.ca": 1, "b.ca": 1}
+
+
+def test_monthly_crawl_counts(tmp_path):
+  datafile = str(tmp_path / "webpages.csv")
+  pd.DataFrame({
+    "crawl_date": ["20200105", "20200120", "20200301"],
+    "domain": ["a.ca", "a.ca", "b.ca"],
+    "url": ["http://a.ca/1", "http://a.ca/2", "http://b.ca/1"],
+  }).to_csv(datafile, index=False)
+  analyzer = aoytk.Analyzer()
+  analyzer.cache = aoytk.ResourceCache(project_folder=str(tmp_path / "project"))
+  analyzer.set_data(datafile, columns=aoytk.COLLECTION_COLUMNS)
+
+  counts = analyzer.crawl_counts(5)
+  assert counts.loc["a.ca"].tolist() == [2, 0, 0]
+  assert counts.loc["b.ca"].tolist() == [0, 0, 1]
+  # the old month alias still works
+  pd.testing.assert_frame_equal(analyzer.crawl_counts(5, "1M"), counts)
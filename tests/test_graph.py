@@ -0,0 +1,19 @@
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+import aoytk
+
+
+def test_merge_domain_graph_adds_up_the_counts_of_the_same_edges(tmp_path):
+  folder = tmp_path / "parts"
+  folder.mkdir()
+  for n, rows in enumerate([[("20200101", "a.ca", "b.ca", 2), ("20200101", "b.ca", "a.ca", 1)],
+                            [("20200101", "a.ca", "b.ca", 3)]]):
+    pq.write_table(pa.table(dict(zip(aoytk.GRAPH_COLUMNS, map(list, zip(*rows))))), folder / f"part-{n}.parquet")
+
+  output = str(tmp_path / "graph.parquet")
+  assert aoytk.merge_domain_graph(str(folder), output) == 2
+  table = pq.read_table(output)
+  assert table.column_names == aoytk.GRAPH_COLUMNS
+  assert table.to_pylist() == [{"crawl_date": "20200101", "src_domain": "a.ca", "dest_domain": "b.ca", "count": 5},
+                               {"crawl_date": "20200101", "src_domain": "b.ca", "dest_domain": "a.ca", "count": 1}]
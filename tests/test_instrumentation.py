@@ -0,0 +1,26 @@
+import aoytk
+
+
+def test_nested_stages_keep_the_peaks_reached_before_them(monkeypatch):
+  # a fake process: the high water mark can only be reset to the current memory use
+  memory = {"current": 10.0, "peak": 10.0}
+  def use(mb):
+    memory["current"] = mb
+    memory["peak"] = max(memory["peak"], mb)
+  monkeypatch.setattr(aoytk, "reset_peak_memory", lambda: memory.update(peak=memory["current"]))
+  monkeypatch.setattr(aoytk, "peak_memory_mb", lambda: memory["peak"])
+  monkeypatch.setattr(aoytk, "INSTRUMENTATION", "timing")
+  monkeypatch.setattr(aoytk, "instrumentation_log", [])
+
+  with aoytk.stage("operation"):
+    with aoytk.stage("outer"):
+      use(100.0)
+      use(10.0)
+      with aoytk.stage("inner"):
+        use(20.0)
+      use(10.0)
+
+  operation = aoytk.instrumentation_log[-1]
+  assert operation["peak_mb"] == 100.0
+  assert operation["stages"]["outer"]["peak_mb"] == 100.0
+  assert operation["stages"]["inner"]["peak_mb"] == 100.0
@@ -0,0 +1,23 @@
+import os
+
+import pandas as pd
+
+import jobs
+
+
+def test_report_job_on_a_csv_derivative_folder(tmp_path, warc_writer):
+  for name, domain in [("a", "a.org"), ("b", "b.org")]:
+    warc_writer(str(tmp_path / f"{name}.warc.gz"),
+                [(f"http://{domain}/{n}", f"<p>page {n}</p>") for n in range(3 if name == "a" else 1)])
+  derivative = {"name": "derivative", "type": "derivative", "inputs": [str(tmp_path / "*.warc.gz")],
+                "output": str(tmp_path / "derivative"), "file_type": "csv", "text_filters": 1,
+                "backend": "python", "backend_workers": 1, "incremental": True}
+  report = {"name": "report", "type": "report", "input": str(tmp_path / "derivative"),
+            "output": str(tmp_path / "report"), "freq": "1D", "graphs": ["2D"]}
+
+  assert jobs.run_job(derivative)["status"] == "succeeded"
+  result = jobs.run_job(report)
+  assert result["status"] == "succeeded", result.get("error")
+  counts = pd.read_csv(os.path.join(tmp_path, "report", "domain_counts.csv"), index_col="domain")["crawls"]
+  assert counts.to_dict() == {"a.org": 3, "b.org": 1}
+  assert os.path.exists(os.path.join(tmp_path, "report", "crawl_frequency_2D.png"))
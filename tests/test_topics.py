@@ -0,0 +1,65 @@
+import pytest
+
+import aoytk
+
+pytest.importorskip("gensim")
+
+
+def build_corpus(folder, documents):
+  tokens_file = str(folder / "tokens.txt")
+  with open(tokens_file, "w", encoding="utf-8") as f:
+    f.write("".join(" ".join(words) + "\n" for words in documents))
+  corpus_file = str(folder / "corpus.mm")
+  aoytk.build_bow_corpus(tokens_file, corpus_file)
+  return corpus_file
+
+
+def test_lda_checkpoint_is_discarded_when_the_corpus_is_rebuilt(tmp_path, capsys):
+  model_file = str(tmp_path / "lda.model")
+  corpus_file = build_corpus(tmp_path, [["river", "flood", "rain"], ["vote", "party", "poll"]] * 5)
+  aoytk.train_lda_model(corpus_file, 2, model_file, passes=1, workers=1)
+
+  # same path, different documents and vocabulary
+  corpus_file = build_corpus(tmp_path, [["hockey", "goal", "ice"], ["bread", "flour", "oven"]] * 5)
+  capsys.readouterr()
+  model = aoytk.train_lda_model(corpus_file, 2, model_file, passes=2, workers=1)
+  assert "Resuming" not in capsys.readouterr().out
+  assert set(model.id2word.values()) == {"hockey", "goal", "ice", "bread", "flour", "oven"}
+
+
+
+def test_checkpointed_training_keeps_the_learning_rate_schedule(tmp_path, monkeypatch):
+  from gensim.models import LdaMulticore
+  steps = []
+  do_mstep = LdaMulticore.do_mstep
+  def recording_mstep(self, rho, other, extra_pass=False):
+    steps.append((rho, extra_pass, other.numdocs))
+    return do_mstep(self, rho, other, extra_pass)
+  monkeypatch.setattr(LdaMulticore, "do_mstep", recording_mstep)
+  documents, chunksize = 40, 10
+  corpus_file = build_corpus(tmp_path, [["river", "flood", "rain"], ["vote", "party", "poll"]] * (documents // 2))
+  params = {"chunksize": chunksize, "iterations": 5, "random_state": 0}
+
+  def single_run_schedule(steps, passes):
+    # the learning rate of LdaMulticore(passes=...): (1 + pass + updates / chunksize) ** -0.5, where
+    # the updates are the documents seen during the first pass (the workers can merge several chunks per step)
+    seen = 0
+    for rho, extra_pass, numdocs in steps:
+      n = seen // documents
+      updates = seen if n == 0 else documents
+      assert extra_pass == (n > 0)
+      assert rho == pytest.approx((1 + n + updates / chunksize) ** -0.5)
+      seen += numdocs
+    assert seen == passes * documents
+
+  corpus, dictionary = aoytk.load_bow_corpus(corpus_file)
+  LdaMulticore(corpus, id2word=dictionary, num_topics=2, workers=1, passes=3, **params)
+  single_run_schedule(steps, 3)
+
+  # two passes, then resumed from the checkpoint for the third
+  steps[:] = []
+  model_file = str(tmp_path / "lda.model")
+  aoytk.train_lda_model(corpus_file, 2, model_file, passes=2, workers=1, **params)
+  model = aoytk.train_lda_model(corpus_file, 2, model_file, passes=3, workers=1, **params)
+  single_run_schedule(steps, 3)
+  assert model.offset == 1.0